@@ -0,0 +1,64 @@
+import gzip
+import os
+import time
+
+from .define import SCHEMA_VERSION
+from .lib.MyDict import MyDict
+from .lib.misc import dir_user_cache, write_atomically
+
+
+def default_dirname():
+    '''the store shared by all output directories of the current user'''
+
+    return os.path.join(dir_user_cache(), 'courses')
+
+
+class CourseStore:
+    '''
+    Keeps the crawled courses on disk, keyed by course ID and content
+    version, so that a course shared by several specializations is crawled
+    only once.
+
+    The content version of a course is a digest of its modules, lessons and
+    items, see Crawler. Lectures and supplements carry signed URLs which
+    expire, so a course is kept for @max_age seconds only.
+
+    @dirname: where the courses are kept, one gzipped JSON file per course
+        ID. A file of another SCHEMA_VERSION is ignored
+    '''
+
+    def __init__(self, dirname, *, max_age=6 * 3600):
+        self._dirname = dirname
+        self._max_age = max_age
+
+        os.makedirs(dirname, exist_ok=True)
+
+    def _filename(self, id_):
+        return os.path.join(self._dirname, '%s.json.gz' % id_)
+
+    def load(self, id_, version):
+        '''return the course of @id_ and @version, or None'''
+
+        try:
+            with gzip.open(self._filename(id_), 'rt', encoding='UTF-8') as ifs:
+                entry = MyDict.from_json(ifs.read())
+        except (OSError, EOFError, ValueError):
+            return None
+
+        if entry.get('schema') != SCHEMA_VERSION or entry['version'] != version:
+            return None
+        if time.time() - entry['time'] >= self._max_age:
+            return None
+        return entry['course']
+
+    def save(self, course):
+        entry = MyDict(
+            schema=SCHEMA_VERSION,
+            version=course['version'],
+            time=time.time(),
+            course=course,
+        )
+        write_atomically(
+            self._filename(course['id']),
+            gzip.compress(entry.to_json(indent=None).encode('UTF-8')),
+        )
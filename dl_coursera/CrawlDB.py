@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import zlib
+
+from .define import SCHEMA_VERSION
+from .lib.MyDict import MyDict
+from .lib.misc import atomic_filename
+
+
+def _dumps(node):
+    return zlib.compress(node.to_json(indent=None).encode('UTF-8'))
+
+
+def _loads(data):
+    return MyDict.from_json(zlib.decompress(data).decode('UTF-8'))
+
+
+def _header(node, *keys):
+    '''@node with None in place of @keys, which are kept in other rows'''
+
+    return MyDict({k: None if k in keys else v for k, v in node.items()})
+
+
+class _LazyList:
+    '''a list of @n elements, which are loaded by @load(i) as they are iterated over'''
+
+    def __init__(self, n, load):
+        self._n = n
+        self._load = load
+
+    def __len__(self):
+        return self._n
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self._load(i)
+
+
+class CrawlDB:
+    '''
+    Keeps the result of a crawl, i.e. a Spec or Course tree, in a SQLite
+    database with one row per course, module and reference. So a course can
+    be loaded without loading the others, see load_lazily.
+
+    Rows are compressed JSON. The database is tagged with SCHEMA_VERSION (as
+    its user_version), and one of another version is treated as missing.
+    Nodes are loaded as MyDicts, which are told apart by their 'type'.
+    '''
+
+    def __init__(self, filename):
+        self._filename = filename
+
+    def _connect(self):
+        return sqlite3.connect(self._filename)
+
+    def exists(self):
+        if not os.path.exists(self._filename):
+            return False
+
+        conn = self._connect()
+        try:
+            (version,) = conn.execute('PRAGMA user_version').fetchone()
+        except sqlite3.DatabaseError:
+            return False
+        finally:
+            conn.close()
+        return version == SCHEMA_VERSION
+
+    def save(self, soc):
+        '''replace what is kept with @soc, a Spec or Course'''
+
+        courses = soc['courses'] if soc['type'] == 'Spec' else [soc]
+
+        with atomic_filename(self._filename) as tmp:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+            conn = sqlite3.connect(tmp)
+            try:
+                with conn:
+                    conn.execute('CREATE TABLE root (data BLOB NOT NULL)')
+                    conn.execute(
+                        'CREATE TABLE courses (i INTEGER PRIMARY KEY, data BLOB NOT NULL)'
+                    )
+                    for table in ['modules', 'refs']:
+                        conn.execute(
+                            'CREATE TABLE %s (course INTEGER NOT NULL, i INTEGER NOT NULL, '
+                            'data BLOB NOT NULL, PRIMARY KEY (course, i))' % table
+                        )
+
+                    # a Course is kept in courses too, so its root row is the header
+                    conn.execute(
+                        'INSERT INTO root VALUES (?)',
+                        (_dumps(_header(soc, 'courses', 'modules', 'references')),),
+                    )
+                    for i, course in enumerate(courses):
+                        conn.execute(
+                            'INSERT INTO courses VALUES (?, ?)',
+                            (i, _dumps(_header(course, 'modules', 'references'))),
+                        )
+                        conn.executemany(
+                            'INSERT INTO modules VALUES (?, ?, ?)',
+                            [
+                                (i, j, _dumps(_))
+                                for j, _ in enumerate(course['modules'])
+                            ],
+                        )
+                        conn.executemany(
+                            'INSERT INTO refs VALUES (?, ?, ?)',
+                            [
+                                (i, j, _dumps(_))
+                                for j, _ in enumerate(course['references'])
+                            ],
+                        )
+                    conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+            finally:
+                conn.close()
+
+    def load(self):
+        '''the whole Spec or Course, or None if it is not kept'''
+
+        if not self.exists():
+            return None
+
+        conn = self._connect()
+        try:
+            soc = self._root(conn)
+            courses = [
+                self._course(conn, i, header)
+                for i, header in self._course_headers(conn)
+            ]
+        finally:
+            conn.close()
+
+        if soc['type'] != 'Spec':
+            return courses[0]
+
+        soc['courses'] = courses
+        return soc
+
+    def load_lazily(self):
+        '''
+        Like load(), but the courses are loaded one at a time as they are
+        iterated over, e.g. by DLTaskGatherer, so that a specialization is
+        not held in memory as a whole. Nothing may be written to it
+        '''
+
+        if not self.exists():
+            return None
+
+        conn = self._connect()
+        try:
+            soc = self._root(conn)
+            (n_courses,) = conn.execute('SELECT COUNT(*) FROM courses').fetchone()
+        finally:
+            conn.close()
+
+        if soc['type'] != 'Spec':
+            return self.course(0)
+
+        soc['courses'] = _LazyList(n_courses, self.course)
+        return soc
+
+    def course(self, i):
+        '''the @i-th course, with its modules and references'''
+
+        conn = self._connect()
+        try:
+            (data,) = conn.execute(
+                'SELECT data FROM courses WHERE i = ?', (i,)
+            ).fetchone()
+            return self._course(conn, i, _loads(data))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _root(conn):
+        (data,) = conn.execute('SELECT data FROM root').fetchone()
+        return _loads(data)
+
+    @staticmethod
+    def _course_headers(conn):
+        return [
+            (i, _loads(data))
+            for i, data in conn.execute('SELECT i, data FROM courses ORDER BY i')
+        ]
+
+    @staticmethod
+    def _rows(conn, table, i_course):
+        return [
+            _loads(data)
+            for (data,) in conn.execute(
+                'SELECT data FROM %s WHERE course = ? ORDER BY i' % table, (i_course,)
+            )
+        ]
+
+    @staticmethod
+    def _course(conn, i, header):
+        header['modules'] = CrawlDB._rows(conn, 'modules', i)
+        header['references'] = CrawlDB._rows(conn, 'refs', i)
+        return header
@@ -1,6 +1,13 @@
 import os
 import logging
 import base64
+import concurrent.futures
+import functools
+import hashlib
+import json
+import threading
+
+from urllib.parse import urlparse
 
 from http.cookiejar import MozillaCookieJar
 
@@ -9,14 +16,63 @@ import requests
 from .define import *
 
 from .lib.misc import format_dict, TmpFile
+from .lib.AccountPool import AccountPool
+from .lib.RetryPolicy import RetryPolicy
 from .markup import CML
 
 PRIO_SPEC = 'A'
 PRIO_COURSE = 'B'
 PRIO_COURSE_MATERIAL = 'C'
+# lower than all but PRIO_SPEC, so that asset IDs are collected from as many
+# lectures and supplements as possible before they are looked up
+PRIO_ASSETS = 'AA'
+
+# limits of a batched assets.v1 request
+MAX_ASSET_IDS = 50
+MAX_URL_LENGTH = 2000
+
+# key of tasks which call the Coursera API. See TaskScheduler.set_limit
+KEY_API = urlparse(URL_ROOT).netloc
+
+# errors of the Coursera API which do not go away by trying again. Not
+# Authorized is one of them, as it may mean that the account is not enrolled
+# in the course, which fails that course only. Expired cookies are told by
+# preflight, before the crawling starts
+RETRY_POLICY_API = RetryPolicy(
+    fail_on=(
+        SpecNotExistExcepton,
+        CourseNotExistExcepton,
+        BadResponseException,
+        KeyError,
+    ),
+)
+
+# how long (in seconds) responses of the Coursera API are used without being
+# revalidated. See HTTPCache. Video and asset URLs are signed and expire, so
+# responses which carry them are kept for a short time only
+CACHE_TTLS = [
+    (r'/api/onDemandSpecializations\.v1', 24 * 3600),
+    (r'/api/onDemandCourses\.v1', 24 * 3600),
+    (r'/api/onDemandCourseMaterials\.v2', 3600),
+    (r'/api/onDemandReferences\.v1', 3600),
+    (r'/api/onDemandSupplements\.v1', 3600),
+    (r'/api/onDemandLectureVideos\.v1', 600),
+    (r'/api/onDemandLectureAssets\.v1', 600),
+    (r'/api/assets\.v1', 600),
+]
 
 
 def login(sess, cookies_file=None):
+    '''
+    @sess: a requests.Session or SessionPool, or an AccountPool whose i-th
+        account is logged in with the i-th of @cookies_file, a list then
+    '''
+
+    if isinstance(sess, AccountPool):
+        for account, _ in zip(sess.accounts, cookies_file or [None]):
+            login(account, _)
+        return
+
     if cookies_file is None:
         # the env should contain $(base64 -w 0 cookies.txt)
         cookies_base64 = os.environ.get('DL_COURSERA_COOKIES_BASE64')
@@ -37,43 +93,213 @@ def login(sess, cookies_file=None):
     sess.cookies.update(cj)
 
 
+def get_uid(cookies):
+    '''the user ID in @cookies, or None'''
+
+    from urllib.parse import unquote
+
+    for x in cookies:
+        if 'userId' in x.name:
+            # g:20580072|e:undefined|c:1754026047404|l:1754059501489
+            for _1 in unquote(x.value).split('|'):
+                _2 = _1.split(':')
+                if len(_2) != 2:
+                    return None
+                k, v = _2
+                if k == 'g':
+                    return v
+            return None
+    return None
+
+
+def is_not_authorized(resp):
+    '''whether @resp tells that the account may not access what was requested'''
+
+    if resp.status_code < 400:
+        return False
+    try:
+        return resp.json().get('errorCode') == 'Not Authorized'
+    except ValueError:
+        return False
+
+
+def _batch_asset_ids(ids):
+    '''split @ids into lists which fit in one assets.v1 request'''
+
+    batch = []
+    for id_ in ids:
+        if len(batch) > 0 and (
+            len(batch) >= MAX_ASSET_IDS
+            or len(URL_ASSET(batch + [id_])) > MAX_URL_LENGTH
+        ):
+            yield batch
+            batch = []
+        batch.append(id_)
+
+    if len(batch) > 0:
+        yield batch
+
+
+def _digest(*values):
+    '''a digest of the JSON-serializable @values, to tell whether they changed'''
+
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode('UTF-8')).hexdigest()
+
+
+def _course_items(course):
+    for module in course['modules']:
+        for lesson in module['lessons']:
+            for item in lesson['items']:
+                yield item
+
+
+def _is_reusable(item):
+    '''whether @item of a previous crawl has content, i.e. was crawled'''
+
+    if item['type'] == 'Lecture':
+        return len(item['videos']) > 0 or len(item['assets']) > 0
+    return len(item['items']) > 0
+
+
+def _is_complete(course):
+    '''whether all the lectures, supplements and references of @course were crawled'''
+
+    return all(_is_reusable(_) for _ in _course_items(course)) and all(
+        _['item'] is not None for _ in course['references']
+    )
+
+
+def _course_version(course):
+    '''a digest of the modules, lessons and items of @course'''
+
+    return _digest(
+        [
+            [
+                module['id'],
+                module['name'],
+                module['slug'],
+                [
+                    [
+                        lesson['id'],
+                        lesson['name'],
+                        lesson['slug'],
+                        [[_['id'], _['digest']] for _ in lesson['items']],
+                    ]
+                    for lesson in module['lessons']
+                ],
+            ]
+            for module in course['modules']
+        ]
+    )
+
+
 class Crawler:
     @staticmethod
-    def _get(sess, url):
-        resp = sess.get(url)
-        d = resp.json()
+    def _check_throttled(resp):
+        # other errors come with a JSON body, see BadResponseException
+        if resp.status_code == 429 or resp.status_code >= 500:
+            resp.raise_for_status()
+
+    @staticmethod
+    def _check_error(d):
         if 'errorCode' in d:
             raise BadResponseException(d)
+
+    @staticmethod
+    def _get(sess, url, cache=None):
+        if cache is not None:
+            d = cache.get_json(sess, url, check=Crawler._check_throttled)
+        else:
+            resp = sess.get(url)
+            Crawler._check_throttled(resp)
+            d = resp.json()
+        Crawler._check_error(d)
         return d
 
     @staticmethod
     def _post(sess: requests.Session, url, json: dict = {}):
         resp = sess.post(url, json=json)
+        Crawler._check_throttled(resp)
         d = resp.json()
-        if 'errorCode' in d:
-            raise BadResponseException(d)
+        Crawler._check_error(d)
         return d
 
-    def __init__(self, *, ts, sess: requests.Session, cookies_file=None):
+    def __init__(
+        self,
+        *,
+        ts,
+        sess: requests.Session,
+        cookies_file=None,
+        cache=None,
+        store=None,
+        courses=None,
+    ):
+        '''
+        @sess: a requests.Session, SessionPool or AccountPool. With an
+            AccountPool, requests about a course go only to the accounts
+            enrolled in it, see is_not_authorized
+        @cookies_file: with an AccountPool, a list of the cookies files of
+            its accounts
+        @cache: an HTTPCache for the responses of the Coursera API
+        @store: a CourseStore. A course whose content version is in it is
+            taken from it instead of being crawled, and a course which is
+            crawled completely is put into it
+        @courses: a dict shared by the crawlers on one scheduler, from IDs to
+            the courses being crawled, so that a course in many
+            specializations, or also crawled on its own, is crawled once
+        '''
+
         self._ts = ts
         self._sess = sess
         self._cookies_file = cookies_file
+        self._cache = cache
+        self._store = store
+        if courses is None:
+            courses = {}
+        self._courses = courses
+
+        # IDs of the courses taken from the store
+        self._from_store = set()
 
         self._loggedin = False
         self._uid: str = None
 
+        # what changed since the previous crawl, see crawl()
+        self.delta = CrawlDelta()
+        delta_lock = threading.Lock()
+
+        def _record(kind, course, node):
+            with delta_lock:
+                self.delta[kind].append(
+                    {
+                        'course': course['slug'],
+                        'type': node['type'],
+                        'id': node['id'],
+                        'name': node['name'],
+                    }
+                )
+
         def attach(func):
             setattr(self, func.__name__, func)
             return func
 
+        def _sess_of(course):
+            '''requests about @course go to the accounts which may access it'''
+
+            if isinstance(sess, AccountPool):
+                return sess.scoped(course['id'])
+            return sess
+
         @attach
         @ts.register_task(
             priority=PRIO_SPEC,
             ttl=3,
+            key=KEY_API,
+            retry_policy=RETRY_POLICY_API,
             format_kwargs=lambda _: format_dict({'spec': _['spec']['slug']}),
         )
-        def crawl_spec(*, spec):
-            d = Crawler._get(sess, URL_SPEC(spec['slug']))
+        def crawl_spec(*, spec, prev=None):
+            d = Crawler._get(sess, URL_SPEC(spec['slug']), cache)
             if 'elements' not in d:
                 raise SpecNotExistExcepton(spec['slug'])
 
@@ -98,29 +324,68 @@ class Crawler:
                 % (spec['slug'], ', '.join([_['slug'] for _ in spec['courses']]))
             )
 
-            for _ in spec['courses']:
-                crawl_course(course=_)
+            id2prev = {}
+            if prev is not None:
+                id2prev = {_['id']: _ for _ in prev['courses']}
+
+                ids = set(_['id'] for _ in spec['courses'])
+                for _ in prev['courses']:
+                    if _['id'] not in ids:
+                        _record('removed', _, _)
+
+            for i, _ in enumerate(spec['courses']):
+                # dict.setdefault is atomic
+                course = courses.setdefault(_['id'], _)
+                if course is not _:
+                    spec['courses'][i] = course
+                    continue
+                crawl_course(course=_, prev=id2prev.get(_['id']))
 
         @attach
         @ts.register_task(
             priority=PRIO_COURSE,
             ttl=3,
+            key=KEY_API,
+            retry_policy=RETRY_POLICY_API,
             format_kwargs=lambda _: format_dict({'cource': _['course']['slug']}),
         )
-        def crawl_course(*, course):
-            d = Crawler._get(sess, URL_COURSE_1(course['slug']))
-            if 'elements' not in d:
-                raise CourseNotExistExcepton(course['slug'])
+        def crawl_course(*, course, prev=None):
+            '''
+            @prev: the course in a previous crawl. Only its lectures and
+                supplements which are new or changed are crawled again
+            '''
+
+            if prev is not None and prev['id'] is not None:
+                course['name'] = prev['name']
+                course['id'] = prev['id']
+            else:
+                d = Crawler._get(sess, URL_COURSE_1(course['slug']), cache)
+                if 'elements' not in d:
+                    raise CourseNotExistExcepton(course['slug'])
 
-            _ = d['elements'][0]
-            course['name'] = _['name']
-            course['id'] = _['id']
+                _ = d['elements'][0]
+                course['name'] = _['name']
+                course['id'] = _['id']
 
-            assert course['slug'] == _['slug']
+                assert course['slug'] == _['slug']
+
+            # a course crawled on its own is known by its slug only until now.
+            # dict.setdefault is atomic
+            if courses.setdefault(course['id'], course) is not course:
+                logging.info(
+                    '[crawl_course] %s is crawled already in this run' % course['slug']
+                )
+                return
+
+            id2prev = {}
+            if prev is not None:
+                id2prev = {_['id']: _ for _ in _course_items(prev)}
+            reused = set()
 
             # ------
 
-            d = Crawler._get(sess, URL_COURSE_2(course['slug']))['linked']
+            d = Crawler._get(_sess_of(course), URL_COURSE_2(course['slug']), cache)
+            d = d['linked']
 
             id2item = {}
             for _ in d['onDemandCourseMaterialItems.v2']:
@@ -149,14 +414,34 @@ class Crawler:
                     logging.info('[crawl_course] locked item: %s' % _)
                     continue
 
+                digest = _digest(
+                    _['name'], _['slug'], _['contentSummary'], _.get('timeCommitment')
+                )
+
+                item = id2prev.get(_['id'])
+                if (
+                    item is not None
+                    and item.get('digest') == digest
+                    and _is_reusable(item)
+                ):
+                    id2item[_['id']] = item
+                    reused.add(_['id'])
+                    continue
+
                 if typeName == 'lecture':
-                    id2item[_['id']] = CourseMaterialLecture(
-                        id_=_['id'], name=_['name'], slug=_['slug']
+                    item = CourseMaterialLecture(
+                        id_=_['id'], name=_['name'], slug=_['slug'], digest=digest
                     )
                 elif typeName == 'supplement':
-                    id2item[_['id']] = CourseMaterialSupplement(
-                        id_=_['id'], name=_['name'], slug=_['slug']
+                    item = CourseMaterialSupplement(
+                        id_=_['id'], name=_['name'], slug=_['slug'], digest=digest
                     )
+                id2item[_['id']] = item
+                _record('changed' if _['id'] in id2prev else 'added', course, item)
+
+            for _ in id2prev.values():
+                if _['id'] not in id2item:
+                    _record('removed', course, _)
 
             id2lesson = {}
             for _ in d['onDemandCourseMaterialLessons.v1']:
@@ -184,49 +469,127 @@ class Crawler:
                 if len(module['lessons']) > 0:
                     course['modules'].append(module)
 
+            course['version'] = _course_version(course)
+            if store is not None:
+                _ = store.load(course['id'], course['version'])
+                if _ is not None:
+                    logging.info(
+                        '[crawl_course] %s is taken from the course store'
+                        % course['slug']
+                    )
+                    course['modules'] = _['modules']
+                    course['references'] = _['references']
+                    course['workspaces'] = _['workspaces']
+                    self._from_store.add(course['id'])
+                    return
+
             # ------
 
-            crawl_course_references(course=course)
+            with refs_lock:
+                refs_claimed[course['id']] = set()
+                refs_futs[course['id']] = crawl_course_references(
+                    course=course, prev=None if prev is None else prev['references']
+                )
 
-            for module in course['modules']:
-                for lesson in module['lessons']:
-                    for item in lesson['items']:
-                        if item['type'] == 'Lecture':
-                            crawl_lecture(course=course, lecture=item)
-                        elif item['type'] == 'Supplement':
-                            crawl_supplement(course=course, supplement=item)
+            for item in _course_items(course):
+                if item['id'] in reused:
+                    continue
+                if item['type'] == 'Lecture':
+                    crawl_lecture(course=course, lecture=item)
+                elif item['type'] == 'Supplement':
+                    crawl_supplement(course=course, supplement=item)
 
         def _cook_cml(course, cml: CML):
             assets, assetIDs, refids = cml.get_resources()
-            assets += crawl_assets(assetIDs)
-            html = cml.to_html(assets=assets)
 
             for refid in refids:
-                crawl_course_reference(course=course, id_ref=refid)
+                # whether the reference is listed is known once all the
+                # references of the course are crawled
+                crawl_course_reference(
+                    course=course, id_ref=refid, depends_on=[refs_futs[course['id']]]
+                )
+
+            def _cook(_assets):
+                return CourseMaterialSupplementItemCML(
+                    doc=cml.doc, assets=assets + _assets
+                )
+
+            return _then(course, [_crawl_assets(course, assetIDs)], _cook)
 
-            return CourseMaterialSupplementItemCML(html=html, assets=assets)
+        @ts.register_task(priority=PRIO_COURSE_MATERIAL, format_kwargs=lambda _: '')
+        def then(*, course, futs, fn):
+            return fn(*[_.result() for _ in futs])
 
-        def _crawl_course_ref(course, id_ref=None):
+        def _then(course, futs, fn):
+            '''
+            call @fn with the results of @futs once all of them are done. A
+            failure is then one of @course, see finish()
+            '''
+            return then(course=course, futs=futs, fn=fn, depends_on=futs)
+
+        # Tasks of a course run concurrently, but each node of the course tree
+        # is written by one task only, except the references of a course,
+        # which are guarded by refs_lock. refs_claimed maps the ID of a course
+        # to the IDs of the references which are crawled or being crawled
+        refs_lock = threading.Lock()
+        refs_claimed = {}
+        refs_futs = {}
+
+        def _crawl_course_ref(course, id_ref=None, prev=()):
             if not id_ref:
-                d = Crawler._get(sess, URL_COURSE_REFERENCES(course['id']))
+                d = Crawler._get(
+                    _sess_of(course), URL_COURSE_REFERENCES(course['id']), cache
+                )
             else:
-                d = Crawler._get(sess, URL_COURSE_REFERENCE(course['id'], id_ref))
+                d = Crawler._get(
+                    _sess_of(course), URL_COURSE_REFERENCE(course['id'], id_ref), cache
+                )
+
+            id2prev = {_['id']: _ for _ in prev}
+            id2asset = {_['id']: _ for _ in d['linked']['openCourseAssets.v1']}
 
             itemId2ref = {}
+            reused = set()
             for _ in d['elements']:
-                ref = CourseReference(id_=_['shortId'], name=_['name'], slug=_['slug'])
-                course['references'].append(ref)
-
                 itemId = _['content'][
                     'org.coursera.ondemand.reference.AssetReferenceContent'
                 ]['assetId']
+
+                ref = CourseReference(
+                    id_=_['shortId'],
+                    name=_['name'],
+                    slug=_['slug'],
+                    digest=_digest(_['name'], _['slug'], id2asset.get(itemId)),
+                )
+                old = id2prev.get(ref['id'])
+                if (
+                    old is not None
+                    and old.get('digest') == ref['digest']
+                    and old['item'] is not None
+                ):
+                    ref = old
+                    reused.add(itemId)
+                else:
+                    _record('changed' if old is not None else 'added', course, ref)
+
+                with refs_lock:
+                    refs_claimed[course['id']].add(ref['id'])
+                    course['references'].append(ref)
+
                 itemId2ref[itemId] = ref
 
             for _ in d['linked']['openCourseAssets.v1']:
+                if _['id'] in reused:
+                    continue
+
                 typeName = _['typeName']
                 if typeName == 'cml':
                     cml = CML(_['definition']['value'])
-                    itemId2ref[_['id']]['item'] = _cook_cml(course, cml)
+
+                    def _set_item(item, ref=itemId2ref[_['id']]):
+                        ref['item'] = item
+
+                    _then(course, [_cook_cml(course, cml)], _set_item)
                 else:
                     logging.warning(
                         "[_crawl_course_ref] unknown typeName=%s\n%s" % (typeName, _)
@@ -235,35 +598,67 @@ class Crawler:
         @ts.register_task(
             priority=PRIO_COURSE_MATERIAL,
             ttl=3,
+            key=KEY_API,
+            retry_policy=RETRY_POLICY_API,
             format_kwargs=lambda _: format_dict({'cource': _['course']['slug']}),
         )
-        def crawl_course_references(*, course):
-            _crawl_course_ref(course)
+        def crawl_course_references(*, course, prev=None):
+            '''
+            @prev: the references of the course in a previous crawl. The
+                listed ones are crawled again only if they changed, and the
+                unlisted ones are carried over as is
+            '''
+
+            _crawl_course_ref(course, prev=prev or ())
+
+            with refs_lock:
+                for _ in prev or ():
+                    if _['id'] not in refs_claimed[course['id']]:
+                        refs_claimed[course['id']].add(_['id'])
+                        course['references'].append(_)
 
         @ts.register_task(
             priority=PRIO_COURSE_MATERIAL,
             ttl=3,
+            key=KEY_API,
+            retry_policy=RETRY_POLICY_API,
             format_kwargs=lambda _: format_dict(
                 {'cource': _['course']['slug'], 'id_ref': _['id_ref']}
             ),
         )
         def crawl_course_reference(*, course, id_ref):
-            for ref in course['references']:
-                if id_ref == ref['id']:
+            with refs_lock:
+                if id_ref in refs_claimed[course['id']]:
                     return
-            _crawl_course_ref(course, id_ref)
+                refs_claimed[course['id']].add(id_ref)
+
+            try:
+                _crawl_course_ref(course, id_ref)
+            except Exception:
+                # so that it is crawled when the task is tried again
+                with refs_lock:
+                    refs_claimed[course['id']].discard(id_ref)
+                raise
 
         @ts.register_task(
             priority=PRIO_COURSE_MATERIAL,
             ttl=3,
+            key=KEY_API,
+            retry_policy=RETRY_POLICY_API,
             format_kwargs=lambda _: format_dict(
                 {'course': _['course']['slug'], 'lecture': _['lecture']['slug']}
             ),
         )
         def crawl_lecture(*, course, lecture):
+            # the lecture is filled once its assets are known, so that it is
+            # left empty, i.e. is crawled again, if they are not
+
             # lecture videos
-            d = Crawler._get(sess, URL_LECTURE_1(course['id'], lecture['id']))
+            d = Crawler._get(
+                _sess_of(course), URL_LECTURE_1(course['id'], lecture['id']), cache
+            )
 
+            videos = []
             for _ in d['linked']['onDemandVideos.v1']:
                 url_subtitle = _['subtitles'].get('en')
                 if url_subtitle is not None:
@@ -274,12 +669,12 @@ class Crawler:
                 url_video = _[sorted(_.keys())[-1]]
                 url_video = url_video['mp4VideoUrl']
 
-                lecture['videos'].append(
-                    Video(url_video=url_video, url_subtitle=url_subtitle)
-                )
+                videos.append(Video(url_video=url_video, url_subtitle=url_subtitle))
 
             # lecture assets
-            d = Crawler._get(sess, URL_LECTURE_2(course['id'], lecture['id']))
+            d = Crawler._get(
+                _sess_of(course), URL_LECTURE_2(course['id'], lecture['id']), cache
+            )
 
             assets = []
             assetIDs = []
@@ -300,33 +695,129 @@ class Crawler:
                         "[crawl_lecture] unknown typeName=%s\n%s" % (typeName, _)
                     )
 
-            assets += crawl_assets(assetIDs)
-            lecture['assets'] = assets
+            def _set_assets(_assets):
+                lecture['videos'] = videos
+                lecture['assets'] = assets + _assets
+
+            _then(course, [_crawl_assets(course, assetIDs)], _set_assets)
 
         @ts.register_task(
             priority=PRIO_COURSE_MATERIAL,
             ttl=3,
+            key=KEY_API,
+            retry_policy=RETRY_POLICY_API,
             format_kwargs=lambda _: format_dict(
                 {'course': _['course']['slug'], 'supplement': _['supplement']['slug']}
             ),
         )
         def crawl_supplement(course, supplement):
-            d = Crawler._get(sess, URL_SUPPLEMENT(course['id'], supplement['id']))
+            d = Crawler._get(
+                _sess_of(course), URL_SUPPLEMENT(course['id'], supplement['id']), cache
+            )
+
+            futs = []
             for _ in d['linked']['openCourseAssets.v1']:
                 typeName = _['typeName']
                 if typeName == 'cml':
                     cml = CML(_['definition']['value'])
-                    supplement['items'].append(_cook_cml(course, cml))
+                    futs.append(_cook_cml(course, cml))
                 else:
                     logging.warning(
                         "[crawl_supplement] unknown typeName=%s\n%s" % (typeName, _)
                     )
 
-        def crawl_assets(ids):
+            def _set_items(*items):
+                supplement['items'] = list(items)
+
+            _then(course, futs, _set_items)
+
+        # asset lookups of all lectures and supplements are collected and
+        # sent in a few batched requests by flush_assets
+        assets_lock = threading.Lock()
+        asset_futs = {}
+        asset_ids_pending = []
+
+        def _crawl_assets(course, ids):
+            '''return a future of the assets of @ids, which are of @course'''
+
             if len(ids) == 0:
-                return []
+                fut = concurrent.futures.Future()
+                fut.set_result([])
+                return fut
+
+            futs = []
+            flush = None
+            with assets_lock:
+                if len(asset_ids_pending) == 0:
+                    flush = flush_assets()
+
+                for id_ in ids:
+                    fut = asset_futs.get(id_)
+                    if fut is None:
+                        fut = asset_futs[id_] = concurrent.futures.Future()
+                        asset_ids_pending.append(id_)
+                    futs.append(fut)
+
+            # flush_assets may have failed already, e.g. if the run was
+            # aborted, and then _on_flushed, which takes assets_lock, is
+            # called at once
+            if flush is not None:
+                flush.add_done_callback(_on_flushed)
+
+            def _collect(*assets):
+                return [_ for _ in assets if _ is not None]
+
+            return _then(course, futs, _collect)
+
+        # under KEY_API, so that it waits behind the requests queued before
+        # it, which may add more asset IDs, even while KEY_API is limited
+        @ts.register_task(priority=PRIO_ASSETS, key=KEY_API, format_kwargs=lambda _: '')
+        def flush_assets():
+            with assets_lock:
+                ids = asset_ids_pending[:]
+                asset_ids_pending.clear()
+
+            for batch in _batch_asset_ids(ids):
+                crawl_assets(ids=batch).add_done_callback(
+                    functools.partial(_fan_out_assets, batch)
+                )
 
-            d = Crawler._get(sess, URL_ASSET(ids))
+        def _on_flushed(fut):
+            # flush_assets failed without taking the pending IDs, e.g. as the
+            # run was aborted. Nothing else would resolve their futures
+            if not fut.cancelled() and fut.exception() is None:
+                return
+
+            with assets_lock:
+                ids = asset_ids_pending[:]
+                asset_ids_pending.clear()
+            _fail_assets(ids, fut)
+
+        def _fail_assets(ids, fut):
+            exc = fut.exception() if not fut.cancelled() else None
+            if exc is None:
+                exc = concurrent.futures.CancelledError()
+            for id_ in ids:
+                asset_futs[id_].set_exception(exc)
+
+        def _fan_out_assets(ids, fut):
+            if fut.cancelled() or fut.exception() is not None:
+                _fail_assets(ids, fut)
+                return
+
+            id2asset = {_['id']: _ for _ in fut.result()}
+            for id_ in ids:
+                asset_futs[id_].set_result(id2asset.get(id_))
+
+        @ts.register_task(
+            priority=PRIO_COURSE_MATERIAL,
+            ttl=3,
+            key=KEY_API,
+            retry_policy=RETRY_POLICY_API,
+            format_kwargs=lambda _: format_dict({'ids': ','.join(_['ids'])}),
+        )
+        def crawl_assets(*, ids):
+            d = Crawler._get(sess, URL_ASSET(ids), cache)
 
             assets = []
             for _ in d['elements']:
@@ -352,38 +843,81 @@ class Crawler:
             login(self._sess, self._cookies_file)
             self._loggedin = True
 
-            for x in self._sess.cookies:
-                if 'userId' in x.name:
-
-                    # g:20580072|e:undefined|c:1754026047404|l:1754059501489
-                    def _get_uid(s: str):
-                        for _1 in s.split('|'):
-                            _2 = _1.split(':')
-                            if len(_2) != 2:
-                                return None
-                            k, v = _2
-                            if k == 'g':
-                                return v
-                        return None
+            if isinstance(self._sess, AccountPool):
+                uids = [get_uid(_.cookies) for _ in self._sess.accounts]
+            else:
+                uids = [get_uid(self._sess.cookies)]
 
-                    from urllib.parse import unquote
+            if not all(uids):
+                raise UserIDNotFoundException()
+            self._uid = uids[0]
+
+    def crawl(self, *, slug, is_spec, prev=None):
+        '''
+        @prev: the result of a previous crawl of @slug. If given, the
+            course-materials index of each course is fetched again, and only
+            the lectures, supplements and references which are new or changed
+            are crawled again; the others are taken from @prev. What changed
+            is in self.delta afterwards
+        '''
+
+        res = self.start(slug=slug, is_spec=is_spec, prev=prev)
+        self.finish(res, self._ts.wait())
+        return res
 
-                    self._uid = _get_uid(unquote(x.value))
-                    break
+    def start(self, *, slug, is_spec, prev=None):
+        '''
+        Add the tasks which crawl @slug, and return the result they fill.
 
-            if not self._uid:
-                raise UserIDNotFoundException()
+        crawl() is start(), waiting for the scheduler, then finish(). It is
+        split so that many crawlers can share one scheduler
+        '''
 
-    def crawl(self, *, slug, is_spec):
         if not self._loggedin:
             self.login()
 
+        if prev is not None and (
+            prev['type'] != ('Spec' if is_spec else 'Course') or prev['slug'] != slug
+        ):
+            prev = None
+
         if is_spec:
             res = Spec(slug=slug)
-            self.crawl_spec(spec=res)
+            self.crawl_spec(spec=res, prev=prev)
         else:
             res = Course(slug=slug)
-            self.crawl_course(course=res)
-
-        self._ts.wait()
+            self.crawl_course(course=res, prev=prev)
         return res
+
+    def finish(self, res, failures):
+        '''
+        @res: returned by start()
+        @failures: returned by the wait() of the scheduler
+        '''
+
+        if res['type'] == 'Course' and res['id'] is not None:
+            course = self._courses.get(res['id'], res)
+            if course is not res:
+                # crawled, and stored, by the crawler which claimed it first
+                res.update(course)
+                return
+
+        if self._store is None:
+            return
+
+        # e.g. a course whose reference listing failed looks complete. Failed
+        # asset lookups are those of the then tasks of a course
+        failed = set()
+        for task, _ in failures:
+            course = getattr(task, 'kwargs', {}).get('course')
+            if course is not None:
+                failed.add(course['id'])
+
+        for _ in res['courses'] if res['type'] == 'Spec' else [res]:
+            if (
+                _['version'] is not None
+                and _['id'] not in failed
+                and _['id'] not in self._from_store
+                and _is_complete(_)
+            ):
+                self._store.save(_)
@@ -2,10 +2,16 @@ import os
 import zipfile
 import io
 import logging
+import collections
+import concurrent.futures
+import posixpath
 
 from .lib.ExploringTree import ExploringTree
+from .lib.TaskScheduler import ProcessFuncTask
+from .lib.misc import format_dict
 
-from .markup import render_supplement
+from .markup import CML, render_supplement, render_version
+from .RenderCache import RenderCache
 
 from .resource import load_resource
 from .define import *
@@ -16,23 +22,155 @@ def _shorten_slug(x):
         x['slug'] = x['slug'][:40]
 
 
+def render_cml(*, doc, assets, ref_paths, dir_, resource_path, title):
+    '''
+    Render a CML document as a page. CPU-bound, so it runs in a process pool.
+
+    @ref_paths: [[ID, path], ...] of the references of the course
+    @dir_: the directory of the page
+    Paths are relative to the course.
+
+    Return the page, and the IDs of the references which are linked to but
+    unknown
+    '''
+
+    ref_paths = dict(ref_paths)
+    unknown = []
+
+    def resolve_ref(refid):
+        path = ref_paths.get(refid)
+        if path is None:
+            unknown.append(refid)
+            return None
+        return posixpath.relpath(path, dir_)
+
+    html = CML(doc).to_html(assets=assets, resolve_ref=resolve_ref)
+    data = render_supplement(
+        content=html, resource_path=resource_path, title=title
+    ).encode('UTF-8')
+    return data, unknown
+
+
+class _Renderer:
+    '''
+    Runs render_cml() as ProcessFuncTasks of @ts, i.e. in its process pool,
+    or in this process if @ts is None, and writes the pages in the order
+    they are submitted. At most twice as many pages as @ts has workers are
+    held at a time.
+
+    The first _N_INLINE pages are rendered in this process, so that a few
+    pages do not start the process pool.
+    '''
+
+    _N_INLINE = 8
+
+    def __init__(self, *, ts, render_cache):
+        self._render_cache = render_cache
+
+        self._render = None
+        self._n_held = 2
+        if ts is not None:
+            self._render = ts.register_task(
+                render_cml,
+                FuncTaskFactory=ProcessFuncTask,
+                format_kwargs=lambda _: format_dict({'title': _['title']}),
+            )
+            self._n_held = 2 * ts.n_worker()
+        self._n_inline = 0
+
+        # of the pages submitted but not written, in order
+        self._queue = collections.deque()
+        # key => a task in the queue
+        self._pending = {}
+
+    def submit(self, key, kwargs, filename):
+        # a page seen twice, e.g. a reference of a course shared by two
+        # specializations, is rendered once
+        task = self._pending.get(key)
+        if task is not None:
+            task['filenames'].append(filename)
+            return
+
+        if self._render is None or self._n_inline < self._N_INLINE:
+            self._n_inline += 1
+            fut = concurrent.futures.Future()
+            fut.set_result(render_cml(**kwargs))
+        else:
+            fut = self._render(**kwargs)
+
+        task = self._pending[key] = {'key': key, 'fut': fut, 'filenames': [filename]}
+        self._queue.append(task)
+
+        while len(self._queue) > self._n_held:
+            self._write_next()
+
+    def _write_next(self):
+        task = self._queue.popleft()
+        del self._pending[task['key']]
+
+        data, unknown = task['fut'].result()
+        for refid in unknown:
+            logging.warning(
+                '[render_cml] unknown refid=%s in %s' % (refid, task['filenames'][0])
+            )
+        if self._render_cache is not None:
+            self._render_cache.put(task['key'], data)
+        for filename in task['filenames']:
+            write_file(data, filename)
+
+    def close(self):
+        '''write all the pages submitted'''
+
+        while len(self._queue) > 0:
+            self._write_next()
+
+
+def write_file(data, filename):
+    '''write @data to @filename, unless it exists'''
+
+    if not os.path.exists(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'wb') as ofs:
+            ofs.write(data)
+        logging.info('new file: %s' % filename)
+
+
 class DLTaskGatherer:
-    def __init__(self, *, soc, outdir):  # "soc" means "sepc or course"
+    '''
+    Walks the tree of a spec or course, which gives the path of every file.
+    The downloading tasks are yielded as they are reached, and supplements
+    are rendered and written on the way, so that only a few of them are held
+    in memory at a time.
+
+    @render_cache: a RenderCache, so that supplements rendered before are
+        not rendered again. None to render all of them
+    @ts: a started TaskScheduler, in whose process pool the supplements are
+        rendered, so that the gatherers of a run share one pool. None to
+        render in this process
+    '''
+
+    def __init__(self, *, soc, outdir, render_cache=None, ts=None):
+        # "soc" means "sepc or course"
         assert soc['type'] in ['Spec', 'Course']
 
         self._soc = soc
         self._outdir = outdir
+        self._render_cache = render_cache
+        self._ts = ts
 
         self._et = ExploringTree()
         self._resource_node = self._et.see('%s/resource' % self._soc['slug'])
 
-        self._dl_tasks = []
-        self._file_tasks = []
+        self._renderer = None
 
     def gather(self):
-        (self._gather_spec if self._soc['type'] == 'Spec' else self._gather_course)(
-            self._soc
-        )
+        return list(self.iter_dl_tasks())
+
+    def iter_dl_tasks(self):
+        '''
+        Yield the downloading tasks in the order of the tree. All the
+        supplements are written once it is exhausted
+        '''
 
         _dir = self._path(self._resource_node.abspath()[1:])
         if not os.path.exists(_dir):
@@ -40,16 +178,16 @@ class DLTaskGatherer:
                 zf.extractall(_dir)
             logging.info('new directory tree: %s' % _dir)
 
-        for _ in self._file_tasks:
-            data = _['data']
-            filename = _['filename']
-            if not os.path.exists(filename):
-                os.makedirs(os.path.dirname(filename), exist_ok=True)
-                with open(filename, 'wb') as ofs:
-                    ofs.write(data)
-                logging.info('new file: %s' % filename)
-
-        return self._dl_tasks
+        self._renderer = _Renderer(ts=self._ts, render_cache=self._render_cache)
+        try:
+            yield from (
+                self._gather_spec
+                if self._soc['type'] == 'Spec'
+                else self._gather_course
+            )(self._soc)
+        finally:
+            self._renderer.close()
+            self._renderer = None
 
     def _resource_path(self):
         return self._et.relpathTo(self._resource_node)
@@ -57,11 +195,8 @@ class DLTaskGatherer:
     def _path(self, s):
         return os.path.abspath(os.path.join(self._outdir, s))
 
-    def _add_dl_task(self, url, s):
-        self._dl_tasks.append({'url': url, 'filename': self._path(s)})
-
-    def _add_file_task(self, data, s):
-        self._file_tasks.append({'data': data, 'filename': self._path(s)})
+    def _dl_task(self, url, s):
+        return {'url': url, 'filename': self._path(s)}
 
     def _down(self, s, i=None):
         if i is None:
@@ -77,16 +212,17 @@ class DLTaskGatherer:
             self._down(spec['slug'])
 
             for _i, course in enumerate(spec['courses']):
-                self._gather_course(course, _i)
+                yield from self._gather_course(course, _i)
 
     def _gather_course(self, course, i=None):
         with self._et:
             self._down(course['slug'], i)
+            self._course_node = self._et.whereami()
 
-            self._gather_course_references(course)
+            yield from self._gather_course_references(course)
 
             for _i, module in enumerate(course['modules']):
-                self._gather_module(module, _i)
+                yield from self._gather_module(module, _i)
 
     def _gather_course_references(self, course):
         with self._et:
@@ -95,31 +231,20 @@ class DLTaskGatherer:
             refid2node = {}
             for i, ref in enumerate(course['references']):
                 item = ref['item']
-                if item['type'] == 'CML':
+                if item is not None and item['type'] == 'CML':
                     refid2node[ref['id']] = self._et.see(
                         '%02d@%s.html' % (i + 1, ref['slug'])
                     )
 
-            def fn_a(a):
-                _refid = a.get('refid')
-                if not _refid:
-                    return
-
-                _node = refid2node.get(_refid)
-                if not _node:
-                    logging.warning(
-                        '[fn_a] unknown _refid=%s\n%s'
-                        % (_refid, {_1: _2.abspath() for _1, _2 in refid2node.items()})
-                    )
-                else:
-                    a['href'] = self._et.relpathTo(_node)
-
-            self._fn_a = fn_a
+            # where the references are, relative to the course, see render_cml
+            self._ref_paths = sorted(
+                [_1, self._course_node.relpathTo(_2)] for _1, _2 in refid2node.items()
+            )
 
             for i, ref in enumerate(course['references']):
                 item = ref['item']
-                if item['type'] == 'CML':
-                    self._gather_cml(item, i, ref)
+                if item is not None and item['type'] == 'CML':
+                    yield from self._gather_cml(item, i, ref)
 
     def _gather_module(self, module, i):
         _shorten_slug(module)
@@ -128,7 +253,7 @@ class DLTaskGatherer:
             self._down(module['slug'], i)
 
             for _i, lesson in enumerate(module['lessons']):
-                self._gather_lesson(lesson, _i)
+                yield from self._gather_lesson(lesson, _i)
 
     def _gather_lesson(self, lesson, i):
         _shorten_slug(lesson)
@@ -138,9 +263,9 @@ class DLTaskGatherer:
 
             for _i, item in enumerate(lesson['items']):
                 if item['type'] == 'Lecture':
-                    self._gather_lecture(item, _i)
+                    yield from self._gather_lecture(item, _i)
                 elif item['type'] == 'Supplement':
-                    self._gather_supplement(item, _i)
+                    yield from self._gather_supplement(item, _i)
 
     def _gather_lecture(self, lecture, i):
         _shorten_slug(lecture)
@@ -149,15 +274,15 @@ class DLTaskGatherer:
             self._down(lecture['slug'], i)
 
             for _i, video in enumerate(lecture['videos']):
-                self._gather_video(video, _i)
+                yield from self._gather_video(video, _i)
 
             for asset in lecture['assets']:
-                self._gather_asset(asset)
+                yield self._gather_asset(asset)
 
     def _gather_video(self, video, i):
-        self._add_dl_task(video['url_video'], self._see('%02d@.mp4' % (i + 1)))
+        yield self._dl_task(video['url_video'], self._see('%02d@.mp4' % (i + 1)))
         if video.get('url_subtitle') is not None:
-            self._add_dl_task(video['url_subtitle'], self._see('%02d@.srt' % (i + 1)))
+            yield self._dl_task(video['url_subtitle'], self._see('%02d@.srt' % (i + 1)))
 
     def _gather_supplement(self, supplement, i):
         _shorten_slug(supplement)
@@ -167,28 +292,42 @@ class DLTaskGatherer:
 
             for _i, item in enumerate(supplement['items']):
                 if item['type'] == 'CML':
-                    self._gather_cml(item, _i, supplement)
+                    yield from self._gather_cml(item, _i, supplement)
 
     def _gather_cml(self, cml, i, supplement):
-        import bs4
-
-        html = cml['html']
-        html = bs4.BeautifulSoup(html, 'html.parser')
-        for a in html.find_all('a'):
-            self._fn_a(a)
-        html = str(html)
-
-        data = render_supplement(
-            content=html,
-            resource_path=self._resource_path(),
-            title='%s' % supplement['name'],
-        ).encode('UTF-8')
-        self._add_file_task(
-            data, self._see('%02d@%s.html' % (i + 1, supplement['slug']))
+        resource_path = self._resource_path()
+        title = '%s' % supplement['name']
+
+        kwargs = {
+            'doc': cml['doc'],
+            'assets': cml['assets'],
+            'ref_paths': self._ref_paths,
+            'dir_': self._course_node.relpathTo(self._et.whereami()),
+            'resource_path': resource_path,
+            'title': title,
+        }
+        # all that the page depends on. Paths are relative to the course, so
+        # a course gathered elsewhere gives the same key
+        key = RenderCache.key(
+            render_version(),
+            cml['doc'],
+            [[_['id'], _['name']] for _ in cml['assets']],
+            self._ref_paths,
+            kwargs['dir_'],
+            resource_path,
+            title,
         )
+        filename = self._path(self._see('%02d@%s.html' % (i + 1, supplement['slug'])))
+
+        cache = self._render_cache
+        data = cache.get(key) if cache is not None else None
+        if data is not None:
+            write_file(data, filename)
+        else:
+            self._renderer.submit(key, kwargs, filename)
 
         for asset in cml['assets']:
-            self._gather_asset(asset)
+            yield self._gather_asset(asset)
 
     def _gather_asset(self, asset):
-        self._add_dl_task(asset['url'], self._see(asset['name']))
+        return self._dl_task(asset['url'], self._see(asset['name']))
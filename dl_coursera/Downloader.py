@@ -1,3 +1,4 @@
+import asyncio
 import subprocess
 import os
 import sys
@@ -6,6 +7,8 @@ import shutil
 import re
 import xmlrpc.client
 
+from urllib.parse import urlparse
+
 import requests
 import jinja2
 
@@ -49,11 +52,24 @@ class DownloaderTS(Downloader):
         super().__init__(*args, **kwargs)
 
         self._ts = ts
-        self._dl = ts.register_task(self._dl, ttl=3, desc='download')
+
+        _dl = self._dl
+        if ts.is_async and self._dl_async is not None:
+            _dl = self._dl_async
+        self._dl = ts.register_task(
+            _dl,
+            ttl=3,
+            key=lambda _: urlparse(_['url']).netloc,
+            desc='download',
+            journal=True,
+        )
 
     def _dl(self, *, url, filename):
         pass
 
+    # a coroutine version of _dl, used by AsyncTaskScheduler when available
+    _dl_async = None
+
     def download(self):
         self.check()
 
@@ -65,10 +81,19 @@ class DownloaderTS(Downloader):
 
 
 class DownloaderBuiltin(DownloaderTS):
+    def __init__(self, *args, sess=None, **kwargs):
+        '''
+        @sess: a requests.Session or SessionPool, so that connections are reused
+        '''
+
+        super().__init__(*args, **kwargs)
+
+        self._sess = requests if sess is None else sess
+
     def _dl(self, *, url, filename):
         os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-        with requests.get(url, stream=True) as r:
+        with self._sess.get(url, stream=True) as r:
             r.raise_for_status()
             r.raw.decode_content = True
             with open(filename, 'wb') as ofs:
@@ -103,6 +128,17 @@ class DownloaderSubprocess(CheckExeMixIn, DownloaderTS):
             check=True,
         )
 
+    async def _dl_async(self, *, url, filename):
+        cmdline = self._cmdline(url, filename)
+        proc = await asyncio.create_subprocess_exec(
+            *cmdline,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT,
+        )
+        returncode = await proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmdline)
+
     def _cmdline(self, url, filename):
         pass
 
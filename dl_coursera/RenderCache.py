@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import threading
+
+from .lib.misc import LRU, dir_user_cache, write_atomically
+
+
+def default_dirname():
+    '''the cache shared by all output directories of the current user'''
+
+    return os.path.join(dir_user_cache(), 'rendered')
+
+
+class RenderCache:
+    '''
+    Keeps rendered pages, e.g. supplements, keyed by a digest of all they
+    are rendered from, so that a page seen again (a reference shared by
+    courses, a course shared by specializations, gathering again) is not
+    rendered again.
+
+    Pages are kept in an in-memory LRU, in front of an optional directory.
+
+    @dirname: where the pages are kept, one file per key. None to keep them
+        in memory only
+    @max_memory: maximum number of pages kept in memory
+    '''
+
+    def __init__(self, dirname=None, *, max_memory=256):
+        self._dirname = dirname
+
+        self._lock = threading.Lock()
+        self._lru = LRU(max_memory)
+
+        self.n_hits = 0
+        self.n_misses = 0
+
+        if dirname is not None:
+            os.makedirs(dirname, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        '''a digest of @parts, which are to be serializable as JSON'''
+
+        data = json.dumps(parts, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(data.encode('UTF-8')).hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self._dirname, key + '.html')
+
+    def get(self, key):
+        '''return the page of @key as bytes, or None'''
+
+        data = self._lru.get(key)
+        if data is not None:
+            with self._lock:
+                self.n_hits += 1
+            return data
+
+        if self._dirname is not None:
+            try:
+                with open(self._filename(key), 'rb') as ifs:
+                    data = ifs.read()
+            except OSError:
+                pass
+
+        if data is None:
+            with self._lock:
+                self.n_misses += 1
+            return None
+
+        self._lru.put(key, data)
+        with self._lock:
+            self.n_hits += 1
+        return data
+
+    def put(self, key, data):
+        self._lru.put(key, data)
+
+        if self._dirname is not None:
+            write_atomically(self._filename(key), data)
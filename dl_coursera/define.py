@@ -1,10 +1,17 @@
 import json
+import os
 
 from .lib.MyDict import MyDict
 
-URL_ROOT = 'https://www.coursera.org'
+# may be pointed elsewhere, e.g. at a MockCoursera (see test/MockCoursera.py)
+URL_ROOT = os.environ.get('DL_COURSERA_URL_ROOT', 'https://www.coursera.org')
 COURSE_0 = 'learning-how-to-learn'
 
+# version of the layout of the classes below, as kept by CrawlDB and
+# CourseStore. Bump it when they change, so that what was kept before is
+# crawled again instead of being misread
+SCHEMA_VERSION = 2
+
 
 def URL_SPEC(slug):
     return (
@@ -122,8 +129,13 @@ class CourseNotExistExcepton(DlCourseraException):
 
 
 class CookiesExpiredException(DlCourseraException):
-    def __init__(self):
-        super().__init__('The cookies.txt expired')
+    def __init__(self, cookies_file=None):
+        super().__init__(
+            'The cookies.txt expired'
+            if cookies_file is None
+            else 'The cookies file %s expired' % cookies_file
+        )
+        self.cookies_file = cookies_file
 
 
 class BadResponseException(DlCourseraException):
@@ -149,20 +161,21 @@ class Spec(MyDict):
 
 
 class Course(MyDict):
-    def __init__(self, *, id_=None, name=None, slug=None):
+    def __init__(self, *, id_=None, name=None, slug=None, version=None):
         super().__init__()
 
         self['type'] = 'Course'
         self['id'] = id_
         self['name'] = name
         self['slug'] = slug
+        self['version'] = version
         self['modules'] = []
         self['references'] = []
         self['workspaces'] = []
 
 
 class CourseReference(MyDict):
-    def __init__(self, *, id_=None, name=None, slug=None, item=None):
+    def __init__(self, *, id_=None, name=None, slug=None, item=None, digest=None):
         super().__init__()
 
         self['type'] = 'CourseReference'
@@ -170,6 +183,7 @@ class CourseReference(MyDict):
         self['name'] = name
         self['slug'] = slug
         self['item'] = item
+        self['digest'] = digest
 
 
 class CourseMaterialModule(MyDict):
@@ -195,25 +209,27 @@ class CourseMaterialLesson(MyDict):
 
 
 class CourseMaterialLecture(MyDict):
-    def __init__(self, *, id_=None, name=None, slug=None):
+    def __init__(self, *, id_=None, name=None, slug=None, digest=None):
         super().__init__()
 
         self['type'] = 'Lecture'
         self['id'] = id_
         self['name'] = name
         self['slug'] = slug
+        self['digest'] = digest
         self['videos'] = []
         self['assets'] = []
 
 
 class CourseMaterialSupplement(MyDict):
-    def __init__(self, *, id_=None, name=None, slug=None):
+    def __init__(self, *, id_=None, name=None, slug=None, digest=None):
         super().__init__()
 
         self['type'] = 'Supplement'
         self['id'] = id_
         self['name'] = name
         self['slug'] = slug
+        self['digest'] = digest
         self['items'] = []
 
 
@@ -222,14 +238,36 @@ class CourseMaterialSupplementItem(MyDict):
 
 
 class CourseMaterialSupplementItemCML(CourseMaterialSupplementItem):
-    def __init__(self, *, html, assets):
+    '''
+    A CML document, converted to HTML when gathered, as links to references
+    are resolved then
+
+    @doc: the CML document
+    @assets: the assets it needs, see CML.to_html()
+    '''
+
+    def __init__(self, *, doc, assets):
         super().__init__()
 
         self['type'] = 'CML'
-        self['html'] = html
+        self['doc'] = doc
         self['assets'] = assets
 
 
+class CrawlDelta(MyDict):
+    '''
+    What changed since a previous crawl. Each of added/changed/removed is a
+    list of {course, type, id, name}
+    '''
+
+    def __init__(self):
+        super().__init__()
+
+        self['added'] = []
+        self['changed'] = []
+        self['removed'] = []
+
+
 class Video(MyDict):
     def __init__(self, url_video, url_subtitle=None):
         super().__init__()
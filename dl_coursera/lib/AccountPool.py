@@ -0,0 +1,152 @@
+import threading
+import time
+
+import requests
+import requests.adapters
+
+from .RetryPolicy import retry_after
+from .SessionPool import SessionPool
+
+
+class AccountPool:
+    '''
+    Spreads requests over several accounts, so that crawling is not capped by
+    the rate limit of one account. Each account is a SessionPool with its own
+    cookies, and all of them share one HTTPAdapter.
+
+    Requests go to the accounts by turns:
+
+    * an account which gets HTTP 429 is benched, i.e. not chosen while
+      another one is usable, for as long as Retry-After tells or @cooldown
+      seconds, and the request is sent again with another account
+    * a request with a scope, see scoped(), goes only to accounts which may
+      access the scope. An account whose response makes @is_denied true is
+      excluded from the scope, e.g. one not enrolled in a course, and the
+      request is sent again with another account
+
+    If no other account is left, the last response is returned as is.
+
+    @n_accounts: the number of accounts. Their cookies are to be loaded into
+        accounts[i].cookies
+    '''
+
+    def __init__(
+        self,
+        n_accounts,
+        *,
+        is_denied=lambda resp: False,
+        cooldown=60,
+        pool_maxsize=10,
+        pool_connections=10
+    ):
+        assert n_accounts > 0
+
+        self._adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.accounts = [SessionPool(adapter=self._adapter) for _ in range(n_accounts)]
+
+        self._is_denied = is_denied
+        self._cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._i = 0
+        self._benched = [0] * n_accounts
+        # scope => indexes of the accounts excluded from it
+        self._denied = {}
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def _choose(self, scope, tried):
+        '''the index of the account to send a request of @scope with, or None'''
+
+        with self._lock:
+            denied = self._denied.get(scope, ())
+            candidates = [
+                i
+                for i in range(len(self.accounts))
+                if i not in denied and i not in tried
+            ]
+            if len(candidates) == 0:
+                if len(tried) > 0:
+                    return None
+                # every account is denied. Send it anyway, so that the
+                # caller sees the denial
+                candidates = list(range(len(self.accounts)))
+
+            t = time.monotonic()
+            ready = [i for i in candidates if self._benched[i] <= t]
+            if len(ready) == 0:
+                if len(tried) > 0:
+                    return None
+                return min(candidates, key=lambda i: self._benched[i])
+
+            i = ready[self._i % len(ready)]
+            self._i += 1
+            return i
+
+    def _bench(self, i, resp):
+        seconds = retry_after(requests.HTTPError(response=resp))
+        if seconds is None:
+            seconds = self._cooldown
+
+        with self._lock:
+            self._benched[i] = max(self._benched[i], time.monotonic() + seconds)
+
+    def _deny(self, i, scope):
+        with self._lock:
+            self._denied.setdefault(scope, set()).add(i)
+
+    def request(self, method, url, *, scope=None, **kwargs):
+        resp = None
+        tried = set()
+        while True:
+            i = self._choose(scope, tried)
+            if i is None:
+                return resp
+            tried.add(i)
+
+            if resp is not None:
+                resp.close()
+            resp = self.accounts[i].session().request(method, url, **kwargs)
+
+            if resp.status_code == 429:
+                self._bench(i, resp)
+            elif scope is not None and self._is_denied(resp):
+                self._deny(i, scope)
+            else:
+                return resp
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def scoped(self, scope):
+        '''a session-like view whose requests are of @scope'''
+
+        return _Scoped(self, scope)
+
+    def close(self):
+        for _ in self.accounts:
+            _.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class _Scoped:
+    def __init__(self, pool, scope):
+        self._pool = pool
+        self._scope = scope
+
+    def get(self, url, **kwargs):
+        return self._pool.get(url, scope=self._scope, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._pool.post(url, scope=self._scope, **kwargs)
@@ -0,0 +1,346 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+from .TaskQueue import TaskQueue
+from .RetryPolicy import RetryPolicy
+from .TaskScheduler import Backoff, TaskScheduler, _retire_task, _shutdown_task
+
+
+class AsyncTaskScheduler(TaskScheduler):
+    '''
+    Runs tasks on one event loop instead of one thread per worker.
+
+    The loop lives in a background thread, so add_task/wait/shutdown can be
+    called from plain code just like with TaskScheduler. Coroutine functions
+    are awaited on the loop; plain functions run in the loop's default
+    executor.
+    '''
+
+    is_async = True
+
+    def _init(self):
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+
+        self._q = TaskQueue()
+        self._n_unfinished = 0
+        self._waiters = collections.deque()
+        self._join_waiters = []
+
+        self._workers = []
+        self._n_worker = 0
+        self._n_retire = 0
+        self._worker_seq = 0
+
+        self._autoscaler = None
+        self._autoscaler_thread = None
+        self._autoscaler_stop = threading.Event()
+
+        self._failures = []
+        self._failures_lock = threading.Lock()
+
+        self._current_task = contextvars.ContextVar('current_task', default=None)
+        self._current_worker = contextvars.ContextVar('current_worker', default=None)
+        self._d = contextvars.ContextVar('d')
+
+        self._hooks = {}
+        self._tracer = None
+        self._journal = None
+
+        self._backoff = None
+        self._retry_policy = None
+        self._aborted = None
+
+        self._n_process = None
+        self._process_pool = None
+        self._process_pool_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is not None:
+                return
+
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            t = threading.Thread(target=_run, daemon=True, name='event-loop')
+            t.start()
+            ready.wait()
+
+            self._loop = loop
+            self._loop_thread = t
+
+    def _in_loop(self):
+        return threading.current_thread() is self._loop_thread
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _call_soon(self, func, *args):
+        self._ensure_loop()
+
+        if self._in_loop():
+            func(*args)
+        else:
+            self._loop.call_soon_threadsafe(func, *args)
+
+    def set_limit(self, key, *, max_inflight=None, rate=None, burst=None):
+        def _set_limit():
+            self._q.set_limit(
+                key,
+                max_inflight=max_inflight,
+                rate=rate,
+                burst=burst,
+                now=time.monotonic(),
+            )
+            while self._notify():
+                pass
+
+        self._call_soon(_set_limit)
+
+    # the following methods must be called in the event loop
+
+    def _notify(self):
+        while len(self._waiters) > 0:
+            w = self._waiters.popleft()
+            if not w.done():
+                w.set_result(None)
+                return True
+        return False
+
+    def _put_nowait(self, task, delay=0, held=False):
+        self._q.put(task, delay=delay, now=time.monotonic())
+        if not held:
+            self._n_unfinished += 1
+        self._notify()
+
+    def _add_unfinished(self, n):
+        self._n_unfinished += n
+
+        if self._n_unfinished == 0:
+            for w in self._join_waiters:
+                if not w.done():
+                    w.set_result(None)
+            self._join_waiters = []
+
+    async def _get(self):
+        while True:
+            if self._n_retire > 0:
+                self._n_retire -= 1
+                return _retire_task
+
+            task, timeout = self._q.pop(time.monotonic())
+            if task is not None:
+                return task
+
+            w = self._loop.create_future()
+            self._waiters.append(w)
+            try:
+                await asyncio.wait_for(w, timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _task_done(self, task):
+        self._q.release(task)
+        self._notify()
+        self._add_unfinished(-1)
+
+    async def _join_async(self):
+        if self._n_unfinished > 0:
+            w = self._loop.create_future()
+            self._join_waiters.append(w)
+            await w
+
+    def _add_worker_nowait(self):
+        self._worker_seq += 1
+        self._workers.append(
+            asyncio.ensure_future(self._func_work('worker-%d' % self._worker_seq))
+        )
+        self._n_worker += 1
+
+    def _resize_nowait(self, n_worker):
+        n = n_worker - (self._n_worker - self._n_retire)
+        if n < 0:
+            self._n_retire -= n
+            while self._notify():
+                pass
+            return
+
+        _ = min(n, self._n_retire)
+        self._n_retire -= _
+        n -= _
+
+        for _ in range(n):
+            self._add_worker_nowait()
+
+    # ------
+
+    def n_worker(self):
+        return self._n_worker - self._n_retire
+
+    def resize(self, n_worker):
+        self._call_soon(self._resize_nowait, n_worker)
+
+    def _n_queued(self):
+        return self._q.n_ready
+
+    def _put(self, task, delay=0, held=False):
+        self._call_soon(self._put_nowait, task, delay, held)
+
+    def _hold(self):
+        self._call_soon(self._add_unfinished, 1)
+
+    def _unhold(self):
+        self._call_soon(self._add_unfinished, -1)
+
+    def _join(self):
+        if self._loop is not None:
+            self._call(self._join_async())
+
+    def shutdown(self):
+        self._stop_autoscaler()
+
+        if self._loop is None:
+            return
+
+        async def _stop_workers():
+            self._n_retire = 0
+            for _ in range(self._n_worker):
+                self._put_nowait(_shutdown_task)
+            await asyncio.gather(*self._workers)
+
+        self._call(_stop_workers())
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        self._loop.close()
+
+        self._shutdown_process_pool()
+        self._init()
+
+    def start(
+        self,
+        *,
+        n_worker=3,
+        hook_add=None,
+        hook_start=None,
+        hook_done=None,
+        hook_retry=None,
+        hook_failed=None,
+        tracer=None,
+        journal=None,
+        backoff=Backoff(),
+        retry_policy=RetryPolicy(),
+        n_process=None,
+        autoscaler=None
+    ):
+        self._ensure_loop()
+
+        if autoscaler is not None:
+            n_worker = autoscaler.clamp(n_worker)
+
+        self._loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=n_worker if autoscaler is None else autoscaler.max_worker,
+                thread_name_prefix='executor',
+            )
+        )
+
+        self._set_hooks(
+            hook_add=hook_add,
+            hook_start=hook_start,
+            hook_done=hook_done,
+            hook_retry=hook_retry,
+            hook_failed=hook_failed,
+            tracer=tracer,
+            journal=journal,
+        )
+        self._backoff = backoff
+        self._retry_policy = retry_policy
+        self._n_process = n_process
+
+        async def _start_workers():
+            for _ in range(n_worker):
+                self._add_worker_nowait()
+
+        self._call(_start_workers())
+
+        if autoscaler is not None:
+            self._start_autoscaler(autoscaler)
+
+    async def _run(self, task):
+        if task.in_process:
+            return await asyncio.wrap_future(task.run(self._get_process_pool()))
+
+        if task.is_coroutine():
+            return await task.run()
+
+        ctx = contextvars.copy_context()
+        return await self._loop.run_in_executor(
+            None, functools.partial(ctx.run, task.run)
+        )
+
+    async def _func_work(self, name):
+        logging.debug('started: %s' % name)
+
+        self._d.set({})
+        self._current_worker.set(name)
+
+        while True:
+            task = await self._get()
+            self._current_task.set(task)
+
+            if task is _shutdown_task:
+                self._n_worker -= 1
+                logging.debug('shutdowned: %s' % name)
+                break
+
+            if task is _retire_task:
+                self._n_worker -= 1
+                logging.debug('retired: %s' % name)
+                break
+
+            if self._aborted is not None:
+                self._fail(task, self._aborted, 'the run was aborted')
+                self._task_done(task)
+                continue
+
+            t0 = time.monotonic()
+            try:
+                logging.info('[.....] %s', task)
+                self._emit('start', task, in_worker=True)
+                res = await self._run(task)
+            except Exception as e:
+                self._record(t0, e)
+                self._on_error(task, e)
+            else:
+                self._record(t0)
+                self._on_done(task, res)
+
+            self._task_done(task)
+
+    def current_task(self):
+        return self._current_task.get()
+
+    def _worker_name(self):
+        return self._current_worker.get()
+
+    @property
+    def d(self):
+        try:
+            return self._d.get()
+        except LookupError:
+            self._d.set({})
+            return self._d.get()
@@ -0,0 +1,131 @@
+import logging
+import threading
+import time
+
+from .RetryPolicy import http_status
+
+
+def is_throttled(exc):
+    '''whether @exc tells that the server is overloaded, i.e. HTTP 429 or 5xx'''
+
+    status_code = http_status(exc)
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+class AutoScaler:
+    '''
+    Decides how many workers a TaskScheduler should run.
+
+    Every @interval seconds the scheduler reports the number of workers and
+    queued tasks, and decide() returns the new number of workers, based on
+    what was recorded during the interval:
+
+    * if the rate of throttled tasks (HTTP 429 or 5xx) exceeds
+      @max_throttle_rate, halve the workers and hold for @cooldown intervals
+    * if the error rate exceeds @max_error_rate, retire a worker
+    * if tasks are queued, add @step workers, unless the last increase made
+      the throughput drop, in which case go back one step and hold
+    * if nothing is queued and workers are idle (busy time / interval, by
+      Little's law, is below the number of workers), retire a worker
+    '''
+
+    def __init__(
+        self,
+        *,
+        min_worker=1,
+        max_worker=16,
+        step=1,
+        interval=2,
+        cooldown=3,
+        max_throttle_rate=0.05,
+        max_error_rate=0.2
+    ):
+        assert 1 <= min_worker <= max_worker
+
+        self.min_worker = min_worker
+        self.max_worker = max_worker
+        self.interval = interval
+
+        self._step = step
+        self._cooldown = cooldown
+        self._max_throttle_rate = max_throttle_rate
+        self._max_error_rate = max_error_rate
+
+        self._lock = threading.Lock()
+        self._reset(time.monotonic())
+
+        self._hold = 0
+        self._last_action = None
+        self._last_throughput = None
+
+    def _reset(self, now):
+        self._t0 = now
+        self._n_done = 0
+        self._n_error = 0
+        self._n_throttled = 0
+        self._busy = 0
+
+    def clamp(self, n):
+        return max(self.min_worker, min(self.max_worker, n))
+
+    def record(self, *, latency, exc=None):
+        with self._lock:
+            self._busy += latency
+            if exc is None:
+                self._n_done += 1
+            else:
+                self._n_error += 1
+                if is_throttled(exc):
+                    self._n_throttled += 1
+
+    def decide(self, *, n_worker, n_queued, now=None):
+        now = time.monotonic() if now is None else now
+
+        with self._lock:
+            elapsed = max(now - self._t0, 1e-6)
+            n_done = self._n_done
+            n_error = self._n_error
+            n_throttled = self._n_throttled
+            busy = self._busy
+            self._reset(now)
+
+        n_total = n_done + n_error
+        throughput = n_done / elapsed
+        last_throughput, self._last_throughput = self._last_throughput, throughput
+
+        if n_total > 0 and n_throttled / n_total > self._max_throttle_rate:
+            self._hold = self._cooldown
+            return self._act('down', n_worker // 2, n_worker, throughput)
+
+        if self._hold > 0:
+            self._hold -= 1
+            return n_worker
+
+        if n_total > 0 and n_error / n_total > self._max_error_rate:
+            return self._act('down', n_worker - 1, n_worker, throughput)
+
+        if n_queued > 0:
+            if (
+                self._last_action == 'up'
+                and last_throughput is not None
+                and throughput < last_throughput * 0.9
+            ):
+                self._hold = self._cooldown
+                return self._act('down', n_worker - self._step, n_worker, throughput)
+            return self._act('up', n_worker + self._step, n_worker, throughput)
+
+        if busy / elapsed < n_worker - 1:
+            return self._act('down', n_worker - 1, n_worker, throughput)
+
+        self._last_action = None
+        return n_worker
+
+    def _act(self, action, n, n_worker, throughput):
+        n = self.clamp(n)
+        self._last_action = action if n != n_worker else None
+        if n != n_worker:
+            logging.info(
+                '[AutoScaler] %d -> %d workers (throughput: %.2f tasks/s)'
+                % (n_worker, n, throughput)
+            )
+        return n
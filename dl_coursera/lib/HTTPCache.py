@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+from .misc import LRU, write_atomically
+
+
+class HTTPCache:
+    '''
+    Caches the JSON bodies of GET responses on disk, with an in-memory LRU
+    in front of it.
+
+    A cached response is used as is while it is younger than the TTL of its
+    URL. After that it is revalidated with If-None-Match/If-Modified-Since,
+    so an unchanged resource costs a 304 instead of the full body.
+
+    @dirname: where the responses are kept, one file per URL, named by the
+        SHA-256 of the URL
+    @ttls: [(pattern, seconds), ...]. The TTL of a URL is that of the first
+        pattern which re.search() finds in it, or @default_ttl
+    @max_memory: maximum number of responses kept in memory
+    '''
+
+    def __init__(self, dirname, *, ttls=(), default_ttl=0, max_memory=1024):
+        self._dirname = dirname
+        self._ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self._default_ttl = default_ttl
+        self._lru = LRU(max_memory)
+
+        os.makedirs(dirname, exist_ok=True)
+
+    def ttl(self, url):
+        for pattern, ttl in self._ttls:
+            if pattern.search(url):
+                return ttl
+        return self._default_ttl
+
+    def _filename(self, url):
+        return os.path.join(
+            self._dirname, hashlib.sha256(url.encode('UTF-8')).hexdigest() + '.json'
+        )
+
+    def _load(self, url):
+        entry = self._lru.get(url)
+        if entry is not None:
+            return entry
+
+        try:
+            with open(self._filename(url), encoding='UTF-8') as ifs:
+                entry = json.load(ifs)
+        except (OSError, ValueError):
+            return None
+
+        # a collision of SHA-256 is unlikely, but cheap to rule out
+        if entry.get('url') != url:
+            return None
+
+        self._lru.put(url, entry)
+        return entry
+
+    def _store(self, url, entry):
+        self._lru.put(url, entry)
+        write_atomically(self._filename(url), json.dumps(entry).encode('UTF-8'))
+
+    def get_json(self, sess, url, *, check=None):
+        '''
+        Return the JSON body of GET @url, from the cache if possible.
+
+        @check: a function called with every response fetched before it is
+            cached; it may raise to reject the response
+        '''
+
+        entry = self._load(url)
+        now = time.time()
+        if entry is not None and now - entry['time'] < self.ttl(url):
+            return entry['body']
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        resp = sess.get(url, headers=headers)
+        if resp.status_code == 304 and entry is not None:
+            entry = dict(entry, time=now)
+            self._store(url, entry)
+            return entry['body']
+
+        if check is not None:
+            check(resp)
+        body = resp.json()
+
+        if resp.status_code == 200:
+            self._store(
+                url,
+                {
+                    'url': url,
+                    'time': now,
+                    'etag': resp.headers.get('ETag'),
+                    'last_modified': resp.headers.get('Last-Modified'),
+                    'body': body,
+                },
+            )
+        return body
@@ -0,0 +1,142 @@
+import json
+import logging
+import sqlite3
+import threading
+
+
+class Journal:
+    '''
+    Records the state of tasks in a SQLite database, so that a run which is
+    interrupted can be restarted without redoing finished work.
+
+    Pass it as the `journal` argument of TaskScheduler.start. Only tasks
+    with a journal key (see FuncTask's @journal) are recorded; their kwargs
+    must be JSON serializable. When such a task is added again and the
+    journal says it was done, the scheduler skips it.
+
+    Writes are batched: records are queued in memory and written in one
+    transaction every @flush_interval seconds or @batch_size records, by a
+    background thread.
+    '''
+
+    STATE_QUEUED = 'queued'
+    STATE_RUNNING = 'running'
+    STATE_DONE = 'done'
+    STATE_FAILED = 'failed'
+
+    _states = {
+        'add': STATE_QUEUED,
+        'start': STATE_RUNNING,
+        'retry': STATE_QUEUED,
+        'done': STATE_DONE,
+        'failed': STATE_FAILED,
+    }
+
+    def __init__(self, filename, *, batch_size=1000, flush_interval=1):
+        self._filename = filename
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS tasks ('
+                    'name TEXT NOT NULL, kwargs TEXT NOT NULL, state TEXT NOT NULL, '
+                    'PRIMARY KEY (name, kwargs))'
+                )
+            self._states_old = {
+                (name, kwargs): state
+                for name, kwargs, state in conn.execute(
+                    'SELECT name, kwargs, state FROM tasks'
+                )
+            }
+        finally:
+            conn.close()
+
+        self._done = {k for k, v in self._states_old.items() if v == self.STATE_DONE}
+
+        self._cv = threading.Condition()
+        self._pending = []
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._func_write, daemon=True, name='journal'
+        )
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self._filename)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @staticmethod
+    def key(name, kwargs):
+        return name, json.dumps(kwargs, sort_keys=True, ensure_ascii=False)
+
+    def is_done(self, task):
+        with self._cv:
+            return task.journal_key in self._done
+
+    def unfinished(self):
+        '''
+        Return [(name, kwargs), ...] of the tasks which were recorded in
+        previous runs but not done
+        '''
+
+        return [
+            (name, json.loads(kwargs))
+            for (name, kwargs), state in self._states_old.items()
+            if state != self.STATE_DONE
+        ]
+
+    def record(self, event):
+        k = event.task.journal_key
+        if k is None:
+            return
+
+        state = self._states[event.kind]
+        with self._cv:
+            if state == self.STATE_DONE:
+                self._done.add(k)
+            self._pending.append(k + (state,))
+            if len(self._pending) >= self._batch_size:
+                self._cv.notify()
+
+    def _func_write(self):
+        conn = self._connect()
+        try:
+            while True:
+                with self._cv:
+                    if not self._closed and len(self._pending) < self._batch_size:
+                        self._cv.wait(self._flush_interval)
+                    pending, self._pending = self._pending, []
+                    closed = self._closed
+
+                if len(pending) > 0:
+                    with conn:
+                        conn.executemany(
+                            'INSERT OR REPLACE INTO tasks (name, kwargs, state) '
+                            'VALUES (?, ?, ?)',
+                            pending,
+                        )
+                    logging.debug('[Journal] %d records written' % len(pending))
+
+                if closed:
+                    break
+        finally:
+            conn.close()
+
+    def close(self):
+        with self._cv:
+            if self._closed:
+                return
+            self._closed = True
+            self._cv.notify()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
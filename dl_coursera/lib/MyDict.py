@@ -13,5 +13,11 @@ class MyDict(collections.UserDict):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def to_json(self):
-        return _MyDictJSONEncoder(indent=4).encode(self)
+    def to_json(self, indent=4):
+        return _MyDictJSONEncoder(indent=indent).encode(self)
+
+    @staticmethod
+    def from_json(s):
+        '''the inverse of to_json(), except that all objects become MyDicts'''
+
+        return json.loads(s, object_hook=MyDict)
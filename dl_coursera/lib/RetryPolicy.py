@@ -0,0 +1,85 @@
+import email.utils
+import time
+
+
+def http_status(exc):
+    '''the HTTP status code of the response carried by @exc, if any'''
+
+    return getattr(getattr(exc, 'response', None), 'status_code', None)
+
+
+def retry_after(exc):
+    '''
+    Seconds to wait before trying again, as told by the Retry-After header of
+    the response carried by @exc, or None
+    '''
+
+    headers = getattr(getattr(exc, 'response', None), 'headers', None)
+    if not headers:
+        return None
+
+    value = headers.get('Retry-After')
+    if value is None:
+        return None
+
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        t = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0, t - time.time())
+
+
+class RetryPolicy:
+    '''
+    Decides what to do with a task which raised an exception:
+
+    * ABORT if it is one of @abort_on. The scheduler then fails all the
+      remaining tasks without running them, and wait() raises the exception
+    * FAIL if it is one of @fail_on, or carries an HTTP response whose status
+      code is not in @retry_statuses
+    * RETRY if it is one of @retry_on, as long as the task has tries left
+    * FAIL otherwise
+    '''
+
+    RETRY = 'retry'
+    FAIL = 'fail'
+    ABORT = 'abort'
+
+    def __init__(
+        self,
+        *,
+        retry_on=(Exception,),
+        fail_on=(),
+        abort_on=(),
+        retry_statuses=(408, 425, 429, 500, 502, 503, 504)
+    ):
+        self._retry_on = tuple(retry_on)
+        self._fail_on = tuple(fail_on)
+        self._abort_on = tuple(abort_on)
+        self._retry_statuses = frozenset(retry_statuses)
+
+    def classify(self, exc):
+        if isinstance(exc, self._abort_on):
+            return RetryPolicy.ABORT
+
+        if isinstance(exc, self._fail_on):
+            return RetryPolicy.FAIL
+
+        status = http_status(exc)
+        if status is not None and status not in self._retry_statuses:
+            return RetryPolicy.FAIL
+
+        if isinstance(exc, self._retry_on):
+            return RetryPolicy.RETRY
+        return RetryPolicy.FAIL
+
+    def delay(self, exc, backoff_delay):
+        '''the delay before retrying: that of the backoff, unless the server asks for more'''
+
+        _ = retry_after(exc)
+        return backoff_delay if _ is None else max(backoff_delay, _)
@@ -0,0 +1,61 @@
+import threading
+
+import requests
+import requests.adapters
+
+
+class SessionPool:
+    '''
+    A drop-in replacement of requests.Session for code which runs on many
+    threads.
+
+    Each thread gets its own Session, but all of them share the cookies and
+    one HTTPAdapter, i.e. one pool of keep-alive connections per host. The
+    connections opened while crawling are reused while downloading, and a
+    thread is never handed a Session which another thread is using.
+
+    @pool_maxsize: the number of connections kept per host. It should be the
+        maximum number of workers which may request the same host at once
+    @adapter: an HTTPAdapter to use instead of a new one, e.g. that of
+        another SessionPool. Then @pool_maxsize and @pool_connections are
+        ignored
+    '''
+
+    def __init__(self, *, pool_maxsize=10, pool_connections=10, adapter=None):
+        self.cookies = requests.cookies.RequestsCookieJar()
+        if adapter is None:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_connections, pool_maxsize=pool_maxsize
+            )
+        self._adapter = adapter
+
+        self._local = threading.local()
+
+    def session(self):
+        '''the Session of the current thread'''
+
+        sess = getattr(self._local, 'sess', None)
+        if sess is None:
+            sess = requests.Session()
+            sess.cookies = self.cookies
+            sess.mount('https://', self._adapter)
+            sess.mount('http://', self._adapter)
+
+            self._local.sess = sess
+        return sess
+
+    def get(self, url, **kwargs):
+        return self.session().get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session().post(url, **kwargs)
+
+    def close(self):
+        self._local = threading.local()
+        self._adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,146 @@
+import heapq
+import itertools
+
+
+class TokenBucket:
+    def __init__(self, *, rate, burst=None, now):
+        '''
+        @rate: tokens added per second
+        @burst: maximum number of tokens. Default: max(1, rate)
+        '''
+
+        self._rate = rate
+        self._burst = max(1, rate) if burst is None else burst
+        self._tokens = self._burst
+        self._last = now
+
+    def _refill(self, now):
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def delay(self, now):
+        '''seconds to wait until a token is available'''
+
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self._rate
+
+    def take(self, now):
+        self._refill(now)
+        self._tokens -= 1
+
+
+class _Limit:
+    def __init__(self, *, max_inflight=None, rate=None, burst=None, now):
+        self.max_inflight = max_inflight
+        self.bucket = (
+            None if rate is None else TokenBucket(rate=rate, burst=burst, now=now)
+        )
+
+
+class TaskQueue:
+    '''
+    A priority queue of tasks partitioned by task key (e.g. a host name).
+
+    Each key may be given a maximum number of in-flight tasks and a
+    requests-per-second budget. pop() returns the highest-priority task
+    among the keys that are not blocked, so tasks of a saturated key do not
+    hold up the others.
+
+    Tasks of the same priority are popped in the order they were put. Heaps
+    hold (rank, seq, task) tuples, so that ordering is done by comparing
+    integers rather than by calling Task.__lt__.
+
+    Tasks put with a delay wait in a separate heap ordered by deadline and
+    join the others once the deadline passes.
+
+    TaskQueue does no locking or waiting itself; the schedulers do.
+    '''
+
+    def __init__(self):
+        self._heaps = {}
+        self._limits = {}
+        self._inflight = {}
+        self._n = 0
+
+        self._delayed = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return self._n + len(self._delayed)
+
+    @property
+    def n_ready(self):
+        '''the number of tasks which are not delayed'''
+        return self._n
+
+    def set_limit(self, key, *, max_inflight=None, rate=None, burst=None, now):
+        self._limits[key] = _Limit(
+            max_inflight=max_inflight, rate=rate, burst=burst, now=now
+        )
+
+    def put(self, task, *, delay=0, now=None):
+        if delay > 0:
+            heapq.heappush(self._delayed, (now + delay, next(self._seq), task))
+            return
+
+        heap = self._heaps.get(task.key)
+        if heap is None:
+            heap = self._heaps[task.key] = []
+        heapq.heappush(heap, (task._rank, next(self._seq), task))
+        self._n += 1
+
+    def pop(self, now):
+        '''
+        Return (task, None) if some task can run now. Otherwise return
+        (None, timeout), where timeout is the number of seconds after which
+        a rate-limited key unblocks or a delayed task is due, or None if only
+        put()/release() can unblock a key.
+        '''
+
+        while len(self._delayed) > 0 and self._delayed[0][0] <= now:
+            self.put(heapq.heappop(self._delayed)[2])
+
+        best_key = best_heap = None
+        timeout = None
+        if len(self._delayed) > 0:
+            timeout = self._delayed[0][0] - now
+
+        for key, heap in self._heaps.items():
+            if len(heap) == 0:
+                continue
+
+            limit = self._limits.get(key)
+            if limit is not None:
+                if (
+                    limit.max_inflight is not None
+                    and self._inflight.get(key, 0) >= limit.max_inflight
+                ):
+                    continue
+
+                if limit.bucket is not None:
+                    delay = limit.bucket.delay(now)
+                    if delay > 0:
+                        if timeout is None or delay < timeout:
+                            timeout = delay
+                        continue
+
+            if best_heap is None or heap[0] < best_heap[0]:
+                best_key, best_heap = key, heap
+
+        if best_heap is None:
+            return None, timeout
+
+        task = heapq.heappop(best_heap)[2]
+        self._n -= 1
+
+        limit = self._limits.get(best_key)
+        if limit is not None and limit.bucket is not None:
+            limit.bucket.take(now)
+        self._inflight[best_key] = self._inflight.get(best_key, 0) + 1
+
+        return task, None
+
+    def release(self, task):
+        self._inflight[task.key] -= 1
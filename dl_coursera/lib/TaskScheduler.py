@@ -1,12 +1,60 @@
+import concurrent.futures
 import math
-import queue
+import multiprocessing
 import threading
+import time
 import traceback
 import logging
 import functools
+import inspect
+import random
 import re
 
 from .misc import format_dict
+from .TaskQueue import TaskQueue
+from .Tracer import TaskEvent
+from .Journal import Journal
+from .RetryPolicy import RetryPolicy
+
+
+@functools.lru_cache(maxsize=None)
+def _is_priority(priority):
+    return Task._re_priority.match(priority) is not None
+
+
+@functools.lru_cache(maxsize=None)
+def _rank(priority):
+    """
+    Map @priority to an integer which orders like the strings do, with the
+    highest priority first
+    """
+
+    n = 0
+    for c in priority.ljust(7, '@'):
+        n = n * 27 + ord(c) - ord('@')
+    return -n
+
+
+def _unrank(rank):
+    n = -rank
+    s = ''
+    while n > 0:
+        n, c = divmod(n, 27)
+        if c > 0 or len(s) > 0:
+            s = chr(c + ord('@')) + s
+    return s
+
+
+def mp_context():
+    '''the context of process pools. See TaskScheduler._get_process_pool'''
+
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return None
+
+
+# guards the creation of the futures of tasks, see Task.future
+_future_lock = threading.Lock()
 
 
 class Task:
@@ -18,75 +66,275 @@ class Task:
     class ShouldNotRun(Exception):
         pass
 
-    def __init__(self, *, priority, ttl, _is_special=False):
+    class DependencyFailed(Exception):
+        pass
+
+    # there may be a million tasks queued, so keep them small
+    __slots__ = (
+        '_rank',
+        '_ttl',
+        '_n_try',
+        'key',
+        'backoff',
+        'retry_policy',
+        '_future',
+        'journal_key',
+    )
+
+    def __init__(
+        self,
+        *,
+        priority,
+        ttl,
+        key=None,
+        backoff=None,
+        retry_policy=None,
+        _is_special=False
+    ):
         """
         @priority: should be a string that matches the following Python regular expression: `[A-Z]{1, 6}`
         @ttl: maximum times to try
+        @key: the resource (e.g. a host name) the task uses. See TaskScheduler.set_limit
+        @backoff: how long to wait before trying again. Default: that of the scheduler
+        @retry_policy: which errors are worth trying again. Default: that of the scheduler
         """
 
-        self._priority = priority
+        if not _is_special:
+            assert _is_priority(priority)
+
+        self._rank = _rank(priority)
         self._ttl = ttl
+        self._n_try = 0
+        self.key = key
+        self.backoff = backoff
+        self.retry_policy = retry_policy
+        # the Future, or how to settle it once it is created, see future
+        self._future = None
 
-        if not _is_special:
-            assert Task._re_priority.match(self._priority) is not None
+        # (name, kwargs) identifying the task in a Journal, or None
+        self.journal_key = None
 
     def __lt__(self, other):
-        return self._priority > other._priority
+        return self._rank < other._rank
 
     def should_run(self):
         return self._ttl > 0
 
-    def run(self):
+    # whether go() should be given an executor to run the task in another process
+    in_process = False
+
+    def run(self, *args):
         if not self.should_run():
             raise Task.ShouldNotRun(self)
         else:
             self._ttl -= 1
-            self.go()
+            self._n_try += 1
+            return self.go(*args)
 
-    def go():
+    def go(self):
         pass
 
+    def is_coroutine(self):
+        return False
+
+    @property
+    def n_try(self):
+        return self._n_try
+
+    @property
+    def future(self):
+        '''a concurrent.futures.Future of the result, created when first asked for'''
+
+        with _future_lock:
+            if not isinstance(self._future, concurrent.futures.Future):
+                outcome, self._future = self._future, concurrent.futures.Future()
+                if outcome is not None:
+                    name, args = outcome
+                    getattr(self._future, name)(*args)
+            return self._future
+
+    def _settle(self, name, *args):
+        '''settle the future by calling its method @name with @args'''
+
+        with _future_lock:
+            if self._future is None:
+                self._future = (name, args)
+                return
+        getattr(self._future, name)(*args)
+
+    @property
+    def priority(self):
+        return _unrank(self._rank)
+
 
 _shutdown_task = Task(priority=Task.HIGHEST_PRIO, ttl=1, _is_special=True)
+_retire_task = Task(priority=Task.HIGHEST_PRIO, ttl=1, _is_special=True)
+
+
+class TaskHandle:
+    """
+    What add_task returns: a task seen as a concurrent.futures.Future of its
+    result.
+
+    A Future, which holds a lock and a condition variable, takes more memory
+    than a queued task. It is created once the handle is used, e.g. waited
+    on or passed as depends_on, so the tasks whose results are never asked
+    for (e.g. downloads) do without one.
+    """
+
+    __slots__ = ('_task',)
+
+    def __init__(self, task):
+        self._task = task
+
+    @property
+    def future(self):
+        return self._task.future
+
+    def done(self):
+        return self.future.done()
+
+    def cancelled(self):
+        return self.future.cancelled()
+
+    def cancel(self):
+        return self.future.cancel()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+    def exception(self, timeout=None):
+        return self.future.exception(timeout)
+
+    def add_done_callback(self, fn):
+        self.future.add_done_callback(fn)
 
 
 class FuncTask(Task):
+    __slots__ = ('_func', '_kwargs', '_format_kwargs', '_desc')
+
     def __init__(
-        self, *, priority='A', ttl=1, func, kwargs=None, format_kwargs=None, desc=None
+        self,
+        *,
+        priority='A',
+        ttl=1,
+        key=None,
+        backoff=None,
+        retry_policy=None,
+        func,
+        kwargs=None,
+        format_kwargs=None,
+        desc=None,
+        journal=False
     ):
-        super().__init__(priority=priority, ttl=ttl)
+        """
+        @key: either the key or a function which computes the key from @kwargs
+        @journal: whether to record the task in the Journal of the scheduler,
+            by @desc or the name of @func and @kwargs
+        """
 
         self._func = func
         self._kwargs = {} if kwargs is None else kwargs
 
-        self._desc = 'priority=%s, ttl=%s' % (priority, ttl)
-        self._desc = '%s. %s' % (self._desc, desc or func.__name__)
+        if callable(key):
+            key = key(self._kwargs)
+        super().__init__(
+            priority=priority,
+            ttl=ttl,
+            key=key,
+            backoff=backoff,
+            retry_policy=retry_policy,
+        )
 
-        _s = (format_kwargs or format_dict)(kwargs)
-        if len(_s) > 0:
-            self._desc = '%s: %s' % (self._desc, _s)
+        if journal:
+            self.journal_key = Journal.key(desc or func.__name__, self._kwargs)
+
+        # the description is built by __str__, as most tasks are never printed
+        # while queued
+        self._format_kwargs = format_kwargs
+        self._desc = desc
 
     @property
     def kwargs(self):
         return self._kwargs
 
     def __str__(self):
-        return self._desc
+        _desc = 'priority=%s, ttl=%s' % (self.priority, self._ttl + self._n_try)
+        _desc = '%s. %s' % (_desc, self._desc or self._func.__name__)
+
+        _s = (self._format_kwargs or format_dict)(self._kwargs)
+        if len(_s) > 0:
+            _desc = '%s: %s' % (_desc, _s)
+        return _desc
 
     def go(self):
-        self._func(**self._kwargs)
+        return self._func(**self._kwargs)
+
+    def is_coroutine(self):
+        return inspect.iscoroutinefunction(self._func)
+
+
+class ProcessFuncTask(FuncTask):
+    """
+    A FuncTask which runs in the process pool of the scheduler, for CPU-bound work.
+
+    @func, @kwargs and the result must be picklable, so @func should be a
+    module-level function.
+    """
+
+    __slots__ = ()
+
+    in_process = True
+
+    def go(self, executor):
+        return executor.submit(self._func, **self._kwargs)
+
+
+class Backoff:
+    def __init__(self, *, base=1, factor=2, max_delay=60, jitter=0.5):
+        """
+        The delay before the n-th retry is min(@max_delay, @base * @factor ** (n - 1)),
+        minus a random part of it which is at most @jitter of it.
+        """
+
+        self._base = base
+        self._factor = factor
+        self._max_delay = max_delay
+        self._jitter = jitter
+
+    def delay(self, n_try):
+        d = min(self._max_delay, self._base * self._factor ** (n_try - 1))
+        return d * (1 - self._jitter * random.random())
 
 
 class TaskScheduler:
+    is_async = False
+
     def __init__(self):
         self._init()
 
     def _init(self):
-        self._q = queue.PriorityQueue()
+        self._q = TaskQueue()
+        self._n_unfinished = 0
+        self._lock = threading.Lock()
+        self._cv_work = threading.Condition(self._lock)
+        # workers waiting on _cv_work. Notifying is skipped without them, as
+        # it costs about a fifth of add_task
+        self._n_idle = 0
+        self._cv_join = threading.Condition(self._lock)
+
         self._threads = []
+        self._WorkerFactory = None
+        self._worker_name_width = 1
 
         self._n_worker = 0
         self._n_worker_lock = threading.Lock()
+        self._n_retire = 0
+        self._worker_seq = 0
+
+        self._autoscaler = None
+        self._autoscaler_thread = None
+        self._autoscaler_stop = threading.Event()
 
         self._shutdown_event = threading.Event()
 
@@ -96,46 +344,246 @@ class TaskScheduler:
         self._threading_local = threading.local()
         self._threading_local.task = None
 
-        self._hook_add = None
-        self._hook_done = None
-        self._hook_retry = None
+        self._hooks = {}
+        self._tracer = None
+        self._journal = None
 
-    def add_task(self, task):
-        if self._hook_add:
-            self._hook_add()
-        self._q.put(task)
+        self._backoff = None
+        self._retry_policy = None
+        self._aborted = None
 
-    def retry_task(self, task):
-        if self._hook_retry:
-            self._hook_retry()
-        self._q.put(task)
+        self._n_process = None
+        self._process_pool = None
+        self._process_pool_lock = threading.Lock()
+
+    def add_task(self, task, *, depends_on=None):
+        """
+        Return a TaskHandle, which works as a concurrent.futures.Future of the
+        result of @task. If @task returns such a future or handle itself, the
+        returned one follows that one.
+
+        @depends_on: futures or handles returned by add_task. @task is held
+            back until all of them are done, and fails without running if any
+            of them fails
+        """
+
+        if self._journal is not None and self._journal.is_done(task):
+            logging.info('[Skipped] %s', task)
+            self._emit('done', task)
+            task._settle('set_result', None)
+            return TaskHandle(task)
+
+        self._emit('add', task)
+
+        if not depends_on:
+            self._put(task)
+            return TaskHandle(task)
+
+        self._hold()
+
+        n_pending = len(depends_on)
+        lock = threading.Lock()
+
+        def _on_dependency_done(_):
+            nonlocal n_pending
+            with lock:
+                n_pending -= 1
+                if n_pending > 0:
+                    return
+            self._release(task, depends_on)
+
+        for _ in depends_on:
+            _.add_done_callback(_on_dependency_done)
+
+        return TaskHandle(task)
+
+    def _release(self, task, depends_on):
+        for _ in depends_on:
+            if _.cancelled() or _.exception() is not None:
+                exc = Task.DependencyFailed(task)
+                tb_msg = 'a dependency failed: %r' % (
+                    _.exception() if not _.cancelled() else 'cancelled'
+                )
+                self._fail(task, exc, tb_msg)
+                self._unhold()
+                return
+
+        self._put(task, held=True)
+
+    def retry_task(self, task, delay=0, error=None):
+        self._emit('retry', task, in_worker=True, error=error, delay=delay)
+        self._put(task, delay)
+
+    def _emit(self, kind, task, *, in_worker=False, **kwargs):
+        '''@in_worker: whether to name the worker the event happens in'''
+
+        hook = self._hooks.get(kind)
+        if hook is None and self._tracer is None and self._journal is None:
+            return
+
+        if in_worker:
+            kwargs['worker'] = self._worker_name()
+        event = TaskEvent(kind, task, time=time.monotonic(), **kwargs)
+        if self._tracer is not None:
+            self._tracer.record(event)
+        if self._journal is not None:
+            self._journal.record(event)
+        if hook is not None:
+            hook(event)
+
+    def _set_hooks(self, *, tracer=None, journal=None, **hooks):
+        self._hooks = {k[len('hook_') :]: v for k, v in hooks.items() if v is not None}
+        self._tracer = tracer
+        self._journal = journal
+
+    def _worker_name(self):
+        return threading.current_thread().name
+
+    def _retry_delay(self, task):
+        backoff = task.backoff or self._backoff
+        return 0 if backoff is None else backoff.delay(task.n_try)
+
+    def abort(self, exc):
+        """
+        Fail all the remaining tasks without running them, and make wait()
+        raise @exc
+        """
+
+        logging.error('[Abort] %r' % exc)
+        with self._failures_lock:
+            if self._aborted is None:
+                self._aborted = exc
+
+    def set_limit(self, key, *, max_inflight=None, rate=None, burst=None):
+        """
+        Limit tasks with the given key.
+
+        @max_inflight: maximum number of such tasks running at the same time
+        @rate: maximum number of such tasks started per second
+        @burst: maximum number of such tasks started at once. Default: max(1, @rate)
+        """
+
+        with self._lock:
+            self._q.set_limit(
+                key,
+                max_inflight=max_inflight,
+                rate=rate,
+                burst=burst,
+                now=time.monotonic(),
+            )
+            self._cv_work.notify_all()
+
+    def _put(self, task, delay=0, held=False):
+        with self._lock:
+            self._q.put(task, delay=delay, now=time.monotonic())
+            if not held:
+                self._n_unfinished += 1
+            if self._n_idle > 0:
+                self._cv_work.notify()
+
+    def _hold(self):
+        with self._lock:
+            self._n_unfinished += 1
+
+    def _unhold(self):
+        with self._lock:
+            self._n_unfinished -= 1
+            if self._n_unfinished == 0:
+                self._cv_join.notify_all()
+
+    def _get(self):
+        with self._lock:
+            while True:
+                if self._n_retire > 0:
+                    self._n_retire -= 1
+                    return _retire_task
+
+                task, timeout = self._q.pop(time.monotonic())
+                if task is not None:
+                    return task
+
+                self._n_idle += 1
+                self._cv_work.wait(timeout)
+                self._n_idle -= 1
+
+    def _task_done(self, task):
+        with self._lock:
+            self._q.release(task)
+            self._n_unfinished -= 1
+            if self._n_idle > 0:
+                self._cv_work.notify()
+
+            if self._n_unfinished == 0:
+                self._cv_join.notify_all()
+
+    def _join(self):
+        with self._lock:
+            while self._n_unfinished > 0:
+                self._cv_join.wait()
 
     def wait(self):
-        self._q.join()
+        """
+        Wait until all the tasks are done, and return the failures. Raise the
+        exception which aborted the run, if any.
+        """
+
+        self._join()
 
         with self._failures_lock:
             res, self._failures[:] = self._failures[:], []
+            aborted, self._aborted = self._aborted, None
+
+        if aborted is not None:
+            # the traceback holds frames of the workers, which must not be
+            # cleared by the caller
+            raise aborted.with_traceback(None)
 
         if len(res) > 0:
             logging.error('#Failed: %d' % len(res))
         return res
 
     def shutdown(self):
-        assert len(self._threads) == self._n_worker
+        self._stop_autoscaler()
 
-        if len(self._threads) == 0:
+        with self._lock:
+            self._n_retire = 0
+
+        # workers are added and retired under the lock
+        with self._n_worker_lock:
+            assert len(self._threads) == self._n_worker
+            n_worker = self._n_worker
+
+        if n_worker == 0:
             return
 
-        for _ in range(len(self._threads)):
-            self.add_task(_shutdown_task)
+        for _ in range(n_worker):
+            self._put(_shutdown_task)
 
         self._shutdown_event.wait()
 
-        for _ in self._threads:
+        for _ in list(self._threads):
             _.join()
 
+        self._shutdown_process_pool()
         self._init()
 
+    def _get_process_pool(self):
+        with self._process_pool_lock:
+            if self._process_pool is None:
+                # forking a process which runs many threads may copy a lock
+                # which another thread holds (e.g. that of a logging handler),
+                # leaving the child blocked forever. Worker processes are
+                # forked from a single-threaded server instead
+                self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self._n_process,
+                    mp_context=mp_context(),
+                )
+            return self._process_pool
+
+    def _shutdown_process_pool(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+
     def _onshutdown(self):
         with self._n_worker_lock:
             self._n_worker -= 1
@@ -143,27 +591,129 @@ class TaskScheduler:
             if self._n_worker == 0:
                 self._shutdown_event.set()
 
+    def _onretire(self):
+        with self._n_worker_lock:
+            self._n_worker -= 1
+            self._threads.remove(threading.current_thread())
+
+            if self._n_worker == 0:
+                self._shutdown_event.set()
+
+    def _add_worker(self):
+        with self._n_worker_lock:
+            self._worker_seq += 1
+            t = self._WorkerFactory(
+                target=self._func_work,
+                daemon=True,
+                name='%%0%dd' % self._worker_name_width % self._worker_seq,
+            )
+            self._threads.append(t)
+            self._n_worker += 1
+        t.start()
+
+    def n_worker(self):
+        '''the number of workers, not counting those being retired'''
+
+        with self._lock:
+            return self._n_worker - self._n_retire
+
+    def resize(self, n_worker):
+        with self._lock:
+            n = n_worker - (self._n_worker - self._n_retire)
+            if n < 0:
+                self._n_retire -= n
+                self._cv_work.notify_all()
+                return
+
+            _ = min(n, self._n_retire)
+            self._n_retire -= _
+            n -= _
+
+        for _ in range(n):
+            self._add_worker()
+
+    def _n_queued(self):
+        with self._lock:
+            return self._q.n_ready
+
+    def _start_autoscaler(self, autoscaler):
+        self._autoscaler = autoscaler
+        self._autoscaler_thread = threading.Thread(
+            target=self._func_autoscale, daemon=True, name='autoscaler'
+        )
+        self._autoscaler_thread.start()
+
+    def _stop_autoscaler(self):
+        if self._autoscaler_thread is not None:
+            self._autoscaler_stop.set()
+            self._autoscaler_thread.join()
+
+    def _func_autoscale(self):
+        while not self._autoscaler_stop.wait(self._autoscaler.interval):
+            self.resize(
+                self._autoscaler.decide(
+                    n_worker=self.n_worker(), n_queued=self._n_queued()
+                )
+            )
+
+    def _record(self, t0, exc=None):
+        if self._autoscaler is not None:
+            self._autoscaler.record(latency=time.monotonic() - t0, exc=exc)
+
     def start(
         self,
         *,
         n_worker=3,
         WorkerFactory=threading.Thread,
         hook_add=None,
+        hook_start=None,
         hook_done=None,
-        hook_retry=None
+        hook_retry=None,
+        hook_failed=None,
+        tracer=None,
+        journal=None,
+        backoff=Backoff(),
+        retry_policy=RetryPolicy(),
+        n_process=None,
+        autoscaler=None
     ):
-        n = math.floor(math.log10(n_worker)) + 1
-        for i in range(1, n_worker + 1):
-            t = WorkerFactory(
-                target=self._func_work, daemon=True, name='%%0%dd' % n % i
-            )
-            t.start()
-            self._threads.append(t)
+        """
+        @hook_*: functions called with a TaskEvent when a task is added,
+            started, done, to be retried or failed
+        @tracer: a Tracer which records every TaskEvent
+        @retry_policy: which errors are worth trying again, and which abort the run
+        @journal: a Journal which records the tasks added with journal=True,
+            and makes them skipped if they were done in a previous run
+        @n_process: size of the process pool for ProcessFuncTask. Default: number of CPUs
+        @autoscaler: an AutoScaler which adds or retires workers as the
+            scheduler runs. @n_worker is then the initial number of workers
+        """
 
-        self._n_worker = n_worker
-        self._hook_add = hook_add
-        self._hook_done = hook_done
-        self._hook_retry = hook_retry
+        self._set_hooks(
+            hook_add=hook_add,
+            hook_start=hook_start,
+            hook_done=hook_done,
+            hook_retry=hook_retry,
+            hook_failed=hook_failed,
+            tracer=tracer,
+            journal=journal,
+        )
+        self._backoff = backoff
+        self._retry_policy = retry_policy
+        self._n_process = n_process
+
+        n_worker_max = n_worker
+        if autoscaler is not None:
+            n_worker = autoscaler.clamp(n_worker)
+            n_worker_max = autoscaler.max_worker
+
+        self._WorkerFactory = WorkerFactory
+        self._worker_name_width = math.floor(math.log10(n_worker_max)) + 1
+        for _ in range(n_worker):
+            self._add_worker()
+
+        if autoscaler is not None:
+            self._start_autoscaler(autoscaler)
 
     def register_task(self, func=None, *, FuncTaskFactory=FuncTask, **_kwargs):
         if func is None:
@@ -172,8 +722,11 @@ class TaskScheduler:
             )
 
         @functools.wraps(func)
-        def _func(**kwargs):
-            self.add_task(FuncTaskFactory(func=func, kwargs=kwargs, **_kwargs))
+        def _func(*, depends_on=None, **kwargs):
+            return self.add_task(
+                FuncTaskFactory(func=func, kwargs=kwargs, **_kwargs),
+                depends_on=depends_on,
+            )
 
         return _func
 
@@ -185,7 +738,7 @@ class TaskScheduler:
         logging.debug('started')
 
         while True:
-            task = self._q.get()
+            task = self._get()
             self._threading_local.task = task
 
             if task is _shutdown_task:
@@ -193,23 +746,80 @@ class TaskScheduler:
                 logging.debug('shutdowned')
                 break
 
+            if task is _retire_task:
+                self._onretire()
+                logging.debug('retired')
+                break
+
+            if self._aborted is not None:
+                self._fail(task, self._aborted, 'the run was aborted')
+                self._task_done(task)
+                continue
+
+            t0 = time.monotonic()
             try:
-                logging.info('[.....] %s' % task)
-                task.run()
-                if self._hook_done:
-                    self._hook_done()
-            except Exception:
-                tb_msg = traceback.format_exc()
-                if task.should_run():
-                    self.retry_task(task)
-                    logging.warning('[Retry later] %s\n%s' % (task, tb_msg))
+                logging.info('[.....] %s', task)
+                self._emit('start', task, in_worker=True)
+                if task.in_process:
+                    res = task.run(self._get_process_pool()).result()
                 else:
-                    self._add_failure((task, tb_msg))
-                    logging.error('[Failed] %s\n%s' % (task, tb_msg))
+                    res = task.run()
+            except Exception as e:
+                self._record(t0, e)
+                self._on_error(task, e)
             else:
-                logging.info('[Done.] %s' % task)
+                self._record(t0)
+                self._on_done(task, res)
+
+            self._task_done(task)
+
+    def _on_done(self, task, res):
+        logging.info('[Done.] %s', task)
+        self._emit('done', task, in_worker=True)
+
+        if isinstance(res, TaskHandle):
+            res = res.future
+        if not isinstance(res, concurrent.futures.Future):
+            task._settle('set_result', res)
+            return
+
+        # a task may return the future of another task, whose result then
+        # becomes its own
+        self._hold()
+
+        def _chain(_):
+            if _.cancelled():
+                task._settle('cancel')
+            elif _.exception() is not None:
+                task._settle('set_exception', _.exception())
+            else:
+                task._settle('set_result', _.result())
+            self._unhold()
+
+        res.add_done_callback(_chain)
+
+    def _on_error(self, task, exc):
+        tb_msg = traceback.format_exc()
+
+        policy = task.retry_policy or self._retry_policy
+        action = RetryPolicy.RETRY if policy is None else policy.classify(exc)
+        if action == RetryPolicy.ABORT:
+            self.abort(exc)
+
+        if action == RetryPolicy.RETRY and task.should_run():
+            delay = self._retry_delay(task)
+            if policy is not None:
+                delay = policy.delay(exc, delay)
+            logging.warning('[Retry in %.1fs] %s\n%s' % (delay, task, tb_msg))
+            self.retry_task(task, delay, exc)
+        else:
+            self._fail(task, exc, tb_msg, in_worker=True)
 
-            self._q.task_done()
+    def _fail(self, task, exc, tb_msg, in_worker=False):
+        self._add_failure((task, tb_msg))
+        logging.error('[Failed] %s\n%s' % (task, tb_msg))
+        self._emit('failed', task, in_worker=in_worker, error=exc)
+        task._settle('set_exception', exc)
 
     def current_task(self):
         return self._threading_local.task
@@ -0,0 +1,192 @@
+import json
+import threading
+import time
+
+
+class TaskEvent:
+    '''
+    Something that happened to a task, passed to the hooks of a TaskScheduler.
+
+    @kind: one of 'add', 'start', 'done', 'retry' and 'failed'
+    @time: time.monotonic() when it happened
+    @worker: name of the worker, for 'start', 'done', 'retry' and 'failed'
+    @error: the exception, for 'retry' and 'failed'
+    @delay: seconds before the task is tried again, for 'retry'
+    '''
+
+    def __init__(self, kind, task, *, time, worker=None, error=None, delay=None):
+        self.kind = kind
+        self.task = task
+        self.time = time
+        self.worker = worker
+        self.error = error
+        self.delay = delay
+
+    @property
+    def attempt(self):
+        '''number of tries so far, including the current one'''
+        return self.task.n_try
+
+    @property
+    def priority(self):
+        return self.task.priority
+
+    def __str__(self):
+        return '%s: %s' % (self.kind, self.task)
+
+
+class _Span:
+    def __init__(self, *, name, worker, t_enqueue, t_start, t_end, event):
+        self.name = name
+        self.worker = worker
+        self.t_enqueue = t_enqueue
+        self.t_start = t_start
+        self.t_end = t_end
+        self.attempt = event.attempt
+        self.priority = event.priority
+        self.key = event.task.key
+        self.outcome = event.kind
+        self.error = None if event.error is None else repr(event.error)
+
+
+class Tracer:
+    '''
+    Records a span for every try of every task. Pass it as the `tracer`
+    argument of TaskScheduler.start, then dump() it as a Chrome trace-event
+    JSON file, which can be loaded in Perfetto (https://ui.perfetto.dev) or
+    chrome://tracing.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+
+        self._t_enqueue = {}
+        self._t_start = {}
+        self._spans = []
+        self._instants = []
+
+    def record(self, event):
+        _id = id(event.task)
+
+        with self._lock:
+            if event.kind == 'add':
+                self._t_enqueue[_id] = event.time
+            elif event.kind == 'start':
+                self._t_start[_id] = event.time
+            else:
+                t_start = self._t_start.pop(_id, None)
+                if t_start is None:
+                    # e.g. a task whose dependency failed
+                    self._instants.append(event)
+                else:
+                    self._spans.append(
+                        _Span(
+                            name=str(event.task),
+                            worker=event.worker,
+                            t_enqueue=self._t_enqueue.pop(_id, t_start),
+                            t_start=t_start,
+                            t_end=event.time,
+                            event=event,
+                        )
+                    )
+
+                if event.kind == 'retry':
+                    self._t_enqueue[_id] = event.time + event.delay
+                else:
+                    self._t_enqueue.pop(_id, None)
+
+    @property
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    def _us(self, t):
+        return round((t - self._t0) * 1e6)
+
+    def to_chrome_trace(self):
+        with self._lock:
+            spans = list(self._spans)
+            instants = list(self._instants)
+
+        tids = {}
+
+        def _tid(worker):
+            if worker not in tids:
+                tids[worker] = len(tids) + 1
+            return tids[worker]
+
+        events = []
+        for _ in sorted(spans, key=lambda _: _.t_start):
+            events.append(
+                {
+                    'name': _.name,
+                    'cat': _.outcome,
+                    'ph': 'X',
+                    'pid': 1,
+                    'tid': _tid(_.worker),
+                    'ts': self._us(_.t_start),
+                    'dur': self._us(_.t_end) - self._us(_.t_start),
+                    'args': {
+                        'attempt': _.attempt,
+                        'priority': _.priority,
+                        'key': _.key,
+                        'outcome': _.outcome,
+                        'queued_us': self._us(_.t_start) - self._us(_.t_enqueue),
+                        'error': _.error,
+                    },
+                }
+            )
+
+        for _ in instants:
+            events.append(
+                {
+                    'name': str(_.task),
+                    'cat': _.kind,
+                    'ph': 'i',
+                    's': 'p',
+                    'pid': 1,
+                    'tid': 0,
+                    'ts': self._us(_.time),
+                    'args': {'error': repr(_.error)},
+                }
+            )
+
+        # the number of queued and running tasks over time
+        deltas = []
+        for _ in spans:
+            deltas += [
+                (_.t_enqueue, 1, 0),
+                (_.t_start, -1, 1),
+                (_.t_end, 0, -1),
+            ]
+        n_queued = n_running = 0
+        for t, d_queued, d_running in sorted(deltas, key=lambda _: _[0]):
+            n_queued += d_queued
+            n_running += d_running
+            events.append(
+                {
+                    'name': 'tasks',
+                    'ph': 'C',
+                    'pid': 1,
+                    'ts': self._us(t),
+                    'args': {'queued': n_queued, 'running': n_running},
+                }
+            )
+
+        for worker, tid in tids.items():
+            events.append(
+                {
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': 1,
+                    'tid': tid,
+                    'args': {'name': 'worker %s' % worker},
+                }
+            )
+
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, filename):
+        with open(filename, 'w', encoding='UTF-8') as ofs:
+            json.dump(self.to_chrome_trace(), ofs)
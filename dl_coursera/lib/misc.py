@@ -1,11 +1,23 @@
+import collections
+import contextlib
 import os
 import tempfile
+import threading
 
 
 def format_dict(d):
     return ', '.join(['%s=%s' % (k, v) for k, v in d.items()])
 
 
+def dir_user_cache():
+    '''where the current user's caches of dl_coursera are kept'''
+
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache'
+    )
+    return os.path.join(root, 'dl_coursera')
+
+
 def change_ext(filename, ext):
     return os.path.splitext(filename)[0] + ('' if ext == '' else '.' + ext)
 
@@ -21,6 +33,66 @@ def url_basename(url, *, _d={}):
     return match.group(1)
 
 
+@contextlib.contextmanager
+def atomic_filename(filename):
+    '''
+    Yield a temporary filename next to @filename, which replaces @filename
+    once the block is done, so that no reader sees a file half written. The
+    temporary file is unique to the process and thread
+    '''
+
+    tmp = '%s.%d.%d.tmp' % (filename, os.getpid(), threading.get_ident())
+    try:
+        yield tmp
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    os.replace(tmp, filename)
+
+
+def write_atomically(filename, data):
+    '''write the bytes @data to @filename, see atomic_filename'''
+
+    with atomic_filename(filename) as tmp:
+        with open(tmp, 'wb') as ofs:
+            ofs.write(data)
+
+
+class LRU:
+    '''
+    A thread-safe mapping of at most @max_size items, which drops the least
+    recently used one when it is full
+    '''
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._d = collections.OrderedDict()
+
+    def get(self, key):
+        '''the value of @key, or None'''
+
+        with self._lock:
+            value = self._d.get(key)
+            if value is not None:
+                self._d.move_to_end(key)
+            return value
+
+    def __iter__(self):
+        '''the keys, from the least recently used one'''
+
+        with self._lock:
+            return iter(list(self._d))
+
+    def put(self, key, value):
+        with self._lock:
+            self._d[key] = value
+            self._d.move_to_end(key)
+            while len(self._d) > self._max_size:
+                self._d.popitem(last=False)
+
+
 class TmpFile:
     def __init__(self, suffix=None, prefix=None, dir=None):
         self._suffix = suffix
@@ -40,9 +112,14 @@ class TmpFile:
 
 
 def get_latest_app_version():
+    '''the latest version on PyPI, or None if it can not be told, e.g. offline'''
+
     import requests
 
-    resp = requests.get('https://pypi.org/pypi/dl-coursera/json')
-    d = resp.json()
+    try:
+        resp = requests.get('https://pypi.org/pypi/dl-coursera/json', timeout=5)
+        d = resp.json()
+    except (requests.RequestException, ValueError):
+        return None
 
     return sorted(d['releases'].keys())[-1]
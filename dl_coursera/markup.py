@@ -1,82 +1,117 @@
+import hashlib
 import logging
-import copy
 import re
 
 from urllib.parse import quote
 
-import bs4
-
 import jinja2
 
+from lxml import etree
+
 from .resource import load_resource
 from .define import URL_ROOT
 
-
-def _is_root(e):
-    return e.parent is None
+# version of the HTML that CML is converted to. Bump it when the conversion
+# changes, so that pages kept by RenderCache are rendered again
+MARKUP_VERSION = 1
 
 
-def _is_tag(e):
-    return isinstance(e, bs4.Tag)
+def _escape(s):
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
 
 
-def _has_no_child(tag):
-    return len(tag.contents) == 0
+def _attrs(attrs):
+    '''
+    @attrs serialized, sorted by name. A value with double quotes is put in
+    single quotes, or has them escaped if it has single quotes too
+    '''
 
+    li = []
+    for k, v in sorted(attrs):
+        v = _escape(v)
+        if '"' in v:
+            if "'" in v:
+                v = '"%s"' % v.replace('"', '&quot;')
+            else:
+                v = "'%s'" % v
+        else:
+            v = '"%s"' % v
+        li.append(' %s=%s' % (k, v))
+    return ''.join(li)
 
-class Traversal:
-    '''depth-first traversal'''
-
-    def __init__(self, root, *, tagOnly=False):
-        assert _is_root(root)
-
-        self._e = root
-        self._skip_children = False
-        self._tagOnly = tagOnly
 
-    def __iter__(self):
-        return self
+def _name(e, name):
+    '''@name, a tag or attribute name of @e, with its prefix if it has one'''
 
-    def __next__(self):
-        e = self._next()
-        if e is None:
-            raise StopIteration('no more element')
+    qname = etree.QName(name)
+    if qname.namespace is None:
+        return name
+    for prefix, ns in e.nsmap.items():
+        if ns == qname.namespace and prefix is not None:
+            return '%s:%s' % (prefix, qname.localname)
+    return qname.localname
 
-        self._e = e
-        self._skip_children = False
-        return e
 
-    def _next(self):
-        if (not self._skip_children) and _is_tag(self._e):
-            for e in self._e.children:
-                if (not self._tagOnly) or _is_tag(e):
-                    return e
+def _collapse(s, *, _spaces=str.maketrans('', '', ' \n\t\f\r')):
+    '''@s, or a single newline/space if it is whitespace only'''
 
-        e = self._e
-        while True:
-            if _is_root(e):
-                return None
+    if not s or s.translate(_spaces) != '':
+        return s
+    return '\n' if '\n' in s else ' '
 
-            for _e in e.next_siblings:
-                if (not self._tagOnly) or _is_tag(_e):
-                    return _e
 
-            e = e.parent
+def _text(e):
+    '''the text of @e, a comment or processing instruction, as it is shown'''
 
-    def skip_children(self):
-        self._skip_children = True
+    if e.tag is etree.PI:
+        return '%s %s' % (e.target, e.text or '')
+    return _collapse(e.text)
 
 
 class CML:
+    '''
+    A CML document, i.e. the markup of Coursera supplements and references,
+    parsed with lxml.etree
+
+    to_html() converts it in one pass over the tree, writing the HTML as it
+    goes:
+
+    * a CML element is converted to an HTML element, or is unknown and left
+      out, its children taking its place
+    * text is kept unless no ancestor is converted, and $$-delimited math in
+      it is wrapped in <span hasMath="true">. Comments and processing
+      instructions are taken as text. Text which is whitespace only is
+      collapsed to a newline or a space
+    * <code> is kept as is in a <pre>
+    '''
+
     def __init__(self, doc):
+        self._doc = doc
+
         doc = doc.translate(doc.maketrans('\u21b5', ' '))
-        self._root = bs4.BeautifulSoup(doc, 'lxml-xml')
+        # the encoding is given, as a declaration in @doc may tell another.
+        # The document is fed rather than parsed at once, which recovers from
+        # a truncated document as bs4 does
+        parser = etree.XMLParser(recover=True, strip_cdata=False, encoding='UTF-8')
+        try:
+            parser.feed(doc.encode('UTF-8'))
+            self._root = parser.close()
+        except etree.XMLSyntaxError:
+            # e.g. an empty document
+            self._root = None
 
         self._assets = None
         self._assetIDs = None
         self._refids = None
 
-        self._html = None
+    @property
+    def doc(self):
+        return self._doc
+
+    def _elements(self):
+        if self._root is None:
+            return ()
+        return self._root.iter(etree.Element)
 
     def get_resources(
         self,
@@ -88,149 +123,189 @@ class CML:
             self._assetIDs = []
             self._refids = []
 
-            for e in Traversal(self._root, tagOnly=True):
-                if e.name == 'asset':
-                    self._assetIDs.append(e['id'])
-                elif e.name == 'img':
+            for e in self._elements():
+                name = etree.QName(e).localname
+                if name == 'asset':
+                    self._assetIDs.append(e.attrib['id'])
+                elif name == 'img':
                     if e.get('src'):
                         import uuid
 
                         from .lib.misc import url_basename
                         from .define import Asset
 
-                        id_ = str(uuid.uuid4())
-                        e['assetId'] = id_
-                        url = e['src']
+                        # the same on every parse of the document, so that
+                        # the document can be parsed again in another process
+                        url = e.attrib['src']
+                        id_ = str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+                        e.attrib['assetId'] = id_
                         name = url_basename(url)
                         self._assets.append(Asset(id_=id_, url=url, name=name))
                     else:
-                        self._assetIDs.append(e['assetId'])
-                elif e.name == 'a':
-                    match = _pat_ref.match(e['href'])
+                        self._assetIDs.append(e.attrib['assetId'])
+                elif name == 'a':
+                    match = _pat_ref.match(e.attrib['href'])
                     if match:
                         _ = match.group(1)
                         self._refids.append(_)
-                        e['refid'] = _
+                        e.attrib['refid'] = _
 
         return self._assets, self._assetIDs, self._refids
 
-    def to_html(self, *, assets):
-        if self._html is not None:
-            return self._html
+    def to_html(self, *, assets, resolve_ref=None):
+        '''
+        @assets: the assets of get_resources() and those of its asset IDs
+        @resolve_ref: called with the ID of a reference a link points to.
+            Returns the href of the link, or None to keep it
+        '''
 
+        self.get_resources()
         asset_by_id = {_['id']: _ for _ in assets}
 
+        out = []
+        if self._root is not None:
+            self._convert(self._root, asset_by_id, resolve_ref, out, False)
+        return ''.join(out)
+
+    @staticmethod
+    def _add_text(s, out, inside):
+        '''@inside: whether an ancestor of @s is converted'''
+
+        if not inside or not s:
+            return
+
+        hasMath = False
+        for _ in s.split('$$'):
+            if not hasMath:
+                out.append(_escape(_))
+            else:
+                out.append('<span hasMath="true">%s</span>' % _escape(_))
+            hasMath = not hasMath
+
+    def _convert(self, e0, asset_by_id, resolve_ref, out, inside):
+        if not isinstance(e0.tag, str):
+            self._add_text(_text(e0), out, inside)
+            return
+
         def _assetName(id_):
             return asset_by_id[id_]['name']
 
-        html = bs4.BeautifulSoup('', 'lxml')
-        d = {}
-
-        def _add(e0, e1):
-            parent1 = html
-            _e = e0
-            while _e is not None:
-                if id(_e) in d:
-                    parent1 = d[id(_e)]
-                    break
-                _e = _e.parent
-
-            if (parent1 is html) and (not _is_tag(e0)):
-                return
-
-            if _is_tag(e0):
-                d[id(e0)] = e1
-            parent1.append(e1)
-
-        tr = Traversal(self._root)
-        for e0 in tr:
-            if isinstance(e0, bs4.NavigableString):
-                _li = str(e0).split('$$')
-                hasMath = False
-                for _ in _li:
-                    if not hasMath:
-                        _add(e0, _)
-                    else:
-                        _span = bs4.Tag(name='span')
-                        _span['hasMath'] = 'true'
-                        _span.append(_)
-                        _add(e0, _span)
-
-                    hasMath = not hasMath
-
-                continue
-
-            if not _is_tag(e0):
-                continue
-
-            if e0.name == 'asset':
-                assert _has_no_child(e0)
-
-                e1 = bs4.Tag(name='p')
-                e1['class'] = 'asset'
-                e1.append(_assetName(e0['id']))
-
-            elif e0.name == 'img':
-                assert _has_no_child(e0)
-
-                e1 = bs4.Tag(name='img')
-                e1['src'] = e1['alt'] = _assetName(e0['assetId'])
-                e1['src'] = quote(e1['src'])
-
-            elif e0.name == 'heading':
-                e1 = bs4.Tag(name='h%d' % int(e0['level']))
-
-            elif e0.name == 'text':
-                e1 = bs4.Tag(name='p')
-
-            elif e0.name == 'list':
-                bulletType = e0['bulletType']
-                if bulletType == 'numbers':
-                    e1 = bs4.Tag(name='ol')
-                    e1['type'] = '1'
-                elif bulletType == 'bullets':
-                    e1 = bs4.Tag(name='ul')
-                else:
-                    e1 = bs4.Tag(name='ul')
-                    logging.warning('[CML] unknown bulletType=%s' % bulletType)
-
-            elif e0.name == 'a':
-                e1 = bs4.Tag(name='a')
-                e1['href'] = e0['href']
-                if e0.get('refid'):
-                    e1['refid'] = e0['refid']
-
-            elif e0.name == 'code':
-                e1 = bs4.Tag(name='pre')
-                e1.append(copy.copy(e0))
-
-                tr.skip_children()
-
-            elif e0.name in [
-                'li',
-                'strong',
-                'em',
-                'u',
-                'table',
-                'tr',
-                'td',
-                'th',
-                'sup',
-                'sub',
-            ]:
-                e1 = bs4.Tag(name=e0.name)
-
-            elif e0.name in ['co-content']:
-                continue
+        name = etree.QName(e0).localname
+        attrs = []
+        if name == 'asset':
+            assert len(e0) == 0 and not e0.text
 
-            else:
-                logging.warning('[CML] unknown e0.name=%s\n%s' % (e0.name, e0))
-                continue
+            out.append('<p class="asset">%s</p>' % _escape(_assetName(e0.attrib['id'])))
+            return
+
+        elif name == 'img':
+            assert len(e0) == 0 and not e0.text
+
+            alt = _assetName(e0.attrib['assetId'])
+            out.append('<img%s></img>' % _attrs([('src', quote(alt)), ('alt', alt)]))
+            return
 
-            _add(e0, e1)
+        elif name == 'heading':
+            tag = 'h%d' % int(e0.attrib['level'])
 
-        self._html = str(html)
-        return self._html
+        elif name == 'text':
+            tag = 'p'
+
+        elif name == 'list':
+            bulletType = e0.attrib['bulletType']
+            if bulletType == 'numbers':
+                tag = 'ol'
+                attrs.append(('type', '1'))
+            elif bulletType == 'bullets':
+                tag = 'ul'
+            else:
+                tag = 'ul'
+                logging.warning('[CML] unknown bulletType=%s' % bulletType)
+
+        elif name == 'a':
+            tag = 'a'
+            href = e0.attrib['href']
+            refid = e0.get('refid')
+            if refid:
+                if resolve_ref is not None:
+                    href = resolve_ref(refid) or href
+                attrs.append(('refid', refid))
+            attrs.append(('href', href))
+
+        elif name == 'code':
+            out.append('<pre>')
+            self._copy(e0, out)
+            out.append('</pre>')
+            return
+
+        elif name in [
+            'li',
+            'strong',
+            'em',
+            'u',
+            'table',
+            'tr',
+            'td',
+            'th',
+            'sup',
+            'sub',
+        ]:
+            tag = name
+
+        else:
+            if name not in ['co-content']:
+                logging.warning(
+                    '[CML] unknown e0.name=%s\n%s'
+                    % (name, etree.tostring(e0, encoding='unicode', with_tail=False))
+                )
+            tag = None
+
+        if tag is not None:
+            out.append('<%s%s>' % (tag, _attrs(attrs)))
+            inside = True
+
+        self._add_text(_collapse(e0.text), out, inside)
+        for e in e0:
+            self._convert(e, asset_by_id, resolve_ref, out, inside)
+            self._add_text(_collapse(e.tail), out, inside)
+
+        if tag is not None:
+            out.append('</%s>' % tag)
+
+    def _copy(self, e0, out):
+        '''@e0 as is, in the XML syntax'''
+
+        if e0.tag is etree.Comment:
+            out.append('<!--%s-->' % (_text(e0) or ''))
+            return
+        if e0.tag is etree.PI:
+            out.append('<?%s?>' % _text(e0))
+            return
+        if not isinstance(e0.tag, str):
+            out.append(_escape(_text(e0) or ''))
+            return
+
+        tag = _name(e0, e0.tag)
+        attrs = _attrs([(_name(e0, k), v) for k, v in e0.attrib.items()])
+        if len(e0) == 0 and not e0.text:
+            out.append('<%s%s/>' % (tag, attrs))
+            return
+
+        out.append('<%s%s>' % (tag, attrs))
+        out.append(_escape(_collapse(e0.text) or ''))
+        for e in e0:
+            self._copy(e, out)
+            out.append(_escape(_collapse(e.tail) or ''))
+        out.append('</%s>' % tag)
+
+
+def render_version(*, __={}):
+    '''a digest of all that rendering depends on besides its input'''
+
+    if __.get('version') is None:
+        h = hashlib.sha256(load_resource('template/supplement.html'))
+        __['version'] = '%d-%s' % (MARKUP_VERSION, h.hexdigest())
+    return __['version']
 
 
 def render_supplement(*, content, resource_path, title='', __={}):
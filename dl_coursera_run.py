@@ -1,21 +1,35 @@
 import logging
 import argparse
+import concurrent.futures
 import os
-import pickle
 import json
 import sys
 import textwrap
 
-import requests
-
 from tqdm import tqdm
 
 import dl_coursera
 
-from dl_coursera.lib.misc import change_ext, get_latest_app_version
+from dl_coursera.lib.misc import get_latest_app_version
 from dl_coursera.lib.TaskScheduler import TaskScheduler
-from dl_coursera.Crawler import Crawler, login
+from dl_coursera.lib.AsyncTaskScheduler import AsyncTaskScheduler
+from dl_coursera.lib.AutoScaler import AutoScaler
+from dl_coursera.lib.Tracer import Tracer
+from dl_coursera.lib.Journal import Journal
+from dl_coursera.lib.HTTPCache import HTTPCache
+from dl_coursera.lib.AccountPool import AccountPool
+from dl_coursera.Crawler import (
+    Crawler,
+    login,
+    is_not_authorized,
+    KEY_API,
+    CACHE_TTLS,
+)
+from dl_coursera.CourseStore import CourseStore, default_dirname
+from dl_coursera.CrawlDB import CrawlDB
 from dl_coursera.DLTaskGatherer import DLTaskGatherer
+from dl_coursera.RenderCache import RenderCache
+from dl_coursera.RenderCache import default_dirname as default_dirname_rendered
 from dl_coursera.Downloader import DownloaderBuiltin
 from dl_coursera.define import *
 
@@ -24,15 +38,32 @@ def _dir_cache(outdir, slug):
     return os.path.join(outdir, slug, '.cache')
 
 
-def _file_log(outdir, slug):
-    return os.path.join(_dir_cache(outdir, slug), 'main.log')
+def _dir_cache_run(outdir, jobs):
+    '''where the files of a run of @jobs which are not of one slug are put'''
+
+    if len(jobs) == 1:
+        return _dir_cache(outdir, jobs[0][0])
+    return os.path.join(outdir, '.cache')
+
+
+def _file_log(dir_cache):
+    return os.path.join(dir_cache, 'main.log')
+
+
+def _file_db_crawl(outdir, slug):
+    return os.path.join(_dir_cache(outdir, slug), 'crawl.db')
+
+
+def _file_json_crawl_delta(outdir, slug):
+    return os.path.join(_dir_cache(outdir, slug), 'crawl.delta.json')
 
 
-def _file_pkl_crawl(outdir, slug):
-    return os.path.join(_dir_cache(outdir, slug), 'crawl.pkl')
+def _file_jsonl_gather(outdir, slug):
+    return os.path.join(_dir_cache(outdir, slug), 'gather.jsonl')
 
 
-def _file_json_gather(outdir, slug):
+def _file_json_gather_legacy(outdir, slug):
+    '''where the downloading tasks were kept as one JSON array'''
     return os.path.join(_dir_cache(outdir, slug), 'gather.json')
 
 
@@ -40,17 +71,57 @@ def _file_json_download_dl_tasks_failed(outdir, slug):
     return os.path.join(_dir_cache(outdir, slug), 'download.dl_tasks_failed.json')
 
 
-def crawl(cookies_file, slug, outdir, is_spec):
-    file_pkl = _file_pkl_crawl(outdir, slug)
-    if os.path.exists(file_pkl):
-        with open(file_pkl, 'rb') as ifs:
-            return pickle.load(ifs)
+def _dir_http_cache(outdir, slug):
+    return os.path.join(_dir_cache(outdir, slug), 'http')
+
+
+def _file_db_download_journal(dir_cache):
+    return os.path.join(dir_cache, 'download.journal.db')
+
+
+def _file_json_trace(dir_cache, stage):
+    return os.path.join(dir_cache, '%s.trace.json' % stage)
+
+
+_task_schedulers = {'thread': TaskScheduler, 'async': AsyncTaskScheduler}
+
+# the default bounds of the number of workers. The maximum is also the
+# number of connections kept per host
+_min_worker = 1
+_max_worker = 8
+
 
-    with requests.Session() as sess:
-        login(sess, cookies_file=cookies_file)
+def load_manifest(filename):
+    '''
+    Return the jobs listed in @filename, i.e. [(slug, is_spec), ...]
 
-        # Check whether the specialization/course exists
+    There is one slug per line. The slug of a specialization is prefixed
+    with `spec:`. Empty lines and lines starting with `#` are ignored
+    '''
 
+    jobs = []
+    with open(filename, encoding='UTF-8') as ifs:
+        for line in ifs:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+
+            if line.startswith('spec:'):
+                job = (line[len('spec:') :].strip(), True)
+            else:
+                job = (line, False)
+
+            if job not in jobs:
+                jobs.append(job)
+    return jobs
+
+
+def preflight(sess, cookies_files, jobs):
+    login(sess, cookies_file=cookies_files)
+
+    # Check whether the specializations/courses exist
+
+    for slug, is_spec in jobs:
         if is_spec:
             if 'elements' not in sess.get(URL_SPEC(slug)).json():
                 raise SpecNotExistExcepton(slug)
@@ -58,18 +129,88 @@ def crawl(cookies_file, slug, outdir, is_spec):
             if 'elements' not in sess.get(URL_COURSE_1(slug)).json():
                 raise CourseNotExistExcepton(slug)
 
-        # Check whether the cookies_file expires
+    # Check whether the cookies files expire, those of all accounts at once
+
+    course = Course(slug=COURSE_0)
+    d = sess.get(URL_COURSE_1(course['slug'])).json()
+    course['id'] = d['elements'][0]['id']
+
+    def _check(account):
+        return account.get(URL_COURSE_REFERENCES(course['id'])).json()
+
+    with concurrent.futures.ThreadPoolExecutor(len(sess.accounts)) as executor:
+        for cookies_file, d in zip(cookies_files, executor.map(_check, sess.accounts)):
+            if d.get('errorCode') == 'Not Authorized':
+                raise CookiesExpiredException(cookies_file)
+            assert 'errorCode' not in d
+
+
+def crawl(
+    cookies_files,
+    jobs,
+    outdir,
+    scheduler='thread',
+    trace=False,
+    incremental=False,
+    *,
+    sess,
+    dir_cache,
+    max_worker=_max_worker,
+):
+    '''
+    Crawl the specializations/courses of @jobs, i.e. [(slug, is_spec), ...],
+    on one scheduler, and return the results in the same order
+
+    @cookies_files: those of the accounts of @sess, an AccountPool
+
+    @incremental: crawl again what changed since the previous crawl, instead
+        of using the previous crawl as is
+    @max_worker: the number of workers
+    '''
+
+    socs = {}
+    prevs = {}
+    for slug, _ in jobs:
+        db = CrawlDB(_file_db_crawl(outdir, slug))
+        if not incremental:
+            # only gathered, if gather.jsonl is not there yet
+            soc = db.load_lazily()
+            if soc is not None:
+                socs[slug] = soc
+            continue
+
+        # what is not crawled again is taken from the previous crawl
+        soc = db.load()
+        if soc is not None:
+            prevs[slug] = soc
+
+    jobs_crawl = [_ for _ in jobs if _[0] not in socs]
+    if len(jobs_crawl) > 0:
+        preflight(sess, cookies_files, jobs_crawl)
+        socs.update(
+            _crawl(
+                cookies_files,
+                jobs_crawl,
+                outdir,
+                scheduler,
+                trace,
+                prevs,
+                sess=sess,
+                dir_cache=dir_cache,
+                max_worker=max_worker,
+            )
+        )
+
+    return [socs[slug] for slug, _ in jobs]
 
-        course = Course(slug=COURSE_0)
-        d = sess.get(URL_COURSE_1(course['slug'])).json()
-        course['id'] = d['elements'][0]['id']
 
-        d = sess.get(URL_COURSE_REFERENCES(course['id'])).json()
-        if d.get('errorCode') == 'Not Authorized':
-            raise CookiesExpiredException()
-        assert 'errorCode' not in d
+def _crawl(
+    cookies_files, jobs, outdir, scheduler, trace, prevs, *, sess, dir_cache, max_worker
+):
+    crawlers = []
 
-    with TaskScheduler() as ts, requests.Session() as sess:
+    tracer = Tracer() if trace else None
+    with _task_schedulers[scheduler]() as ts:
         with tqdm(
             desc='Crawling...',
             bar_format='{bar:31} [{percentage:3.0f}%] {n_fmt}/{total_fmt} {desc}',
@@ -77,83 +218,217 @@ def crawl(cookies_file, slug, outdir, is_spec):
             total = 0
             done = 0
 
-            def _hook_add():
+            def _hook_add(_):
                 nonlocal total
                 total += 1
                 bar.reset(total)
                 bar.update(done)
                 bar.refresh()
 
-            def _hook_done():
+            def _hook_done(_):
                 nonlocal done
                 done += 1
                 bar.update()
                 bar.refresh()
 
-            def _hook_retry():
+            def _hook_retry(_):
                 bar.refresh()
 
+            # the limits are per account
+            n = len(sess.accounts)
+            ts.set_limit(KEY_API, max_inflight=4 * n, rate=10 * n)
             ts.start(
-                n_worker=1,
+                n_worker=max_worker,
                 hook_add=_hook_add,
                 hook_done=_hook_done,
                 hook_retry=_hook_retry,
+                tracer=tracer,
+            )
+            # courses shared by specializations are crawled once
+            store = CourseStore(default_dirname())
+            courses = {}
+            for slug, is_spec in jobs:
+                # a crawling which failed halfway is redone mostly from the cache
+                cache = HTTPCache(_dir_http_cache(outdir, slug), ttls=CACHE_TTLS)
+                crawler = Crawler(
+                    ts=ts,
+                    sess=sess,
+                    cookies_file=cookies_files,
+                    cache=cache,
+                    store=store,
+                    courses=courses,
+                )
+                soc = crawler.start(slug=slug, is_spec=is_spec, prev=prevs.get(slug))
+                crawlers.append((crawler, soc))
+
+            failures = ts.wait()
+            for crawler, soc in crawlers:
+                crawler.finish(soc, failures)
+
+    if tracer is not None:
+        tracer.dump(_file_json_trace(dir_cache, 'crawl'))
+
+    socs = {}
+    for crawler, soc in crawlers:
+        slug = soc['slug']
+        socs[slug] = soc
+
+        delta = crawler.delta
+        with open(_file_json_crawl_delta(outdir, slug), 'w', encoding='UTF-8') as ofs:
+            ofs.write(delta.to_json())
+        logging.info(
+            'Crawled %s: %d added, %d changed, %d removed'
+            % (
+                slug,
+                len(delta['added']),
+                len(delta['changed']),
+                len(delta['removed']),
             )
-            crawler = Crawler(ts=ts, sess=sess, cookies_file=cookies_file)
-            soc = crawler.crawl(slug=slug, is_spec=is_spec)
+        )
+
+        if slug in prevs:
+            # gathering and downloading are redone. Files which are already
+            # downloaded are skipped, see the download journal
+            for _ in [
+                _file_jsonl_gather(outdir, slug),
+                _file_json_download_dl_tasks_failed(outdir, slug),
+            ]:
+                if os.path.exists(_):
+                    os.remove(_)
 
-    with open(file_pkl, 'wb') as ofs:
-        pickle.dump(soc, ofs)
+        CrawlDB(_file_db_crawl(outdir, slug)).save(soc)
 
-    file_json = change_ext(file_pkl, 'json')
-    with open(file_json, 'w', encoding='UTF-8') as ofs:
-        ofs.write(soc.to_json())
+    return socs
 
-    return soc
 
+def gather_dl_tasks(outdir, soc, render_cache=None, ts=None):
+    '''
+    The downloading tasks of @soc. They are kept in gather.jsonl, one JSON
+    object per line, as they are gathered
 
-def gather_dl_tasks(outdir, soc):
-    file_json = _file_json_gather(outdir, soc['slug'])
+    @ts: see DLTaskGatherer
+    '''
+
+    file_json = _file_jsonl_gather(outdir, soc['slug'])
     if os.path.exists(file_json):
         with open(file_json, encoding='UTF-8') as ifs:
-            return json.load(ifs)
-
-    dl_tasks = DLTaskGatherer(soc=soc, outdir=outdir).gather()
-    with open(file_json, 'w', encoding='UTF-8') as ofs:
-        json.dump(dl_tasks, ofs, indent=4)
+            return [json.loads(_) for _ in ifs]
+
+    # left by a former version. It is gathered again, as that is cheap
+    file_legacy = _file_json_gather_legacy(outdir, soc['slug'])
+    if os.path.exists(file_legacy):
+        os.remove(file_legacy)
+
+    dl_tasks = []
+    gatherer = DLTaskGatherer(soc=soc, outdir=outdir, render_cache=render_cache, ts=ts)
+    # a gathering which failed halfway leaves no gather.jsonl behind
+    file_tmp = file_json + '.tmp'
+    with open(file_tmp, 'w', encoding='UTF-8') as ofs:
+        for _ in gatherer.iter_dl_tasks():
+            ofs.write(json.dumps(_) + '\n')
+            dl_tasks.append(_)
+    os.replace(file_tmp, file_json)
 
     return dl_tasks
 
 
-def download(dl_tasks, slug, outdir):
-    file_json = _file_json_download_dl_tasks_failed(outdir, slug)
-    if os.path.exists(file_json):
-        with open(file_json, encoding='UTF-8') as ifs:
-            dl_tasks = json.load(ifs)
+def gather(socs, outdir, render_cache):
+    '''
+    Return [(slug, dl_tasks), ...] of @socs. The supplements of all of them
+    are rendered in the process pool of one scheduler, or in this process if
+    there is one CPU
+    '''
+
+    n_process = os.cpu_count() or 1
+    if n_process == 1:
+        return [(_['slug'], gather_dl_tasks(outdir, _, render_cache)) for _ in socs]
+
+    with TaskScheduler() as ts:
+        ts.start(n_worker=n_process, n_process=n_process)
+        return [(_['slug'], gather_dl_tasks(outdir, _, render_cache, ts)) for _ in socs]
+
+
+def download(
+    jobs_dl_tasks,
+    outdir,
+    scheduler='thread',
+    trace=False,
+    *,
+    sess,
+    dir_cache,
+    min_worker=_min_worker,
+    max_worker=_max_worker,
+):
+    '''
+    @jobs_dl_tasks: [(slug, dl_tasks), ...]. The downloading tasks of all the
+        slugs run on one scheduler
+    @min_worker, @max_worker: the bounds of the number of workers, which is
+        scaled by an AutoScaler
+    '''
+
+    dl_tasks = []
+    filename2slug = {}
+    for slug, _ in jobs_dl_tasks:
+        file_json = _file_json_download_dl_tasks_failed(outdir, slug)
+        if os.path.exists(file_json):
+            with open(file_json, encoding='UTF-8') as ifs:
+                _ = json.load(ifs)
+
+        for _1 in _:
+            filename2slug[_1['filename']] = slug
+        dl_tasks += _
 
     if len(dl_tasks) == 0:
         return
 
-    with TaskScheduler() as ts:
+    tracer = Tracer() if trace else None
+    # downloads which were done before the program was interrupted are skipped
+    journal = Journal(_file_db_download_journal(dir_cache))
+    unfinished = journal.unfinished()
+    if len(unfinished) > 0:
+        logging.info(
+            'Resuming %d downloads interrupted in a previous run' % len(unfinished)
+        )
+        for _, kwargs in unfinished:
+            logging.debug('Interrupted download: %s' % kwargs['filename'])
+    with journal, _task_schedulers[scheduler]() as ts:
         with tqdm(
             desc='Downloading...',
             bar_format='{bar:31} [{percentage:3.0f}%] {n_fmt}/{total_fmt} {desc}',
             total=len(dl_tasks),
         ) as bar:
 
-            def _hook_done():
+            def _hook_done(_):
                 bar.update(1)
                 bar.refresh()
 
-            def _hook_retry():
+            def _hook_retry(_):
                 bar.refresh()
 
-            ts.start(n_worker=1, hook_done=_hook_done, hook_retry=_hook_retry)
+            ts.start(
+                n_worker=min_worker,
+                autoscaler=AutoScaler(min_worker=min_worker, max_worker=max_worker),
+                hook_done=_hook_done,
+                hook_retry=_hook_retry,
+                tracer=tracer,
+                journal=journal,
+            )
             _cls_downloader = DownloaderBuiltin
-            dl_tasks_failed = _cls_downloader(dl_tasks=dl_tasks, ts=ts).download()
+            dl_tasks_failed = _cls_downloader(
+                dl_tasks=dl_tasks, ts=ts, sess=sess
+            ).download()
+
+    if tracer is not None:
+        tracer.dump(_file_json_trace(dir_cache, 'download'))
 
-    with open(file_json, 'w', encoding='UTF-8') as ofs:
-        json.dump(dl_tasks_failed, ofs, indent=4)
+    slug2failed = {slug: [] for slug, _ in jobs_dl_tasks}
+    for _ in dl_tasks_failed:
+        slug2failed[filename2slug[_['filename']]].append(_)
+
+    for slug, _ in slug2failed.items():
+        file_json = _file_json_download_dl_tasks_failed(outdir, slug)
+        with open(file_json, 'w', encoding='UTF-8') as ofs:
+            json.dump(_, ofs, indent=4)
 
 
 def config_logger(logfile: str):
@@ -188,47 +463,134 @@ def main():
         allow_abbrev=False,
         add_help=True,
         description='A simple, fast, and reliable Coursera crawling & downloading tool',
-        epilog=textwrap.dedent(
-            """
+        epilog=textwrap.dedent("""
             If the command succeeds, you shall see `Done :-)`.
+            If it is interrupted, run it again to resume: downloads which
+            are done are skipped, and crawling, which is not journaled, is
+            redone mostly from the HTTP cache in .cache.
             If errors occur, visit `https://github.com/FLZ101/dl_coursera`
             for the troubleshooting guide.
-            """
-        ),
+            """),
+    )
+    parser.add_argument(
+        '--cookies',
+        required=True,
+        action='append',
+        help='path of the cookies file. Given many times, e.g. of several accounts enrolled in the same specializations/courses, requests are spread over the accounts',
     )
-    parser.add_argument('--cookies', required=True, help='path of the cookies file')
     parser.add_argument(
         '--outdir', default='.', help="the output directory. Default: `.'"
     )
     parser.add_argument(
         '--spec', action='store_true', help='indicate that @slug is of a specialization'
     )
+    parser.add_argument(
+        '--scheduler',
+        choices=list(_task_schedulers),
+        default='thread',
+        help="how to run crawling & downloading tasks: on threads or on an event loop. The Coursera API and the builtin downloader use requests, which blocks, so with `async' they still run on a pool of --max-worker threads, handed over from the event loop. Default: `thread'",
+    )
+    parser.add_argument(
+        '--min-worker',
+        type=int,
+        default=_min_worker,
+        help='the minimum number of workers downloading, which are added or retired as the server allows. Default: %d'
+        % _min_worker,
+    )
+    parser.add_argument(
+        '--max-worker',
+        type=int,
+        default=_max_worker,
+        help='the number of workers crawling, the maximum number of workers downloading, and the number of connections kept per account. Default: %d'
+        % _max_worker,
+    )
+    parser.add_argument(
+        '--trace',
+        action='store_true',
+        help='write a trace of the crawling & downloading tasks to .cache/*.trace.json, which can be viewed in https://ui.perfetto.dev',
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='crawl again only the lectures, supplements and references which are new or changed since the previous run, and download what they add',
+    )
+    parser.add_argument(
+        '--manifest',
+        help='path of a file listing many specializations/courses to crawl & download together, one slug per line. The slug of a specialization is prefixed with `spec:`',
+    )
     parser.add_argument(
         '--version', action='version', version='%%(prog)s %s' % dl_coursera.app_version
     )
-    parser.add_argument('slug', help='slug of the specialization/course')
+    parser.add_argument('slug', nargs='?', help='slug of the specialization/course')
 
     args = vars(parser.parse_args())
 
+    if (args['slug'] is None) == (args['manifest'] is None):
+        parser.error('either a slug or --manifest is required')
+    if args['manifest'] is not None and args['spec']:
+        parser.error('--spec does not apply to --manifest')
+    if not 1 <= args['min_worker'] <= args['max_worker']:
+        parser.error('1 <= --min-worker <= --max-worker is required')
+
     latest_version = get_latest_app_version()
-    if latest_version > dl_coursera.app_version:
-        msg = textwrap.dedent(
-            f"A newer version {latest_version} is available.",
+    if latest_version is not None and latest_version > dl_coursera.app_version:
+        print(
+            'A newer version %s is available.' % latest_version,
             file=sys.stderr,
+            flush=True,
         )
-        print(msg, file=sys.stderr, flush=True)
 
     outdir = args['outdir']
-    slug = args['slug']
-    os.makedirs(_dir_cache(outdir, slug), exist_ok=True)
-
-    config_logger(_file_log(outdir, slug))
-
-    soc = crawl(args['cookies'], slug, outdir, args['spec'])
+    if args['manifest'] is not None:
+        jobs = load_manifest(args['manifest'])
+        if len(jobs) == 0:
+            parser.error('%s lists no slug' % args['manifest'])
+    else:
+        jobs = [(args['slug'], args['spec'])]
+
+    for slug, _ in jobs:
+        os.makedirs(_dir_cache(outdir, slug), exist_ok=True)
+    dir_cache = _dir_cache_run(outdir, jobs)
+    os.makedirs(dir_cache, exist_ok=True)
+
+    config_logger(_file_log(dir_cache))
+
+    # connections are kept alive from crawling to downloading
+    with AccountPool(
+        len(args['cookies']),
+        is_denied=is_not_authorized,
+        pool_maxsize=args['max_worker'],
+    ) as sess:
+        socs = crawl(
+            args['cookies'],
+            jobs,
+            outdir,
+            args['scheduler'],
+            args['trace'],
+            args['incremental'],
+            sess=sess,
+            dir_cache=dir_cache,
+            max_worker=args['max_worker'],
+        )
 
-    dl_tasks = gather_dl_tasks(outdir, soc)
+        # supplements rendered before, by this run or another, are reused
+        render_cache = RenderCache(default_dirname_rendered())
+        jobs_dl_tasks = gather(socs, outdir, render_cache)
+        logging.info(
+            'Rendered supplements: %d reused, %d rendered'
+            % (render_cache.n_hits, render_cache.n_misses)
+        )
 
-    download(dl_tasks, slug, outdir)
+        download(
+            jobs_dl_tasks,
+            outdir,
+            args['scheduler'],
+            args['trace'],
+            sess=sess,
+            dir_cache=dir_cache,
+            min_worker=args['min_worker'],
+            max_worker=args['max_worker'],
+        )
 
     sys.stderr.flush()
     print('Done :-)')
@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import time
+
+from test.MockCoursera import MockCoursera
+
+# Usage: PYTHONPATH=. python example/MockCoursera-bench.py [n_courses] [latency]
+#
+# Crawls a specialization of @n_courses courses served by a MockCoursera
+# whose responses are delayed by @latency seconds, gathers the files and
+# downloads them, printing the time each step takes.
+
+
+def main():
+    n_courses = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+    with MockCoursera(n_courses=n_courses, latency=latency) as mock:
+        # URL_ROOT is read when dl_coursera.define is imported
+        os.environ['DL_COURSERA_URL_ROOT'] = mock.url
+
+        from dl_coursera.lib.SessionPool import SessionPool
+        from dl_coursera.lib.TaskScheduler import TaskScheduler
+        from dl_coursera.Crawler import Crawler
+        from dl_coursera.DLTaskGatherer import DLTaskGatherer
+        from dl_coursera.Downloader import DownloaderBuiltin
+
+        with tempfile.TemporaryDirectory() as outdir, SessionPool() as sess:
+            # MockCoursera does not check the cookies, but Crawler needs a user ID
+            cookies_file = os.path.join(outdir, 'cookies.txt')
+            with open(cookies_file, 'w', encoding='UTF-8') as ofs:
+                ofs.write('# Netscape HTTP Cookie File\n')
+                ofs.write(
+                    '.coursera.org\tTRUE\t/\tTRUE\t4102444800\tCOURSERA_userId\tg:1\n'
+                )
+
+            with TaskScheduler() as ts:
+                ts.start(n_worker=8)
+                crawler = Crawler(ts=ts, sess=sess, cookies_file=cookies_file)
+
+                t0 = time.perf_counter()
+                spec = crawler.crawl(slug='bench', is_spec=True)
+                t1 = time.perf_counter()
+            print(
+                'crawl: %.2fs, %d requests' % (t1 - t0, sum(mock.n_requests.values()))
+            )
+
+            t0 = time.perf_counter()
+            dl_tasks = DLTaskGatherer(soc=spec, outdir=outdir).gather()
+            t1 = time.perf_counter()
+            print('gather: %.2fs, %d files' % (t1 - t0, len(dl_tasks)))
+
+            with TaskScheduler() as ts:
+                ts.start(n_worker=8)
+                t0 = time.perf_counter()
+                DownloaderBuiltin(dl_tasks=dl_tasks, ts=ts, sess=sess).download()
+                t1 = time.perf_counter()
+            print('download: %.2fs' % (t1 - t0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+import asyncio
+import time
+
+from dl_coursera.lib.AsyncTaskScheduler import AsyncTaskScheduler
+
+ts = AsyncTaskScheduler()
+
+
+@ts.register_task
+async def f(*, n):
+    await asyncio.sleep(1)
+    print('f', n)
+
+    for _ in range(10):
+        g(n=n + 1)
+
+
+@ts.register_task
+async def g(*, n):
+    await asyncio.sleep(1)
+    print('g', n)
+
+    for _ in range(10):
+        h(n=n + 1)
+
+
+@ts.register_task
+def h(*, n):
+    time.sleep(1)
+
+
+if __name__ == '__main__':
+    # 1 + 10 + 100 tasks finish in about 3 seconds
+    with ts:
+        ts.start(n_worker=100)
+        f(n=1)
+        ts.wait()
@@ -0,0 +1,52 @@
+import sys
+import time
+import tracemalloc
+
+from dl_coursera.lib.TaskScheduler import TaskScheduler
+
+# Usage: python TaskScheduler-bench.py [n_task]
+#
+# Queues @n_task tasks before starting the workers, then runs them all,
+# printing enqueue/run throughput and memory per queued task.
+
+ts = TaskScheduler()
+
+
+@ts.register_task(priority='B')
+def f(*, i):
+    pass
+
+
+@ts.register_task(priority='A')
+def g(*, i):
+    pass
+
+
+def main():
+    n_task = int(sys.argv[1]) if len(sys.argv) > 1 else 10**6
+
+    tracemalloc.start()
+    mem0 = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+
+    for i in range(n_task):
+        (f if i % 2 == 0 else g)(i=i)
+
+    t1 = time.perf_counter()
+    mem1 = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print('enqueue: %.0f tasks/s' % (n_task / (t1 - t0)))
+    print('memory: %.0f bytes/task' % ((mem1 - mem0) / n_task))
+
+    with ts:
+        t0 = time.perf_counter()
+        ts.start(n_worker=4)
+        ts.wait()
+        t1 = time.perf_counter()
+
+    print('run: %.0f tasks/s' % (n_task / (t1 - t0)))
+
+
+if __name__ == '__main__':
+    main()
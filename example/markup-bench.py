@@ -0,0 +1,49 @@
+import sys
+import time
+
+from dl_coursera.define import Asset
+from dl_coursera.markup import CML
+
+# Usage: python markup-bench.py [n_sections] [n_repeats]
+#
+# Converts a synthetic reading of @n_sections sections to HTML @n_repeats
+# times, printing the time per conversion.
+
+_SECTION = '''
+<heading level="2">Section %(i)d</heading>
+<text>Some <strong>bold</strong> and <em>italic</em> text, $$x^%(i)d$$, and
+<a href="https://www.coursera.org/learn/c/resources/r%(i)d" refid="r%(i)d">a link</a>.</text>
+<list bulletType="bullets"><li><text>one</text></li><li><text>two</text></li></list>
+<table rows="2" columns="2"><tr><th><text>a</text></th><th><text>b</text></th></tr>
+<tr><td><text>1</text></td><td><text>2</text></td></tr></table>
+<code language="python">def f(x):
+    return x &lt; %(i)d</code>
+<img src="https://x/img%(i)d.png" alt="image"/>
+<asset id="A%(i)d" name="a%(i)d" extension="pdf" assetType="generic"/>
+'''
+
+
+def main():
+    n_sections = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    doc = '<co-content>%s</co-content>' % ''.join(
+        _SECTION % {'i': i} for i in range(n_sections)
+    )
+    assets = [
+        Asset(id_='A%d' % i, url='https://x/a%d.pdf' % i, name='a%d.pdf' % i)
+        for i in range(n_sections)
+    ]
+    print('document: %d KiB' % (len(doc) // 1024))
+
+    t0 = time.perf_counter()
+    for _ in range(n_repeats):
+        cml = CML(doc)
+        images = cml.get_resources()[0]
+        cml.to_html(assets=images + assets)
+    t1 = time.perf_counter()
+    print('to_html: %.1fms' % ((t1 - t0) / n_repeats * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -40,7 +40,7 @@ setuptools.setup(
     install_requires=_readlines('requirements.txt'),
     extras_require={'dev': _readlines('requirements-dev.txt')},
     py_modules=['dl_coursera_run'],
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['test', 'test.*']),
     entry_points={
         'console_scripts': ['%s=dl_coursera_run:main' % dl_coursera.app_name]
     },
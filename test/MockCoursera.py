@@ -0,0 +1,542 @@
+import collections
+import hashlib
+import http.cookies
+import http.server
+import json
+import threading
+import time
+
+from urllib.parse import parse_qs, unquote, urlparse
+
+# endpoints whose requests may fail, see MockCoursera. The ones which tell
+# whether a specialization/course exists are left alone, as preflight
+# requests them only once
+_FLAKY = [
+    'onDemandReferences.v1',
+    'onDemandLectureVideos.v1',
+    'onDemandLectureAssets.v1',
+    'onDemandSupplements.v1',
+    'assets.v1',
+    'cdn',
+]
+
+
+# a course whose references every user may access, as preflight takes it to
+# check the cookies, see COURSE_0
+_COURSE_OPEN = 'learning-how-to-learn'
+
+
+def _id(slug):
+    return 'id-' + slug
+
+
+def _slug(id_):
+    return id_[len('id-') :]
+
+
+def _uid(h):
+    '''the user ID in the cookies of the request @h, or None'''
+
+    cookies = http.cookies.SimpleCookie()
+    try:
+        cookies.load(h.headers.get('Cookie', ''))
+    except http.cookies.CookieError:
+        return None
+
+    morsel = cookies.get('COURSERA_userId')
+    if morsel is None:
+        return None
+    for _ in unquote(morsel.value).split('|'):
+        k, _, v = _.partition(':')
+        if k == 'g':
+            return v
+    return None
+
+
+def _fraction(s):
+    '''a number in [0, 1) which depends on @s only'''
+
+    return int(hashlib.sha1(s.encode('UTF-8')).hexdigest()[:8], 16) / 2**32
+
+
+class MockCoursera:
+    '''
+    A local stand-in for the parts of the Coursera API which Crawler uses, and
+    for the CDN the files are downloaded from, so that crawling and
+    downloading can be tested and benchmarked offline. Point URL_ROOT at it
+    with the environment variable DL_COURSERA_URL_ROOT.
+
+    Every slug is a specialization of @n_courses courses, named
+    <slug>-0, <slug>-1, ..., and a course too. A course has @n_modules
+    modules of @n_lessons lessons of @n_items items, which are lectures and
+    supplements by turns, and @n_references references. Each lecture has two
+    videos, a subtitle, @n_assets assets and a link; each supplement
+    @n_assets assets, an image and links to the references plus one unlisted
+    reference. Files on the CDN are @file_size bytes.
+
+    @latency: seconds each response is delayed
+    @error_rate: fraction of the URLs of course materials and files whose
+        first request fails with HTTP 500. Which ones depends on the URL only
+    @rate: if not None, requests per second of a user above which HTTP 429
+        is sent, with a Retry-After of @retry_after seconds
+    @enrolled: if not None, {user ID: slugs of courses}. Requests of a user
+        about a course not listed for them get HTTP 401 Not Authorized. The
+        user ID is taken from the COURSERA_userId cookie
+
+    JSON responses carry an ETag, and a matching If-None-Match gets HTTP 304.
+    n_requests counts the requests by endpoint, and n_requests_by_user by
+    user ID.
+    '''
+
+    def __init__(
+        self,
+        *,
+        n_courses=2,
+        n_modules=2,
+        n_lessons=2,
+        n_items=4,
+        n_references=2,
+        n_assets=2,
+        file_size=1024,
+        latency=0,
+        error_rate=0,
+        rate=None,
+        retry_after=1,
+        enrolled=None,
+        host='127.0.0.1',
+        port=0,
+    ):
+        self._n_courses = n_courses
+        self._n_modules = n_modules
+        self._n_lessons = n_lessons
+        self._n_items = n_items
+        self._n_references = n_references
+        self._n_assets = n_assets
+        self._file_size = file_size
+        self._latency = latency
+        self._error_rate = error_rate
+        self._rate = rate
+        self._retry_after = retry_after
+        self._enrolled = enrolled
+        self._address = (host, port)
+
+        self._lock = threading.Lock()
+        self.n_requests = collections.Counter()
+        self.n_requests_by_user = collections.Counter()
+        self._failed = set()
+
+        # user ID => [tokens, time]
+        self._buckets = {}
+
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self._server.server_address[:2]
+
+    def start(self):
+        mock = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            # keep connections alive, as coursera.org does
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                mock._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(self._address, _Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='MockCoursera', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # ------
+
+    def _throttled(self, uid):
+        if self._rate is None:
+            return False
+
+        burst = max(1, self._rate)
+        with self._lock:
+            t = time.monotonic()
+            bucket = self._buckets.setdefault(uid, [burst, t])
+            bucket[0] = min(burst, bucket[0] + (t - bucket[1]) * self._rate)
+            bucket[1] = t
+
+            if bucket[0] < 1:
+                return True
+            bucket[0] -= 1
+            return False
+
+    def _denied(self, uid, endpoint, parts, q):
+        if self._enrolled is None:
+            return False
+
+        if endpoint == 'onDemandCourseMaterials.v2':
+            slug = q.get('slug')
+        elif endpoint == 'onDemandReferences.v1':
+            slug = _slug(q.get('courseId', ''))
+        elif endpoint in [
+            'onDemandLectureVideos.v1',
+            'onDemandLectureAssets.v1',
+            'onDemandSupplements.v1',
+        ]:
+            slug = _slug(parts[0].partition('~')[0]) if len(parts) > 0 else None
+        else:
+            return False
+
+        return slug != _COURSE_OPEN and slug not in self._enrolled.get(uid, ())
+
+    def _fails(self, endpoint, path):
+        if endpoint not in _FLAKY or _fraction(path) >= self._error_rate:
+            return False
+
+        with self._lock:
+            if path in self._failed:
+                return False
+            self._failed.add(path)
+            return True
+
+    def _handle(self, h):
+        u = urlparse(h.path)
+        parts = u.path.strip('/').split('/')
+        endpoint = parts[1] if parts[0] == 'api' and len(parts) > 1 else parts[0]
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        uid = _uid(h)
+
+        with self._lock:
+            self.n_requests[endpoint] += 1
+            self.n_requests_by_user[uid] += 1
+
+        if self._latency:
+            time.sleep(self._latency)
+
+        if self._throttled(uid):
+            self._send(h, 429, b'{}', headers={'Retry-After': str(self._retry_after)})
+            return
+        if self._denied(uid, endpoint, parts[2:], q):
+            body = {'errorCode': 'Not Authorized', 'message': None, 'details': None}
+            self._send(h, 401, json.dumps(body).encode('UTF-8'))
+            return
+        if self._fails(endpoint, h.path):
+            self._send(h, 500, b'{}')
+            return
+
+        if endpoint == 'cdn':
+            self._send(
+                h,
+                200,
+                b'x' * self._file_size,
+                content_type='application/octet-stream',
+            )
+            return
+
+        handler = {
+            'onDemandSpecializations.v1': self._spec,
+            'onDemandCourses.v1': self._course_1,
+            'onDemandCourseMaterials.v2': self._course_2,
+            'onDemandReferences.v1': self._references,
+            'onDemandLectureVideos.v1': self._lecture_1,
+            'onDemandLectureAssets.v1': self._lecture_2,
+            'onDemandSupplements.v1': self._supplement,
+            'assets.v1': self._assets,
+        }.get(endpoint)
+
+        d = None if handler is None else handler(parts[2:], q)
+        if d is None:
+            self._send(h, 404, b'{}')
+            return
+
+        body = json.dumps(d).encode('UTF-8')
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if h.headers.get('If-None-Match') == etag:
+            self._send(h, 304, b'', headers={'ETag': etag})
+            return
+        self._send(h, 200, body, headers={'ETag': etag})
+
+    @staticmethod
+    def _send(h, status, body, *, content_type='application/json', headers={}):
+        h.send_response(status)
+        h.send_header('Content-Type', content_type)
+        h.send_header('Content-Length', str(len(body)))
+        for k, v in headers.items():
+            h.send_header(k, v)
+        h.end_headers()
+        h.wfile.write(body)
+
+    # ------
+
+    def _cdn(self, *parts):
+        return '%s/cdn/%s' % (self.url, '/'.join(parts))
+
+    def _spec(self, _, q):
+        slug = q.get('slug')
+        if not slug:
+            return None
+
+        slugs = ['%s-%d' % (slug, i) for i in range(self._n_courses)]
+        return {
+            'elements': [
+                {
+                    'id': _id(slug),
+                    'name': 'Specialization %s' % slug,
+                    'slug': slug,
+                    'courseIds': [_id(_) for _ in slugs],
+                }
+            ],
+            'linked': {'courses.v1': [{'id': _id(_), 'slug': _} for _ in slugs]},
+        }
+
+    def _course_1(self, _, q):
+        slug = q.get('slug')
+        if not slug:
+            return None
+
+        return {
+            'elements': [{'id': _id(slug), 'name': 'Course %s' % slug, 'slug': slug}]
+        }
+
+    def _course_2(self, _, q):
+        if not q.get('slug'):
+            return None
+
+        modules, lessons, items = [], [], []
+        for i in range(self._n_modules):
+            lessonIds = []
+            for j in range(self._n_lessons):
+                itemIds = []
+                for k in range(self._n_items):
+                    id_ = 'i%d-%d-%d' % (i, j, k)
+                    items.append(
+                        {
+                            'id': id_,
+                            'name': 'Item %d.%d.%d' % (i, j, k),
+                            'slug': 'item-%d-%d-%d' % (i, j, k),
+                            'contentSummary': {
+                                'typeName': 'lecture' if k % 2 == 0 else 'supplement'
+                            },
+                            'timeCommitment': 60000,
+                        }
+                    )
+                    itemIds.append(id_)
+
+                id_ = 'l%d-%d' % (i, j)
+                lessons.append(
+                    {
+                        'id': id_,
+                        'name': 'Lesson %d.%d' % (i, j),
+                        'slug': 'lesson-%d-%d' % (i, j),
+                        'itemIds': itemIds,
+                    }
+                )
+                lessonIds.append(id_)
+
+            modules.append(
+                {
+                    'id': 'm%d' % i,
+                    'name': 'Module %d' % i,
+                    'slug': 'module-%d' % i,
+                    'lessonIds': lessonIds,
+                }
+            )
+
+        return {
+            'elements': [{'id': _id(q['slug'])}],
+            'linked': {
+                'onDemandCourseMaterialModules.v1': modules,
+                'onDemandCourseMaterialLessons.v1': lessons,
+                'onDemandCourseMaterialItems.v2': items,
+            },
+        }
+
+    def _references(self, _, q):
+        id_course = q.get('courseId')
+        if not id_course:
+            return None
+
+        if q.get('q') == 'shortId':
+            ids = [q['shortId']]
+        else:
+            ids = ['r%d' % i for i in range(self._n_references)]
+
+        return {
+            'elements': [
+                {
+                    'shortId': id_,
+                    'name': 'Reference %s' % id_,
+                    'slug': 'reference-%s' % id_,
+                    'content': {
+                        'org.coursera.ondemand.reference.AssetReferenceContent': {
+                            'assetId': 'ra-%s' % id_
+                        }
+                    },
+                }
+                for id_ in ids
+            ],
+            'linked': {
+                'openCourseAssets.v1': [
+                    {
+                        'id': 'ra-%s' % id_,
+                        'typeName': 'cml',
+                        'definition': {'value': self._cml(id_course, 'ra-' + id_)},
+                    }
+                    for id_ in ids
+                ]
+            },
+        }
+
+    def _cml(self, id_course, id_):
+        '''a CML document with assets, an image and links to references'''
+
+        slug = _slug(id_course)
+        elements = ['<text>%s, which costs $$x^2$$ to read</text>' % id_]
+        elements += [
+            '<asset id="%s-a%d" name="%s-a%d" extension="pdf" assetType="generic"/>'
+            % (id_, i, id_, i)
+            for i in range(self._n_assets)
+        ]
+        elements.append('<img src="%s"/>' % self._cdn('img', id_ + '.png'))
+        # the last reference is not listed, see _references
+        elements += [
+            '<text><a href="%s/learn/%s/resources/r%d">Reference r%d</a></text>'
+            % (self.url, slug, i, i)
+            for i in range(self._n_references + 1)
+        ]
+        return '<co-content>%s</co-content>' % ''.join(elements)
+
+    def _lecture_1(self, parts, _):
+        if len(parts) == 0:
+            return None
+        id_course, _, id_ = parts[0].partition('~')
+
+        return {
+            'linked': {
+                'onDemandVideos.v1': [
+                    {
+                        'subtitles': {
+                            'en': '/cdn/subtitle/%s/%s.srt' % (id_course, id_)
+                        },
+                        'sources': {
+                            'byResolution': {
+                                res: {
+                                    'mp4VideoUrl': self._cdn(
+                                        'video', id_course, '%s-%s.mp4' % (id_, res)
+                                    )
+                                }
+                                for res in ['360p', '720p']
+                            }
+                        },
+                    }
+                ]
+            }
+        }
+
+    def _lecture_2(self, parts, _):
+        if len(parts) == 0:
+            return None
+        id_course, _, id_ = parts[0].partition('~')
+
+        assets = [
+            {
+                'id': '%s-oa%d' % (id_, i),
+                'typeName': 'asset',
+                'definition': {'assetId': '%s-a%d' % (id_, i)},
+            }
+            for i in range(self._n_assets)
+        ]
+        assets.append(
+            {
+                'id': '%s-url' % id_,
+                'typeName': 'url',
+                'definition': {
+                    'url': self._cdn('url', id_course, id_ + '.html'),
+                    'name': '%s.html' % id_,
+                },
+            }
+        )
+        return {'linked': {'openCourseAssets.v1': assets}}
+
+    def _supplement(self, parts, _):
+        if len(parts) == 0:
+            return None
+        id_course, _, id_ = parts[0].partition('~')
+
+        return {
+            'linked': {
+                'openCourseAssets.v1': [
+                    {
+                        'typeName': 'cml',
+                        'definition': {'value': self._cml(id_course, id_)},
+                    }
+                ]
+            }
+        }
+
+    def _assets(self, _, q):
+        if not q.get('ids'):
+            return None
+
+        return {
+            'elements': [
+                {
+                    'id': id_,
+                    'name': id_,
+                    'fileExtension': 'pdf',
+                    'url': {'url': self._cdn('asset', id_ + '.pdf')},
+                }
+                for id_ in q['ids'].split(',')
+            ]
+        }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Serve a mock Coursera API, see MockCoursera'
+    )
+    parser.add_argument('--port', type=int, default=8000)
+    for name in [
+        'n_courses',
+        'n_modules',
+        'n_lessons',
+        'n_items',
+        'n_references',
+        'n_assets',
+        'file_size',
+    ]:
+        parser.add_argument('--' + name.replace('_', '-'), type=int)
+    for name in ['latency', 'error_rate', 'rate', 'retry_after']:
+        parser.add_argument('--' + name.replace('_', '-'), type=float)
+
+    kwargs = {k: v for k, v in vars(parser.parse_args()).items() if v is not None}
+    with MockCoursera(**kwargs) as mock:
+        print('export DL_COURSERA_URL_ROOT=%s' % mock.url, flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
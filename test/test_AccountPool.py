@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from http.cookiejar import MozillaCookieJar
+
+from dl_coursera.lib.AccountPool import AccountPool
+from .MockCoursera import MockCoursera
+from dl_coursera.Crawler import is_not_authorized
+
+from .test_e2e import write_cookies_file
+
+
+class TestAccountPool(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _pool(self, *uids, **kwargs):
+        pool = AccountPool(len(uids), is_denied=is_not_authorized, **kwargs)
+        for account, uid in zip(pool.accounts, uids):
+            filename = os.path.join(self._tmpdir.name, 'cookies-%s.txt' % uid)
+            write_cookies_file(filename, uid)
+            cj = MozillaCookieJar()
+            cj.load(filename)
+            account.cookies.update(cj)
+        return pool
+
+    def test_by_turns(self):
+        with MockCoursera() as mock, self._pool('1', '2') as pool:
+            for _ in range(10):
+                pool.get(mock.url + '/api/onDemandCourses.v1?q=slug&slug=c')
+
+        self.assertEqual(mock.n_requests_by_user, {'1': 5, '2': 5})
+
+    def test_throttled(self):
+        with MockCoursera(rate=1, retry_after=60) as mock, self._pool('1', '2') as pool:
+            url = mock.url + '/api/onDemandCourses.v1?q=slug&slug=c'
+            statuses = [pool.get(url).status_code for _ in range(3)]
+
+        # the 3rd request is throttled with account 1, then sent with
+        # account 2, which is throttled too
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(mock.n_requests_by_user, {'1': 2, '2': 2})
+
+    def test_denied(self):
+        with MockCoursera(enrolled={'1': ['a'], '2': ['b']}) as mock, self._pool(
+            '1', '2'
+        ) as pool:
+            url = mock.url + '/api/onDemandSupplements.v1/id-b~i0-0-1'
+            sess = pool.scoped('id-b')
+            for _ in range(3):
+                self.assertEqual(sess.get(url).status_code, 200)
+
+            # account 1 is excluded from id-b after its first request
+            self.assertEqual(mock.n_requests_by_user, {'1': 1, '2': 3})
+
+            url = mock.url + '/api/onDemandSupplements.v1/id-c~i0-0-1'
+            self.assertTrue(is_not_authorized(pool.scoped('id-c').get(url)))
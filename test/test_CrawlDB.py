@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from dl_coursera.CrawlDB import CrawlDB
+from dl_coursera.define import *
+
+
+def _spec():
+    spec = Spec(id_='S', name='S', slug='s')
+    for i in range(2):
+        course = Course(id_='C%d' % i, name='C%d' % i, slug='c%d' % i)
+        for j in range(3):
+            module = CourseMaterialModule(id_='M%d' % j, name='M', slug='m')
+            lesson = CourseMaterialLesson(id_='L', name='L', slug='l')
+            lecture = CourseMaterialLecture(id_='I', name='I', slug='i', digest='x')
+            lecture['videos'].append(Video('https://x/v.mp4'))
+            lecture['assets'].append(Asset('A', 'https://x/a.pdf', 'a.pdf'))
+            lesson['items'].append(lecture)
+            module['lessons'].append(lesson)
+            course['modules'].append(module)
+
+        course['references'].append(
+            CourseReference(
+                id_='R',
+                name='R',
+                slug='r',
+                item=CourseMaterialSupplementItemCML(
+                    doc='<co-content><text>r</text></co-content>', assets=[]
+                ),
+            )
+        )
+        spec['courses'].append(course)
+    return spec
+
+
+class TestCrawlDB(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self._tmpdir.name, 'crawl.db')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_load(self):
+        db = CrawlDB(self.filename)
+        self.assertFalse(db.exists())
+        self.assertIsNone(db.load())
+
+        spec = _spec()
+        db.save(spec)
+        self.assertEqual(db.load().to_json(), spec.to_json())
+
+        course = spec['courses'][1]
+        db.save(course)
+        self.assertEqual(db.load().to_json(), course.to_json())
+
+    def test_load_lazily(self):
+        spec = _spec()
+        db = CrawlDB(self.filename)
+        db.save(spec)
+
+        self.assertEqual(db.course(1), spec['courses'][1])
+
+        soc = db.load_lazily()
+        self.assertEqual(soc['slug'], 's')
+        self.assertEqual(len(soc['courses']), 2)
+        self.assertEqual(list(soc['courses']), spec['courses'])
+
+        db.save(spec['courses'][1])
+        self.assertEqual(db.load_lazily(), spec['courses'][1])
+
+    def test_schema(self):
+        db = CrawlDB(self.filename)
+        db.save(_spec())
+
+        conn = sqlite3.connect(self.filename)
+        conn.execute('PRAGMA user_version = 0')
+        conn.close()
+        self.assertIsNone(db.load())
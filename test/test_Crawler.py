@@ -0,0 +1,511 @@
+import concurrent.futures
+import tempfile
+import threading
+import time
+import unittest
+from urllib.parse import urlparse, parse_qs
+
+from dl_coursera.Crawler import (
+    Crawler,
+    KEY_API,
+    MAX_ASSET_IDS,
+    MAX_URL_LENGTH,
+    _batch_asset_ids,
+)
+from dl_coursera.CourseStore import CourseStore
+from dl_coursera.define import URL_ASSET, Course, CookiesExpiredException
+from dl_coursera.lib.TaskScheduler import TaskScheduler
+
+
+def _cml(*refids):
+    return '<co-content>%s</co-content>' % ''.join(
+        '<a href="https://www.coursera.org/learn/c/resources/%s">x</a>' % _
+        for _ in refids
+    )
+
+
+def _ref(id_, *refids):
+    return {
+        'shortId': id_,
+        'name': id_,
+        'slug': id_,
+        'content': {
+            'org.coursera.ondemand.reference.AssetReferenceContent': {
+                'assetId': 'asset-' + id_
+            }
+        },
+    }, {'id': 'asset-' + id_, 'typeName': 'cml', 'definition': {'value': _cml(*refids)}}
+
+
+class _Response:
+    status_code = 200
+
+    def __init__(self, d):
+        self._d = d
+
+    def json(self):
+        return self._d
+
+
+class _Session:
+    '''a course of 8 supplements, which refer to listed and unlisted references'''
+
+    def __init__(self):
+        self.ids = ['S%d' % _ for _ in range(8)]
+        self.renamed = set()
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        u = urlparse(url)
+        q = parse_qs(u.query)
+
+        if 'onDemandSpecializations.v1' in u.path:
+            slug = q['slug'][0]
+            d = {
+                'elements': [
+                    {'id': slug, 'name': slug, 'slug': slug, 'courseIds': ['C']}
+                ],
+                'linked': {'courses.v1': [{'id': 'C', 'slug': 'c'}]},
+            }
+        elif 'onDemandCourses.v1' in u.path:
+            d = {'elements': [{'id': 'C', 'name': 'C', 'slug': 'c'}]}
+        elif 'onDemandCourseMaterials.v2' in u.path:
+            ids = self.ids
+            d = {
+                'linked': {
+                    'onDemandCourseMaterialItems.v2': [
+                        {
+                            'id': _,
+                            'name': _ + ('*' if _ in self.renamed else ''),
+                            'slug': _,
+                            'contentSummary': {'typeName': 'supplement'},
+                        }
+                        for _ in ids
+                    ],
+                    'onDemandCourseMaterialLessons.v1': [
+                        {'id': 'L', 'name': 'L', 'slug': 'l', 'itemIds': ids}
+                    ],
+                    'onDemandCourseMaterialModules.v1': [
+                        {'id': 'M', 'name': 'M', 'slug': 'm', 'lessonIds': ['L']}
+                    ],
+                }
+            }
+        elif 'onDemandReferences.v1' in u.path:
+            if q['q'] == ['courseListed']:
+                # slow, so that supplements are crawled meanwhile
+                time.sleep(0.05)
+                refs = [_ref('R0', 'R1'), _ref('R1')]
+            else:
+                refs = [_ref(q['shortId'][0])]
+            d = {
+                'elements': [_[0] for _ in refs],
+                'linked': {'openCourseAssets.v1': [_[1] for _ in refs]},
+            }
+        elif 'onDemandSupplements.v1' in u.path:
+            doc = _cml('R0', 'R1', 'R2', 'R3')
+            d = {
+                'linked': {
+                    'openCourseAssets.v1': [
+                        {'typeName': 'cml', 'definition': {'value': doc}}
+                    ]
+                }
+            }
+        else:
+            raise KeyError(url)
+
+        return _Response(d)
+
+
+class _AssetSession(_Session):
+    '''
+    supplements with an asset each. Requests of those of @abort_on abort
+    the crawling on the scheduler ts, and assets.v1 fails while fail_assets
+    is set
+    '''
+
+    def __init__(self, abort_on=()):
+        super().__init__()
+        self.abort_on = abort_on
+        self.ts = None
+        self.fail_assets = False
+
+    def get(self, url):
+        u = urlparse(url)
+        if 'onDemandSupplements.v1' in u.path:
+            self.urls.append(url)
+            id_ = u.path.split('~')[-1]
+            if id_ in self.abort_on:
+                self.ts.abort(CookiesExpiredException())
+
+            doc = '<co-content><asset id="A-%s"/></co-content>' % id_
+            d = {
+                'linked': {
+                    'openCourseAssets.v1': [
+                        {'typeName': 'cml', 'definition': {'value': doc}}
+                    ]
+                }
+            }
+        elif 'assets.v1' in u.path:
+            self.urls.append(url)
+            if self.fail_assets:
+                return _Response({'errorCode': 'Bad Request'})
+            d = {
+                'elements': [
+                    {
+                        'id': _,
+                        'url': {'url': 'https://x/%s.pdf' % _},
+                        'name': _,
+                        'fileExtension': 'pdf',
+                    }
+                    for _ in parse_qs(u.query)['ids'][0].split(',')
+                ]
+            }
+        else:
+            return super().get(url)
+
+        return _Response(d)
+
+
+class _LectureSession(_AssetSession):
+    '''a course of 8 lectures, which have a video and an asset each'''
+
+    def get(self, url):
+        u = urlparse(url)
+        if 'onDemandCourseMaterials.v2' in u.path:
+            resp = super().get(url)
+            for _ in resp.json()['linked']['onDemandCourseMaterialItems.v2']:
+                _['contentSummary'] = {'typeName': 'lecture'}
+            return resp
+
+        if 'onDemandLectureVideos.v1' in u.path:
+            d = {
+                'linked': {
+                    'onDemandVideos.v1': [
+                        {
+                            'subtitles': {},
+                            'sources': {'byResolution': {'720p': {'mp4VideoUrl': url}}},
+                        }
+                    ]
+                }
+            }
+        elif 'onDemandLectureAssets.v1' in u.path:
+            id_ = u.path.split('~')[-1].strip('/')
+            d = {
+                'linked': {
+                    'openCourseAssets.v1': [
+                        {'typeName': 'asset', 'definition': {'assetId': 'A-' + id_}}
+                    ]
+                }
+            }
+        else:
+            return super().get(url)
+
+        self.urls.append(url)
+        return _Response(d)
+
+
+class _DeniedSession(_Session):
+    '''an account not enrolled in the courses of @slugs'''
+
+    def __init__(self, slugs):
+        super().__init__()
+        self.slugs = slugs
+
+    def get(self, url):
+        q = parse_qs(urlparse(url).query)
+        if q.get('slug', [None])[0] in self.slugs:
+            self.urls.append(url)
+            return _Response(
+                {'errorCode': 'Not Authorized', 'message': None, 'details': None}
+            )
+        return super().get(url)
+
+
+class _AbortedTaskScheduler(TaskScheduler):
+    '''
+    Once the run is aborted, add_task returns a task without dependencies
+    only after a worker failed it, as a worker may do before add_task returns
+    '''
+
+    def add_task(self, task, *, depends_on=None):
+        res = super().add_task(task, depends_on=depends_on)
+        if self._aborted is not None and not depends_on:
+            concurrent.futures.wait([res.future], timeout=1)
+        return res
+
+
+class TestCrawler(unittest.TestCase):
+    def test_crawl_concurrently(self):
+        with TaskScheduler() as ts:
+            ts.start(n_worker=8)
+            crawler = Crawler(ts=ts, sess=_Session())
+            course = Course(slug='c')
+            crawler.crawl_course(course=course)
+            self.assertEqual(ts.wait(), [])
+
+        # each reference is crawled once, the listed ones first
+        refs = course['references']
+        self.assertEqual([_['id'] for _ in refs[:2]], ['R0', 'R1'])
+        self.assertEqual(sorted(_['id'] for _ in refs[2:]), ['R2', 'R3'])
+        for _ in refs:
+            self.assertIsNotNone(_['item'])
+
+        for _ in course['modules'][0]['lessons'][0]['items']:
+            self.assertEqual(len(_['items']), 1)
+
+    def test_crawl_incrementally(self):
+        def _crawl(sess, prev=None):
+            with TaskScheduler() as ts:
+                ts.start(n_worker=8)
+                crawler = Crawler(ts=ts, sess=sess)
+                course = Course(slug='c')
+                crawler.crawl_course(course=course, prev=prev)
+                self.assertEqual(ts.wait(), [])
+            return course, crawler.delta
+
+        sess = _Session()
+        prev, delta = _crawl(sess)
+        self.assertEqual(len(delta['added']), 8 + 4)
+
+        # S0 is removed, S1 is changed and S8 is added
+        sess.ids = ['S%d' % _ for _ in range(1, 9)]
+        sess.renamed = {'S1'}
+        sess.urls = []
+        course, delta = _crawl(sess, prev)
+
+        def _ids(kind):
+            return sorted(_['id'] for _ in delta[kind])
+
+        self.assertEqual(_ids('added'), ['S8'])
+        self.assertEqual(_ids('changed'), ['S1'])
+        self.assertEqual(_ids('removed'), ['S0'])
+
+        self.assertEqual(
+            sorted(urlparse(_).path.split('/')[2] for _ in sess.urls),
+            [
+                'onDemandCourseMaterials.v2',
+                'onDemandReferences.v1',
+                'onDemandSupplements.v1',
+                'onDemandSupplements.v1',
+            ],
+        )
+
+        items = course['modules'][0]['lessons'][0]['items']
+        self.assertEqual([_['id'] for _ in items], sess.ids)
+        self.assertEqual(items[0]['name'], 'S1*')
+        self.assertIs(items[1], prev['modules'][0]['lessons'][0]['items'][2])
+        for _ in items:
+            self.assertEqual(len(_['items']), 1)
+
+        self.assertEqual(
+            sorted(_['id'] for _ in course['references']), ['R0', 'R1', 'R2', 'R3']
+        )
+
+    def test_course_store(self):
+        def _crawl(sess, store):
+            with TaskScheduler() as ts:
+                ts.start(n_worker=8)
+                crawler = Crawler(ts=ts, sess=sess, store=store)
+                crawler._loggedin = True
+                course = crawler.crawl(slug='c', is_spec=False)
+            return course
+
+        with tempfile.TemporaryDirectory() as dirname:
+            sess = _Session()
+            course = _crawl(sess, CourseStore(dirname))
+
+            # e.g. the course is part of another specialization
+            sess.urls = []
+            self.assertEqual(_crawl(sess, CourseStore(dirname)), course)
+            self.assertEqual(
+                [urlparse(_).path.split('/')[2] for _ in sess.urls],
+                ['onDemandCourses.v1', 'onDemandCourseMaterials.v2'],
+            )
+
+            sess.renamed = {'S1'}
+            sess.urls = []
+            self.assertNotEqual(
+                _crawl(sess, CourseStore(dirname))['version'], course['version']
+            )
+            self.assertGreater(len(sess.urls), 2)
+
+            sess.urls = []
+            _crawl(sess, CourseStore(dirname, max_age=0))
+            self.assertGreater(len(sess.urls), 2)
+
+    def test_failed_assets(self):
+        def _crawl(sess, store, prev=None):
+            with TaskScheduler() as ts:
+                ts.start(n_worker=8)
+                crawler = Crawler(ts=ts, sess=sess, store=store)
+                crawler._loggedin = True
+                course = crawler.start(slug='c', is_spec=False, prev=prev)
+                failures = ts.wait()
+                crawler.finish(course, failures)
+            return course, failures
+
+        def _n_lectures(sess):
+            return len([_ for _ in sess.urls if 'onDemandLectureAssets.v1' in _])
+
+        with tempfile.TemporaryDirectory() as dirname:
+            sess = _LectureSession()
+            sess.fail_assets = True
+            prev, failures = _crawl(sess, CourseStore(dirname))
+            self.assertGreater(len(failures), 0)
+            # all but the batched lookups, which are shared by courses
+            for task, _ in failures:
+                if 'ids' not in task.kwargs:
+                    self.assertIs(task.kwargs['course'], prev)
+            for _ in prev['modules'][0]['lessons'][0]['items']:
+                self.assertEqual((_['videos'], _['assets']), ([], []))
+
+            # neither stored nor reused, so the lectures are crawled again
+            sess.fail_assets = False
+            sess.urls = []
+            course, failures = _crawl(sess, CourseStore(dirname), prev)
+            self.assertEqual(failures, [])
+            self.assertEqual(_n_lectures(sess), 8)
+            for _ in course['modules'][0]['lessons'][0]['items']:
+                self.assertEqual((len(_['videos']), len(_['assets'])), (1, 1))
+
+            sess.urls = []
+            self.assertEqual(_crawl(sess, CourseStore(dirname))[0], course)
+            self.assertEqual(_n_lectures(sess), 0)
+
+    def test_crawlers_on_one_scheduler(self):
+        sess = _Session()
+        courses = {}
+        with TaskScheduler() as ts:
+            ts.start(n_worker=8)
+            crawlers = []
+            for slug in ['s1', 's2']:
+                crawler = Crawler(ts=ts, sess=sess, courses=courses)
+                crawler._loggedin = True
+                crawlers.append((crawler, crawler.start(slug=slug, is_spec=True)))
+
+            failures = ts.wait()
+            self.assertEqual(failures, [])
+            for crawler, spec in crawlers:
+                crawler.finish(spec, failures)
+
+        # the course shared by the specializations is crawled once
+        spec1, spec2 = [_[1] for _ in crawlers]
+        self.assertIs(spec1['courses'][0], spec2['courses'][0])
+        self.assertEqual(
+            len([_ for _ in sess.urls if 'onDemandCourseMaterials.v2' in _]), 1
+        )
+        self.assertEqual(
+            len(spec1['courses'][0]['modules'][0]['lessons'][0]['items']), 8
+        )
+
+    def test_course_on_its_own_and_in_spec(self):
+        sess = _Session()
+        courses = {}
+        with TaskScheduler() as ts:
+            ts.start(n_worker=8)
+            crawlers = []
+            for slug, is_spec in [('s1', True), ('c', False)]:
+                crawler = Crawler(ts=ts, sess=sess, courses=courses)
+                crawler._loggedin = True
+                crawlers.append((crawler, crawler.start(slug=slug, is_spec=is_spec)))
+
+            failures = ts.wait()
+            self.assertEqual(failures, [])
+            for crawler, soc in crawlers:
+                crawler.finish(soc, failures)
+
+        # the course is crawled once, whichever crawler claims it first
+        spec, course = [_[1] for _ in crawlers]
+        self.assertEqual(spec['courses'][0], course)
+        self.assertEqual(
+            len([_ for _ in sess.urls if 'onDemandCourseMaterials.v2' in _]), 1
+        )
+        self.assertEqual(len(course['modules'][0]['lessons'][0]['items']), 8)
+
+    def test_not_authorized(self):
+        with TaskScheduler() as ts:
+            ts.start(n_worker=8)
+            crawler = Crawler(ts=ts, sess=_DeniedSession(['d']))
+            courses = [Course(slug='c'), Course(slug='d')]
+            for _ in courses:
+                crawler.crawl_course(course=_)
+
+            # the course not enrolled in fails, and the other is crawled
+            failures = ts.wait()
+            self.assertEqual(len(failures), 1)
+            self.assertIs(failures[0][0].kwargs['course'], courses[1])
+            self.assertIn('BadResponseException', failures[0][1])
+
+        items = courses[0]['modules'][0]['lessons'][0]['items']
+        self.assertEqual(len(items), 8)
+        for _ in items:
+            self.assertEqual(len(_['items']), 1)
+
+    def _crawl_aborted(self, n_worker, abort_on, TaskSchedulerFactory=TaskScheduler):
+        '''crawl a course whose supplements of @abort_on abort the run'''
+
+        sess = _AssetSession(abort_on=abort_on)
+        sess.ts = ts = TaskSchedulerFactory()
+        ts.start(n_worker=n_worker)
+        Crawler(ts=ts, sess=sess).crawl_course(course=Course(slug='c'))
+
+        res = []
+
+        def _wait():
+            try:
+                ts.wait()
+            except CookiesExpiredException as e:
+                res.append(e)
+
+        t = threading.Thread(target=_wait, daemon=True)
+        t.start()
+        t.join(10)
+        # the workers may be stuck otherwise, so the scheduler is shut down
+        # only then
+        self.assertFalse(t.is_alive())
+        ts.shutdown()
+        self.assertEqual(len(res), 1)
+
+    def test_abort_with_assets_pending(self):
+        # with one worker, flush_assets is the last task, and the run is
+        # aborted before it takes the asset IDs
+        self._crawl_aborted(1, ['S7'])
+
+        # the assets of S0 are asked for after the run is aborted, and
+        # flush_assets fails before it is given a callback
+        self._crawl_aborted(2, ['S0'], _AbortedTaskScheduler)
+
+    def test_batch_assets_limited(self):
+        sess = _AssetSession()
+        sess.ids = ['S%d' % _ for _ in range(24)]
+        with TaskScheduler() as ts:
+            ts.start(n_worker=8)
+            ts.set_limit(KEY_API, max_inflight=2, rate=50, burst=1)
+            crawler = Crawler(ts=ts, sess=sess)
+            course = Course(slug='c')
+            crawler.crawl_course(course=course)
+            self.assertEqual(ts.wait(), [])
+
+        # the assets are looked up after the supplements, rather than as
+        # soon as the limit blocks the API
+        self.assertLessEqual(len([_ for _ in sess.urls if 'assets.v1' in _]), 2)
+        for _ in course['modules'][0]['lessons'][0]['items']:
+            self.assertEqual(len(_['items'][0]['assets']), 1)
+
+    def test_batch_asset_ids(self):
+        ids = ['%06d' % _ for _ in range(MAX_ASSET_IDS * 3)]
+        batches = list(_batch_asset_ids(ids))
+
+        self.assertEqual(sum(batches, []), ids)
+        for _ in batches:
+            self.assertLessEqual(len(_), MAX_ASSET_IDS)
+            self.assertLessEqual(len(URL_ASSET(_)), MAX_URL_LENGTH)
+
+        ids = ['x' * 100 for _ in range(MAX_ASSET_IDS)]
+        batches = list(_batch_asset_ids(ids))
+        self.assertGreater(len(batches), 1)
+        for _ in batches:
+            self.assertLessEqual(len(URL_ASSET(_)), MAX_URL_LENGTH)
+
+        self.assertEqual(list(_batch_asset_ids([])), [])
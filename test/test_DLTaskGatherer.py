@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+from dl_coursera.DLTaskGatherer import DLTaskGatherer, _Renderer
+from dl_coursera.define import *
+from dl_coursera.lib.TaskScheduler import TaskScheduler
+
+from .test_RenderCache import _cml, _course
+
+
+def _files(dirname):
+    '''{path: content} of the files under @dirname'''
+
+    d = {}
+    for dirpath, _, filenames in os.walk(dirname):
+        for filename in filenames:
+            filename = os.path.join(dirpath, filename)
+            with open(filename, 'rb') as ifs:
+                d[os.path.relpath(filename, dirname)] = ifs.read()
+    return d
+
+
+class TestDLTaskGatherer(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.dirname = self._tmpdir.name
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_parallel(self):
+        spec = Spec(id_='S', name='S', slug='s')
+        for i in range(3):
+            course = _course('c%d' % i, 'text %d' % i)
+            lesson = course['modules'][0]['lessons'][0]
+            for j in range(1, 4):
+                supplement = CourseMaterialSupplement(
+                    id_='S%d' % j, name='S', slug='s%d' % j, digest='x'
+                )
+                supplement['items'].append(_cml('text %d %d' % (i, j)))
+                lesson['items'].append(supplement)
+            spec['courses'].append(course)
+
+        li = []
+        n_done = []
+        for parallel in [False, True]:
+            outdir = os.path.join(self.dirname, str(parallel))
+            with TaskScheduler() as ts:
+                ts.start(n_worker=2, n_process=2, hook_done=lambda _: n_done.append(_))
+                dl_tasks = DLTaskGatherer(
+                    soc=spec, outdir=outdir, ts=ts if parallel else None
+                ).gather()
+                self.assertEqual(ts.wait(), [])
+            li.append(
+                (
+                    [os.path.relpath(_['filename'], outdir) for _ in dl_tasks],
+                    _files(outdir),
+                )
+            )
+
+        self.assertEqual(li[0], li[1])
+        # 12 supplements and 3 references, the first few of which are
+        # rendered in this process
+        self.assertEqual(len([_ for _ in li[0][1] if _.endswith('.html')]), 15)
+        self.assertEqual(len(n_done), 15 - _Renderer._N_INLINE)
+
+    def test_stream(self):
+        course = _course('c', 'text')
+        lesson = course['modules'][0]['lessons'][0]
+        for i in range(1, 8):
+            supplement = CourseMaterialSupplement(
+                id_='S%d' % i, name='S', slug='s%d' % i, digest='x'
+            )
+            supplement['items'].append(_cml('text %d' % i))
+            lesson['items'].append(supplement)
+
+        it = DLTaskGatherer(soc=course, outdir=self.dirname).iter_dl_tasks()
+        # the asset of the reference and those of 6 supplements
+        for _ in range(7):
+            next(it)
+        # at most 2 pages are held, so the first ones are written already
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.dirname, 'c', '01@m', '01@l', '01@s', '01@s.html')
+            )
+        )
+
+        self.assertEqual(len(list(it)), 2)
+        self.assertEqual(
+            len([_ for _ in _files(self.dirname) if _.endswith('.html')]), 9
+        )
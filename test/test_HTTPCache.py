@@ -0,0 +1,80 @@
+import tempfile
+import unittest
+
+from dl_coursera.lib.HTTPCache import HTTPCache
+
+
+class _Response:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class _Session:
+    def __init__(self):
+        self.requests = []
+        self.body = {'n': 0}
+        self.etag = '"1"'
+
+    def get(self, url, headers=None):
+        self.requests.append((url, headers))
+        if headers.get('If-None-Match') == self.etag:
+            return _Response(304)
+        return _Response(200, self.body, {'ETag': self.etag})
+
+
+class TestHTTPCache(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.dirname = self._tmpdir.name
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_ttl(self):
+        cache = HTTPCache(self.dirname, ttls=[(r'/a', 100)], default_ttl=0)
+        sess = _Session()
+
+        self.assertEqual(cache.get_json(sess, 'http://x/a'), {'n': 0})
+        self.assertEqual(cache.get_json(sess, 'http://x/a'), {'n': 0})
+        self.assertEqual(len(sess.requests), 1)
+
+        # another cache on the same directory, e.g. in the next run
+        cache = HTTPCache(self.dirname, ttls=[(r'/a', 100)], max_memory=0)
+        self.assertEqual(cache.get_json(sess, 'http://x/a'), {'n': 0})
+        self.assertEqual(len(sess.requests), 1)
+
+    def test_revalidate(self):
+        cache = HTTPCache(self.dirname)
+        sess = _Session()
+
+        cache.get_json(sess, 'http://x/b')
+        self.assertEqual(cache.get_json(sess, 'http://x/b'), {'n': 0})
+        self.assertEqual(sess.requests[1], ('http://x/b', {'If-None-Match': '"1"'}))
+
+        sess.body = {'n': 1}
+        sess.etag = '"2"'
+        self.assertEqual(cache.get_json(sess, 'http://x/b'), {'n': 1})
+
+    def test_check(self):
+        cache = HTTPCache(self.dirname, default_ttl=100)
+        sess = _Session()
+
+        def _check(resp):
+            raise ValueError()
+
+        self.assertRaises(ValueError, cache.get_json, sess, 'http://x/c', check=_check)
+        cache.get_json(sess, 'http://x/c')
+        self.assertEqual(len(sess.requests), 2)
+
+    def test_lru(self):
+        cache = HTTPCache(self.dirname, default_ttl=100, max_memory=2)
+        sess = _Session()
+
+        for _ in 'abc':
+            cache.get_json(sess, 'http://x/' + _)
+        self.assertEqual(list(cache._lru), ['http://x/b', 'http://x/c'])
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from dl_coursera.DLTaskGatherer import DLTaskGatherer
+from dl_coursera.RenderCache import RenderCache
+from dl_coursera.define import *
+
+
+def _cml(text):
+    doc = (
+        '<co-content><text>%s <a href="https://www.coursera.org/learn/c/resources/R">'
+        'R</a></text><asset id="A"/></co-content>' % text
+    )
+    return CourseMaterialSupplementItemCML(
+        doc=doc, assets=[Asset('A', 'https://x/a.pdf', 'a.pdf')]
+    )
+
+
+def _course(slug, text):
+    course = Course(id_='C', name='C', slug=slug)
+    course['references'].append(
+        CourseReference(id_='R', name='R', slug='r', item=_cml('ref'))
+    )
+
+    module = CourseMaterialModule(id_='M', name='M', slug='m')
+    lesson = CourseMaterialLesson(id_='L', name='L', slug='l')
+    supplement = CourseMaterialSupplement(id_='S', name='S', slug='s', digest='x')
+    supplement['items'].append(_cml(text))
+    lesson['items'].append(supplement)
+    module['lessons'].append(lesson)
+    course['modules'].append(module)
+    return course
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.dirname = self._tmpdir.name
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_get(self):
+        dirname = os.path.join(self.dirname, 'rendered')
+        cache = RenderCache(dirname, max_memory=1)
+        key_a = cache.key('a', [1])
+        key_b = cache.key('b', [1])
+        self.assertNotEqual(key_a, key_b)
+
+        self.assertIsNone(cache.get(key_a))
+        cache.put(key_a, b'A')
+        cache.put(key_b, b'B')
+        self.assertEqual(cache.get(key_a), b'A')
+        self.assertEqual(cache.get(key_b), b'B')
+
+        # another cache on the same directory, e.g. in the next run
+        cache = RenderCache(dirname)
+        self.assertEqual(cache.get(key_a), b'A')
+
+        # in memory only
+        cache = RenderCache(max_memory=1)
+        cache.put(key_a, b'A')
+        cache.put(key_b, b'B')
+        self.assertIsNone(cache.get(key_a))
+        self.assertEqual(cache.get(key_b), b'B')
+        self.assertEqual((cache.n_hits, cache.n_misses), (1, 1))
+
+    def _gather(self, cache, course, outdir):
+        '''the supplements gathered to @outdir'''
+
+        outdir = os.path.join(self.dirname, outdir)
+        DLTaskGatherer(soc=course, outdir=outdir, render_cache=cache).gather()
+
+        li = []
+        for dirpath, dirnames, filenames in os.walk(outdir):
+            dirnames[:] = sorted(_ for _ in dirnames if _ != 'resource')
+            for filename in sorted(filenames):
+                with open(os.path.join(dirpath, filename), 'rb') as ifs:
+                    li.append(ifs.read())
+        return li
+
+    def test_gather(self):
+        cache = RenderCache()
+        pages = self._gather(cache, _course('c', 'text'), 'out-1')
+        self.assertEqual(len(pages), 2)
+        self.assertEqual((cache.n_hits, cache.n_misses), (0, 2))
+
+        # the same course elsewhere
+        self.assertEqual(self._gather(cache, _course('c2', 'text'), 'out-2'), pages)
+        self.assertEqual((cache.n_hits, cache.n_misses), (2, 2))
+
+        # the supplement changed, and only it is rendered again
+        self._gather(cache, _course('c', 'new text'), 'out-3')
+        self.assertEqual((cache.n_hits, cache.n_misses), (3, 3))
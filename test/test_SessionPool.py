@@ -0,0 +1,27 @@
+import threading
+import unittest
+
+from dl_coursera.lib.SessionPool import SessionPool
+
+
+class TestSessionPool(unittest.TestCase):
+    def test_per_thread(self):
+        with SessionPool(pool_maxsize=4) as pool:
+            sess = pool.session()
+            self.assertIs(pool.session(), sess)
+
+            pool.cookies.set('CAUTH', 'x', domain='.coursera.org')
+
+            others = []
+            t = threading.Thread(target=lambda: others.append(pool.session()))
+            t.start()
+            t.join()
+
+            other = others[0]
+            self.assertIsNot(other, sess)
+            self.assertIs(other.cookies, sess.cookies)
+            self.assertEqual(other.cookies.get('CAUTH'), 'x')
+            self.assertIs(
+                other.get_adapter('https://www.coursera.org'),
+                sess.get_adapter('https://www.coursera.org'),
+            )
@@ -0,0 +1,607 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from dl_coursera.lib.TaskScheduler import (
+    Backoff,
+    FuncTask,
+    ProcessFuncTask,
+    Task,
+    TaskScheduler,
+)
+from dl_coursera.lib.AsyncTaskScheduler import AsyncTaskScheduler
+from dl_coursera.lib.AutoScaler import AutoScaler
+from dl_coursera.lib.TaskQueue import TaskQueue, TokenBucket
+from dl_coursera.lib.RetryPolicy import RetryPolicy
+from dl_coursera.lib.Tracer import Tracer
+from dl_coursera.lib.Journal import Journal
+
+
+def _pid_square(*, x):
+    return os.getpid(), x * x
+
+
+class _TestTaskScheduler:
+    TaskSchedulerFactory = None
+
+    def setUp(self):
+        self.ts = self.TaskSchedulerFactory()
+
+    def tearDown(self):
+        self.ts.shutdown()
+
+    def test_fanout(self):
+        ts = self.ts
+        lock = threading.Lock()
+        res = []
+
+        @ts.register_task
+        def f(*, n):
+            with lock:
+                res.append(n)
+            if n < 3:
+                f(n=n + 1)
+                f(n=n + 1)
+
+        ts.start(n_worker=4)
+        f(n=1)
+        self.assertEqual(ts.wait(), [])
+        self.assertEqual(sorted(res), [1, 2, 2, 3, 3, 3, 3])
+
+    def test_retry_and_failure(self):
+        ts = self.ts
+        counter = {'ok': 0, 'bad': 0}
+
+        @ts.register_task(ttl=3)
+        def ok():
+            counter['ok'] += 1
+            if counter['ok'] < 2:
+                raise ValueError()
+
+        @ts.register_task(ttl=2)
+        def bad(*, x):
+            counter['bad'] += 1
+            raise ValueError(x)
+
+        n_retry = 0
+
+        def _hook_retry(event):
+            nonlocal n_retry
+            n_retry += 1
+            self.assertIsInstance(event.error, ValueError)
+
+        ts.start(n_worker=1, hook_retry=_hook_retry, backoff=Backoff(base=0.01))
+        ok()
+        bad(x=1)
+        failures = ts.wait()
+
+        self.assertEqual(counter, {'ok': 2, 'bad': 2})
+        self.assertEqual(n_retry, 2)
+        self.assertEqual([_1.kwargs for _1, _2 in failures], [{'x': 1}])
+
+    def test_retry_policy(self):
+        ts = self.ts
+        counter = {'f': 0, 'g': 0, 'h': 0}
+
+        @ts.register_task(ttl=3)
+        def f():
+            counter['f'] += 1
+            raise KeyError()
+
+        @ts.register_task(ttl=3)
+        def g():
+            counter['g'] += 1
+            raise _HTTPError(404)
+
+        @ts.register_task(ttl=2)
+        def h():
+            counter['h'] += 1
+            if counter['h'] == 1:
+                raise _HTTPError(503, {'Retry-After': '0.1'})
+            return time.monotonic()
+
+        ts.start(
+            n_worker=2,
+            backoff=Backoff(base=0.01),
+            retry_policy=RetryPolicy(fail_on=(KeyError,)),
+        )
+        t0 = time.monotonic()
+        f()
+        g()
+        fut = h()
+        self.assertEqual(len(ts.wait()), 2)
+
+        self.assertEqual(counter, {'f': 1, 'g': 1, 'h': 2})
+        self.assertGreaterEqual(fut.result() - t0, 0.1)
+
+    def test_abort(self):
+        ts = self.ts
+        res = []
+
+        @ts.register_task(priority='B')
+        def f():
+            raise PermissionError()
+
+        @ts.register_task
+        def g(*, n):
+            res.append(n)
+
+        policy = RetryPolicy(abort_on=(PermissionError,))
+        f()
+        for n in range(5):
+            g(n=n)
+        ts.start(n_worker=1, retry_policy=policy)
+        self.assertRaises(PermissionError, ts.wait)
+        self.assertEqual(res, [])
+
+        # the scheduler can go on after an abort
+        g(n=5)
+        self.assertEqual(ts.wait(), [])
+        self.assertEqual(res, [5])
+
+    def test_trace(self):
+        ts = self.ts
+        events = []
+        tracer = Tracer()
+
+        @ts.register_task(ttl=2, priority='B')
+        def f():
+            if ts.current_task().n_try < 2:
+                raise ValueError()
+
+        @ts.register_task
+        def bad():
+            raise ValueError()
+
+        @ts.register_task
+        def g():
+            pass
+
+        ts.start(
+            n_worker=2,
+            hook_add=events.append,
+            hook_start=events.append,
+            hook_done=events.append,
+            hook_retry=events.append,
+            hook_failed=events.append,
+            tracer=tracer,
+            backoff=Backoff(base=0.01),
+        )
+        f()
+        g(depends_on=[bad()])
+        ts.wait()
+
+        kinds = {}
+        for _ in events:
+            kinds.setdefault(_.task._func.__name__, []).append(_.kind)
+        self.assertEqual(kinds['f'], ['add', 'start', 'retry', 'start', 'done'])
+        self.assertEqual(kinds['g'], ['add', 'failed'])
+
+        spans = sorted(
+            (_.attempt, _.outcome, _.priority)
+            for _ in tracer.spans
+            if _.name.endswith('. f')
+        )
+        self.assertEqual(spans, [(1, 'retry', 'B'), (2, 'done', 'B')])
+
+        trace = tracer.to_chrome_trace()['traceEvents']
+        self.assertEqual(len([_ for _ in trace if _['ph'] == 'X']), 3)
+        self.assertEqual(len([_ for _ in trace if _['ph'] == 'i']), 1)
+        for _ in trace:
+            if _['ph'] == 'X':
+                self.assertGreaterEqual(_['args']['queued_us'], 0)
+
+    def test_backoff(self):
+        ts = self.ts
+        res = []
+
+        @ts.register_task(ttl=4)
+        def f():
+            res.append(time.monotonic())
+            raise ValueError()
+
+        @ts.register_task
+        def g():
+            res.append('g')
+
+        ts.start(n_worker=2, backoff=Backoff(base=0.05, jitter=0))
+        f()
+        time.sleep(0.01)
+        g()
+        self.assertEqual(len(ts.wait()), 1)
+
+        # g runs while f is waiting to be retried
+        self.assertEqual(res[1], 'g')
+        del res[1]
+        for i, delay in enumerate([0.05, 0.1, 0.2]):
+            self.assertGreaterEqual(res[i + 1] - res[i], delay)
+
+    def test_future(self):
+        ts = self.ts
+
+        @ts.register_task
+        def add(*, x, y):
+            return x + y
+
+        @ts.register_task
+        def div(*, x, y):
+            return x / y
+
+        ts.start(n_worker=2)
+        fut_1 = add(x=1, y=2)
+        fut_2 = div(x=1, y=0)
+        self.assertEqual(fut_1.result(timeout=1), 3)
+        self.assertIsInstance(fut_2.exception(timeout=1), ZeroDivisionError)
+        self.assertEqual(len(ts.wait()), 1)
+
+    def test_depends_on(self):
+        ts = self.ts
+        res = []
+
+        @ts.register_task
+        def f(*, n):
+            time.sleep(0.02 * n)
+            res.append(n)
+            return n
+
+        @ts.register_task
+        def g(*, futs):
+            res.append('g')
+            return sum(_.result() for _ in futs)
+
+        @ts.register_task
+        def bad():
+            raise ValueError()
+
+        @ts.register_task
+        def h():
+            res.append('h')
+
+        ts.start(n_worker=4)
+        futs = [f(n=n) for n in [3, 1, 2]]
+        fut_g = g(futs=futs, depends_on=futs)
+        fut_h = h(depends_on=[futs[0], bad()])
+        failures = ts.wait()
+
+        self.assertEqual(res, [1, 2, 3, 'g'])
+        self.assertEqual(fut_g.result(), 6)
+        self.assertIsInstance(fut_h.exception(), Task.DependencyFailed)
+        self.assertEqual(len(failures), 2)
+
+    def test_future_lazily(self):
+        ts = self.ts
+
+        @ts.register_task
+        def f(*, n):
+            return n
+
+        ts.start(n_worker=2)
+        handles = [f(n=n) for n in range(4)]
+        fut = handles[1].future
+        ts.wait()
+
+        # only the future which is asked for is created before the task is done
+        self.assertEqual(
+            [type(_._task._future).__name__ for _ in handles],
+            ['tuple', 'Future', 'tuple', 'tuple'],
+        )
+        self.assertEqual(fut.result(), 1)
+        self.assertEqual([_.result() for _ in handles], [0, 1, 2, 3])
+
+    def test_process(self):
+        ts = self.ts
+
+        f = ts.register_task(_pid_square, FuncTaskFactory=ProcessFuncTask)
+
+        @ts.register_task
+        def g(*, x):
+            return f(x=x)
+
+        ts.start(n_worker=2, n_process=2)
+        futs = [g(x=x) for x in range(4)]
+        ts.wait()
+
+        res = [_.result() for _ in futs]
+        self.assertEqual([_[1] for _ in res], [0, 1, 4, 9])
+        self.assertNotIn(os.getpid(), [_[0] for _ in res])
+
+    def test_autoscale(self):
+        ts = self.ts
+        n_worker_max = 0
+
+        @ts.register_task
+        def f():
+            nonlocal n_worker_max
+            n_worker_max = max(n_worker_max, ts.n_worker())
+            time.sleep(0.01)
+
+        ts.start(
+            n_worker=1,
+            autoscaler=AutoScaler(min_worker=1, max_worker=4, step=2, interval=0.02),
+        )
+        for _ in range(100):
+            f()
+        ts.wait()
+        self.assertEqual(n_worker_max, 4)
+
+        time.sleep(0.2)
+        self.assertEqual(ts.n_worker(), 1)
+
+    def test_priority(self):
+        ts = self.ts
+        res = []
+
+        @ts.register_task(priority='A')
+        def low():
+            res.append('A')
+
+        @ts.register_task(priority='B')
+        def high():
+            res.append('B')
+
+        low()
+        high()
+        ts.start(n_worker=1)
+        ts.wait()
+        self.assertEqual(res, ['B', 'A'])
+
+    def test_fifo(self):
+        ts = self.ts
+        res = []
+
+        @ts.register_task(ttl=2)
+        def f(*, n):
+            res.append(n)
+
+        for n in range(20):
+            f(n=n)
+        ts.start(n_worker=1)
+        ts.wait()
+        self.assertEqual(res, list(range(20)))
+
+    def test_restart(self):
+        ts = self.ts
+        res = []
+
+        @ts.register_task
+        def f(*, n):
+            res.append(n)
+
+        for n in range(2):
+            with ts:
+                ts.start(n_worker=2)
+                f(n=n)
+                ts.wait()
+
+        self.assertEqual(res, [0, 1])
+
+    def test_journal(self):
+        ts = self.ts
+        res = []
+        fail = True
+
+        @ts.register_task(journal=True)
+        def f(*, n):
+            res.append(n)
+            if fail and n % 2 == 1:
+                raise ValueError()
+
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'journal.db')
+            for _ in range(2):
+                with Journal(filename, batch_size=2) as journal, ts:
+                    ts.start(n_worker=2, journal=journal)
+                    for n in range(6):
+                        f(n=n)
+                    ts.wait()
+                fail = False
+
+            with Journal(filename) as journal:
+                self.assertEqual(journal.unfinished(), [])
+
+        # only the failed tasks run again
+        self.assertEqual(sorted(res), [0, 1, 1, 2, 3, 3, 4, 5, 5])
+
+    def test_limit_max_inflight(self):
+        ts = self.ts
+        lock = threading.Lock()
+        n_running = {'a': 0, 'b': 0}
+        n_running_max = {'a': 0, 'b': 0}
+        res = []
+
+        @ts.register_task(key=lambda _: _['key'])
+        def f(*, key, n):
+            with lock:
+                n_running[key] += 1
+                n_running_max[key] = max(n_running_max[key], n_running[key])
+            time.sleep(0.02)
+            with lock:
+                n_running[key] -= 1
+                res.append(key)
+
+        ts.set_limit('a', max_inflight=1)
+        for n in range(10):
+            f(key='a', n=n)
+        for n in range(10):
+            f(key='b', n=n)
+        ts.start(n_worker=4)
+        ts.wait()
+
+        self.assertEqual(n_running_max, {'a': 1, 'b': 3})
+        # tasks of 'b' are not held up by the saturated 'a'
+        self.assertEqual(res[-5:], ['a'] * 5)
+
+    def test_limit_rate(self):
+        ts = self.ts
+        res = []
+
+        @ts.register_task(key='a')
+        def f():
+            res.append(None)
+
+        ts.set_limit('a', rate=50, burst=1)
+        for _ in range(6):
+            f()
+        t0 = time.monotonic()
+        ts.start(n_worker=3)
+        ts.wait()
+        t1 = time.monotonic()
+
+        self.assertEqual(len(res), 6)
+        # the first task takes the only token, and each of the other 5 waits
+        # for one more. Those waits are counted from after t0, so this is a
+        # bound rather than a timing. See TestTaskQueue for the token count
+        self.assertGreaterEqual(t1 - t0, 0.099)
+
+
+class TestTaskScheduler(_TestTaskScheduler, unittest.TestCase):
+    TaskSchedulerFactory = TaskScheduler
+
+
+class TestAsyncTaskScheduler(_TestTaskScheduler, unittest.TestCase):
+    TaskSchedulerFactory = AsyncTaskScheduler
+
+    def test_coroutine(self):
+        ts = self.ts
+        n_running = 0
+        n_running_max = 0
+
+        @ts.register_task
+        async def f(*, n):
+            nonlocal n_running, n_running_max
+            n_running += 1
+            n_running_max = max(n_running_max, n_running)
+            await asyncio.sleep(0.05)
+            n_running -= 1
+
+        ts.start(n_worker=100)
+        for n in range(100):
+            f(n=n)
+        self.assertEqual(ts.wait(), [])
+        self.assertEqual(n_running_max, 100)
+
+    def test_current_task(self):
+        ts = self.ts
+        res = []
+
+        @ts.register_task
+        async def f():
+            res.append(ts.current_task().kwargs)
+
+        @ts.register_task
+        def g(*, x):
+            res.append(ts.current_task().kwargs)
+            f()
+
+        ts.start(n_worker=2)
+        g(x=1)
+        ts.wait()
+        self.assertEqual(res, [{'x': 1}, {}])
+
+
+class TestTask(unittest.TestCase):
+    def test_priority(self):
+        priorities = ['A', 'AA', 'AB', 'B', 'BA', 'Z', 'ZZZZZZ']
+        tasks = [FuncTask(priority=_, func=print) for _ in priorities]
+        self.assertEqual([_.priority for _ in sorted(tasks)], priorities[::-1])
+
+    def test_str(self):
+        task = FuncTask(priority='B', ttl=2, func=print, kwargs={'n': 1})
+        self.assertEqual(str(task), 'priority=B, ttl=2. print: n=1')
+        self.assertRaises(AttributeError, setattr, task, 'foo', 1)
+
+
+class TestTaskQueue(unittest.TestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=50, burst=2, now=0)
+        self.assertEqual(bucket.delay(0), 0)
+        bucket.take(0)
+        bucket.take(0)
+        self.assertAlmostEqual(bucket.delay(0), 0.02)
+        self.assertAlmostEqual(bucket.delay(0.01), 0.01)
+        self.assertEqual(bucket.delay(0.02), 0)
+        # no more than @burst tokens are kept
+        bucket.take(10)
+        bucket.take(10)
+        self.assertAlmostEqual(bucket.delay(10), 0.02)
+
+    def test_limit_rate(self):
+        q = TaskQueue()
+        q.set_limit('a', rate=50, burst=1, now=0)
+        for _ in range(3):
+            q.put(FuncTask(key='a', func=print))
+        q.put(FuncTask(key='b', func=print))
+
+        now = 0
+        keys = []
+        while len(q) > 0:
+            task, timeout = q.pop(now)
+            if task is None:
+                now += timeout
+            else:
+                keys.append((task.key, round(now, 6)))
+                q.release(task)
+
+        # 'b' is not held up by 'a'
+        self.assertEqual(keys, [('a', 0), ('b', 0), ('a', 0.02), ('a', 0.04)])
+
+
+class _Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class _HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        self.response = _Response(status_code, headers)
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def test_classify(self):
+        p = RetryPolicy(fail_on=(KeyError,), abort_on=(PermissionError,))
+        self.assertEqual(p.classify(ValueError()), RetryPolicy.RETRY)
+        self.assertEqual(p.classify(KeyError()), RetryPolicy.FAIL)
+        self.assertEqual(p.classify(PermissionError()), RetryPolicy.ABORT)
+        self.assertEqual(p.classify(_HTTPError(429)), RetryPolicy.RETRY)
+        self.assertEqual(p.classify(_HTTPError(404)), RetryPolicy.FAIL)
+
+        p = RetryPolicy(retry_on=(OSError,))
+        self.assertEqual(p.classify(ConnectionError()), RetryPolicy.RETRY)
+        self.assertEqual(p.classify(ValueError()), RetryPolicy.FAIL)
+
+    def test_delay(self):
+        p = RetryPolicy()
+        self.assertEqual(p.delay(ValueError(), 1), 1)
+        self.assertEqual(p.delay(_HTTPError(429, {'Retry-After': '5'}), 1), 5)
+        self.assertEqual(p.delay(_HTTPError(429, {'Retry-After': '0'}), 1), 1)
+        date = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        self.assertEqual(p.delay(_HTTPError(503, {'Retry-After': date}), 1), 1)
+
+
+class TestAutoScaler(unittest.TestCase):
+    def test_decide(self):
+        a = AutoScaler(min_worker=2, max_worker=10, cooldown=1)
+
+        def _decide(n_worker, n_queued, n_done=10, latency=0.1, exc=None):
+            for _ in range(n_done):
+                a.record(latency=latency, exc=exc)
+            return a.decide(n_worker=n_worker, n_queued=n_queued, now=a._t0 + 1)
+
+        # scale up while tasks are queued
+        self.assertEqual(_decide(4, 100), 5)
+        self.assertEqual(_decide(5, 100, n_done=12), 6)
+        # the throughput dropped after the last increase: go back and hold
+        self.assertEqual(_decide(6, 100, n_done=6), 5)
+        self.assertEqual(_decide(5, 100), 5)
+        # throttled: halve
+        self.assertEqual(_decide(5, 100, exc=_HTTPError(429)), 2)
+        self.assertEqual(_decide(2, 100), 2)
+        # not throttled: a 404 counts as an error only
+        self.assertEqual(_decide(2, 100, n_done=1, exc=_HTTPError(404)), 2)
+        # idle workers are retired
+        self.assertEqual(_decide(8, 0, n_done=1), 7)
+        self.assertEqual(_decide(3, 0, n_done=30), 3)
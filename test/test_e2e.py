@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from .MockCoursera import MockCoursera
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_cookies_file(filename, uid):
+    '''a cookies file of the user @uid of a MockCoursera'''
+
+    with open(filename, 'w', encoding='UTF-8') as ofs:
+        ofs.write('# Netscape HTTP Cookie File\n')
+        ofs.write(
+            '127.0.0.1\tFALSE\t/\tFALSE\t4102444800\tCOURSERA_userId\tg:%s\n' % uid
+        )
+
+
+class TestE2E(unittest.TestCase):
+    '''dl_coursera_run.py against a MockCoursera, in another process'''
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.dirname = self._tmpdir.name
+
+        self.cookies_files = []
+        for uid in ['1', '2']:
+            filename = os.path.join(self.dirname, 'cookies-%s.txt' % uid)
+            write_cookies_file(filename, uid)
+            self.cookies_files.append(filename)
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _run(self, mock, *args, n_accounts=1):
+        outdir = os.path.join(self.dirname, 'out')
+        env = dict(
+            os.environ,
+            DL_COURSERA_URL_ROOT=mock.url,
+            XDG_CACHE_HOME=os.path.join(self.dirname, 'cache'),
+        )
+        p = subprocess.run(
+            [
+                sys.executable,
+                os.path.join(_ROOT, 'dl_coursera_run.py'),
+                *[
+                    _
+                    for cookies_file in self.cookies_files[:n_accounts]
+                    for _ in ['--cookies', cookies_file]
+                ],
+                '--outdir',
+                outdir,
+                *args,
+            ],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=300,
+        )
+        output = p.stdout.decode('UTF-8', errors='replace')
+        self.assertEqual(p.returncode, 0, output)
+        self.assertIn('Done :-)', output)
+        return outdir
+
+    def _check_downloaded(self, outdir, slug, file_size):
+        dir_cache = os.path.join(outdir, slug, '.cache')
+        with open(os.path.join(dir_cache, 'download.dl_tasks_failed.json')) as ifs:
+            self.assertEqual(json.load(ifs), [])
+
+        with open(os.path.join(dir_cache, 'gather.jsonl'), encoding='UTF-8') as ifs:
+            dl_tasks = [json.loads(_) for _ in ifs]
+        self.assertGreater(len(dl_tasks), 0)
+        for _ in dl_tasks:
+            self.assertEqual(os.path.getsize(_['filename']), file_size)
+
+    def test_course(self):
+        with MockCoursera(n_modules=1, n_lessons=2, n_items=2) as mock:
+            outdir = self._run(mock, 'c')
+        self._check_downloaded(outdir, 'c', 1024)
+
+        # 2 lessons of a lecture and a supplement
+        self.assertEqual(mock.n_requests['onDemandLectureVideos.v1'], 2)
+        self.assertEqual(mock.n_requests['onDemandSupplements.v1'], 2)
+
+        dirname = os.path.join(outdir, 'c', '01@module-0', '02@lesson-0-1')
+        self.assertEqual(
+            sorted(os.listdir(os.path.join(dirname, '02@item-0-1-1'))),
+            ['01@item-0-1-1.html', 'i0-1-1-a0.pdf', 'i0-1-1-a1.pdf', 'i0-1-1.png'],
+        )
+
+        # links to references are resolved to the gathered files
+        filename = os.path.join(dirname, '02@item-0-1-1', '01@item-0-1-1.html')
+        with open(filename, encoding='UTF-8') as ifs:
+            html = ifs.read()
+        self.assertIn('href="../../../references/01@reference-r0.html"', html)
+
+    def test_course_async(self):
+        with MockCoursera(n_modules=1, n_lessons=2, n_items=2) as mock:
+            outdir = self._run(mock, '--scheduler', 'async', 'c')
+        self._check_downloaded(outdir, 'c', 1024)
+
+    def test_spec_flaky(self):
+        with MockCoursera(
+            n_courses=2,
+            n_modules=1,
+            n_lessons=1,
+            n_items=2,
+            file_size=4096,
+            error_rate=0.3,
+            rate=50,
+        ) as mock:
+            outdir = self._run(
+                mock, '--spec', 's', '--min-worker', '2', '--max-worker', '4'
+            )
+        self._check_downloaded(outdir, 's', 4096)
+
+    def test_accounts(self):
+        # each account is enrolled in one course of the specialization
+        with MockCoursera(
+            n_courses=2,
+            n_modules=1,
+            n_lessons=1,
+            n_items=2,
+            enrolled={'1': ['s-0'], '2': ['s-1']},
+        ) as mock:
+            outdir = self._run(mock, '--spec', 's', n_accounts=2)
+        self._check_downloaded(outdir, 's', 1024)
+
+        self.assertGreater(mock.n_requests_by_user['1'], 0)
+        self.assertGreater(mock.n_requests_by_user['2'], 0)
@@ -0,0 +1,61 @@
+import glob
+import os
+import unittest
+
+from dl_coursera.define import Asset
+from dl_coursera.markup import CML
+
+_DIR_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cml')
+
+
+def _to_html(doc):
+    cml = CML(doc)
+    assets, assetIDs, refids = cml.get_resources()
+    assets = assets + [
+        Asset(id_=_, url='https://x/' + _, name='asset %s.pdf' % _) for _ in assetIDs
+    ]
+    return cml.to_html(assets=assets)
+
+
+class TestCML(unittest.TestCase):
+    def test_to_html(self):
+        # the .html files were rendered by the former bs4-based converter
+        filenames = sorted(glob.glob(os.path.join(_DIR_DATA, '*.xml')))
+        self.assertGreater(len(filenames), 0)
+
+        for filename in filenames:
+            with self.subTest(filename=os.path.basename(filename)):
+                with open(filename, encoding='UTF-8') as ifs:
+                    doc = ifs.read()
+                with open(filename[:-4] + '.html', encoding='UTF-8', newline='') as ifs:
+                    html = ifs.read()
+                self.assertEqual(_to_html(doc), html)
+
+    def test_get_resources(self):
+        with open(os.path.join(_DIR_DATA, 'resources.xml'), encoding='UTF-8') as ifs:
+            cml = CML(ifs.read())
+        assets, assetIDs, refids = cml.get_resources()
+        self.assertEqual(assetIDs, ['IMG1', 'PDF1'])
+        self.assertEqual(refids, ['Ab3-x', 'r2'])
+
+    def test_empty(self):
+        self.assertEqual(CML('').to_html(assets=[]), '')
+        self.assertEqual(CML('').get_resources(), ([], [], []))
+
+    def test_resolve_ref(self):
+        with open(os.path.join(_DIR_DATA, 'resources.xml'), encoding='UTF-8') as ifs:
+            cml = CML(ifs.read())
+        assets, assetIDs, refids = cml.get_resources()
+        assets = assets + [
+            Asset(id_=_, url='https://x/' + _, name=_ + '.pdf') for _ in assetIDs
+        ]
+
+        html = cml.to_html(
+            assets=assets, resolve_ref={'Ab3-x': '../references/01@ab3.html'}.get
+        )
+        self.assertIn('<a href="../references/01@ab3.html" refid="Ab3-x">', html)
+        # not resolved
+        self.assertIn(
+            '<a href="https://www.coursera.org/learn/other/resources/r2" refid="r2">',
+            html,
+        )
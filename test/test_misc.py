@@ -7,3 +7,32 @@ class TestMisc(unittest.TestCase):
 
         ver = get_latest_app_version()
         self.assertRegex(ver, r'\d+\.\d+\.\d+')
+
+    def test_write_atomically(self):
+        import os
+        import tempfile
+
+        from dl_coursera.lib.misc import atomic_filename, write_atomically
+
+        with tempfile.TemporaryDirectory() as d:
+            filename = os.path.join(d, 'a')
+            write_atomically(filename, b'1')
+            with self.assertRaises(RuntimeError):
+                with atomic_filename(filename) as tmp:
+                    with open(tmp, 'wb') as ofs:
+                        ofs.write(b'2')
+                    raise RuntimeError()
+            with open(filename, 'rb') as ifs:
+                self.assertEqual(ifs.read(), b'1')
+            self.assertEqual(os.listdir(d), ['a'])
+
+    def test_lru(self):
+        from dl_coursera.lib.misc import LRU
+
+        lru = LRU(2)
+        lru.put('a', 1)
+        lru.put('b', 2)
+        self.assertEqual(lru.get('a'), 1)
+        lru.put('c', 3)
+        self.assertEqual(list(lru), ['a', 'c'])
+        self.assertIsNone(lru.get('b'))
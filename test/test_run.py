@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+import unittest
+
+from dl_coursera.CrawlDB import CrawlDB
+from dl_coursera_run import _file_db_crawl, crawl, gather_dl_tasks, load_manifest
+
+from .test_CrawlDB import _spec
+from .test_RenderCache import _course
+
+
+class TestRun(unittest.TestCase):
+    def test_load_manifest(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'manifest.txt')
+            with open(filename, 'w', encoding='UTF-8') as ofs:
+                ofs.write('# nightly\nspec: data-science\n\nc1\n  c2  \nc1\n')
+
+            self.assertEqual(
+                load_manifest(filename),
+                [('data-science', True), ('c1', False), ('c2', False)],
+            )
+
+    def test_gather_legacy(self):
+        with tempfile.TemporaryDirectory() as outdir:
+            dir_cache = os.path.join(outdir, 'c', '.cache')
+            os.makedirs(dir_cache)
+            # as kept by a former version
+            with open(os.path.join(dir_cache, 'gather.json'), 'w') as ofs:
+                json.dump([{'url': 'https://x/old', 'filename': 'old'}], ofs, indent=4)
+
+            dl_tasks = gather_dl_tasks(outdir, _course('c', 'text'))
+            self.assertEqual([_['url'] for _ in dl_tasks], ['https://x/a.pdf'] * 2)
+            self.assertFalse(os.path.exists(os.path.join(dir_cache, 'gather.json')))
+
+            # from gather.jsonl
+            self.assertEqual(gather_dl_tasks(outdir, _course('c', 'text')), dl_tasks)
+
+    def test_gather_kept(self):
+        spec = _spec()
+        with tempfile.TemporaryDirectory() as outdir:
+            os.makedirs(os.path.dirname(_file_db_crawl(outdir, 's')))
+            CrawlDB(_file_db_crawl(outdir, 's')).save(spec)
+
+            # loaded lazily, as it is not crawled again
+            (soc,) = crawl(None, [('s', True)], outdir, sess=None, dir_cache=None)
+            self.assertNotIsInstance(soc['courses'], list)
+
+            dl_tasks = gather_dl_tasks(outdir, soc)
+            self.assertGreater(len(dl_tasks), 0)
+            os.remove(os.path.join(outdir, 's', '.cache', 'gather.jsonl'))
+            self.assertEqual(gather_dl_tasks(outdir, spec), dl_tasks)